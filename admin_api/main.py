@@ -6,14 +6,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Dict, Optional, Any
 from datetime import datetime
+import asyncio
 import uuid
 import logging
 
 from shared.auth.google_auth import google_auth_service
+from shared.database import stats
 from shared.database.dynamodb import db_service
+from shared.database.projection import parse_fields, with_fields, sparse
+from shared.database.metrics import track_route
+from shared.gateway import gateway_invalidator
+from shared import singleflight
 from shared.models.base import (
     BaseUser, Shop, Product, Order, Review, 
-    UserRole, OrderStatus, ShopStatus
+    UserRole, OrderStatus, ShopStatus, PROFILE_FIELDS
 )
 
 # Configure logging
@@ -24,7 +30,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Admin API",
     description="Backend API for Admin App",
-    version="1.0.0"
+    version="1.0.0",
+    dependencies=[Depends(track_route)]
 )
 
 # CORS middleware
@@ -36,6 +43,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_change_feed():
+    """Start delivering table changes to caches and other derived views"""
+    await db_service.change_feed.start()
+    await gateway_invalidator.start()
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await db_service.change_feed.stop()
+    await gateway_invalidator.stop()
+
 # Security
 security = HTTPBearer()
 
@@ -103,8 +121,9 @@ async def google_auth(auth_request: GoogleAuthRequest):
             await db_service.update_user(user["user_id"], {"role": UserRole.ADMIN})
             user["role"] = UserRole.ADMIN
         
+        # The token carries the stored role, not the default one it was first minted with
         return AuthResponse(
-            token=auth_result["token"],
+            token=google_auth_service.create_jwt_token(user),
             user=user
         )
     except Exception as e:
@@ -116,45 +135,29 @@ async def google_auth(auth_request: GoogleAuthRequest):
 async def get_dashboard(current_admin: Dict = Depends(get_current_admin)):
     """Get admin dashboard overview"""
     try:
-        # Get all users
-        all_users = await db_service.get_all_users()
-        
-        # Get all shops
-        all_shops = await db_service.get_all_shops()
-        
-        # Get all orders
-        all_orders = await db_service.get_all_orders()
-        
-        # Get all reviews
-        all_reviews = await db_service.get_all_reviews()
-        
-        # Calculate statistics
-        total_users = len(all_users)
-        total_shops = len(all_shops)
-        total_orders = len(all_orders)
-        total_reviews = len(all_reviews)
-        
-        pending_shop_approvals = len([s for s in all_shops if s["status"] == ShopStatus.PENDING_APPROVAL])
-        pending_orders = len([o for o in all_orders if o["status"] == OrderStatus.PENDING])
-        pending_reviews = len([r for r in all_reviews if not r["is_approved"]])
-        
-        total_revenue = sum(o["total_amount"] for o in all_orders if o["status"] == OrderStatus.DELIVERED)
+        # Counters are maintained on write; activity is one small page per table
+        counters, orders, reviews, shops = await asyncio.gather(
+            db_service.get_stats(stats.GLOBAL),
+            db_service.get_all_orders_page(limit=10),
+            db_service.get_all_reviews_page(limit=10),
+            db_service.get_all_shops_page(limit=10)
+        )
         
         return {
             "statistics": {
-                "total_users": total_users,
-                "total_shops": total_shops,
-                "total_orders": total_orders,
-                "total_reviews": total_reviews,
-                "pending_shop_approvals": pending_shop_approvals,
-                "pending_orders": pending_orders,
-                "pending_reviews": pending_reviews,
-                "total_revenue": total_revenue
+                "total_users": counters.get("users", 0),
+                "total_shops": counters.get("shops", 0),
+                "total_orders": counters.get("orders", 0),
+                "total_reviews": counters.get("reviews", 0),
+                "pending_shop_approvals": counters.get(f"shops_{ShopStatus.PENDING_APPROVAL.value}", 0),
+                "pending_orders": counters.get(f"orders_{OrderStatus.PENDING.value}", 0),
+                "pending_reviews": counters.get("reviews_pending", 0),
+                "total_revenue": counters.get("revenue", 0)
             },
             "recent_activity": {
-                "recent_orders": all_orders[-10:],  # Last 10 orders
-                "recent_reviews": all_reviews[-10:],  # Last 10 reviews
-                "recent_shops": all_shops[-10:]  # Last 10 shops
+                "recent_orders": orders["items"],
+                "recent_reviews": reviews["items"],
+                "recent_shops": shops["items"]
             }
         }
     except Exception as e:
@@ -166,8 +169,7 @@ async def get_dashboard(current_admin: Dict = Depends(get_current_admin)):
 async def get_pending_shops(current_admin: Dict = Depends(get_current_admin)):
     """Get shops pending approval"""
     try:
-        all_shops = await db_service.get_all_shops()
-        pending_shops = [s for s in all_shops if s["status"] == ShopStatus.PENDING_APPROVAL]
+        pending_shops = await db_service.get_shops_by_status(ShopStatus.PENDING_APPROVAL.value)
         return {"shops": pending_shops}
     except Exception as e:
         logger.error(f"Error fetching pending shops: {str(e)}")
@@ -205,27 +207,36 @@ async def approve_shop(
 @app.get("/shops")
 async def get_all_shops(
     status: Optional[ShopStatus] = None,
+    fields: Optional[str] = None,
     current_admin: Dict = Depends(get_current_admin)
 ):
     """Get all shops with optional status filter"""
     try:
-        all_shops = await db_service.get_all_shops()
-        
+        attributes = parse_fields(fields, Shop)
         if status:
-            all_shops = [s for s in all_shops if s["status"] == status]
+            all_shops = await db_service.get_shops_by_status(status.value, attributes=attributes)
+        else:
+            all_shops = await db_service.get_all_shops(attributes)
         
         return {"shops": all_shops}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching shops: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch shops")
 
 # User management routes
 @app.get("/users")
-async def get_all_users(current_admin: Dict = Depends(get_current_admin)):
+async def get_all_users(
+    fields: Optional[str] = None,
+    current_admin: Dict = Depends(get_current_admin)
+):
     """Get all users"""
     try:
-        all_users = await db_service.get_all_users()
+        all_users = await db_service.get_all_users(parse_fields(fields, BaseUser))
         return {"users": all_users}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch users")
@@ -297,16 +308,20 @@ async def update_user_status(
 @app.get("/orders")
 async def get_all_orders(
     status: Optional[OrderStatus] = None,
+    fields: Optional[str] = None,
     current_admin: Dict = Depends(get_current_admin)
 ):
     """Get all orders with optional status filter"""
     try:
-        all_orders = await db_service.get_all_orders()
+        attributes = parse_fields(fields, Order)
+        all_orders = await db_service.get_all_orders(with_fields(attributes, "status"))
         
         if status:
             all_orders = [o for o in all_orders if o["status"] == status]
         
-        return {"orders": all_orders}
+        return {"orders": sparse(all_orders, attributes)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
@@ -359,16 +374,20 @@ async def update_order_status(
 @app.get("/reviews")
 async def get_all_reviews(
     is_approved: Optional[bool] = None,
+    fields: Optional[str] = None,
     current_admin: Dict = Depends(get_current_admin)
 ):
     """Get all reviews with optional approval filter"""
     try:
-        all_reviews = await db_service.get_all_reviews()
+        attributes = parse_fields(fields, Review)
+        all_reviews = await db_service.get_all_reviews(with_fields(attributes, "is_approved"))
         
         if is_approved is not None:
             all_reviews = [r for r in all_reviews if r["is_approved"] == is_approved]
         
-        return {"reviews": all_reviews}
+        return {"reviews": sparse(all_reviews, attributes)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching reviews: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch reviews")
@@ -396,17 +415,12 @@ async def moderate_review(
 ):
     """Moderate a review (approve/reject)"""
     try:
-        review = await db_service.get_review(review_id)
+        review = await db_service.moderate_review(
+            review_id, moderation_data.is_approved, moderation_data.admin_notes, current_admin["user_id"]
+        )
         if not review:
             raise HTTPException(status_code=404, detail="Review not found")
         
-        # This would need to be implemented in the database service
-        # For now, return the review with updated moderation status
-        review["is_approved"] = moderation_data.is_approved
-        review["admin_notes"] = moderation_data.admin_notes
-        review["moderated_at"] = datetime.utcnow()
-        review["moderated_by"] = current_admin["user_id"]
-        
         return review
     except HTTPException:
         raise
@@ -427,6 +441,12 @@ async def update_profile(
 ):
     """Update admin profile"""
     try:
+        # Role, status, identity and timestamps are managed by the server
+        rejected = sorted(set(updates) - PROFILE_FIELDS)
+        if rejected:
+            raise HTTPException(status_code=400, detail=f"Cannot update {', '.join(rejected)}")
+        updates = {**updates, "updated_at": datetime.utcnow()}
+        
         updated_user = await db_service.update_user(current_admin["user_id"], updates)
         if not updated_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -438,6 +458,26 @@ async def update_profile(
         logger.error(f"Error updating profile: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
+# Health check, polled by the API gateway
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "service": "admin"}
+
+# Metrics
+@app.get("/metrics")
+async def get_metrics(current_admin: Dict = Depends(get_current_admin)):
+    """DynamoDB call, cache, throttling and change feed aggregates for this process (admins only)"""
+    return {
+        "dynamodb": db_service.call_stats(),
+        "caches": db_service.cache_stats(),
+        "throttling": db_service.throttle_stats(),
+        "change_feed": db_service.change_feed.stats(),
+        "write_buffers": db_service.write_buffer_stats(),
+        "gateway_cache": gateway_invalidator.stats(),
+        "coalescing": singleflight.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003) 
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Response cache for public GET routes
+
+Anonymous reads of the routes listed in CACHED_ROUTES (see main.py) are
+answered from memory for the route's TTL. Entries are keyed on service,
+path, query string and Accept-Encoding, and hold the body exactly as the
+backend encoded it with a strong ETag, so a client revalidating with
+If-None-Match gets a bodyless 304 whether the entry is fresh or refilled.
+
+Eviction is least-recently-used, bounded by entry count and total body
+bytes. Backends drop entries through POST /cache/invalidate when the data
+behind them changes (see shared/gateway.py); entries still being filled
+when an invalidation arrives are not stored.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class CachedResponse:
+    __slots__ = ("status_code", "headers", "body", "etag", "stored_at", "expires_at")
+
+    def __init__(self, status_code: int, headers: List[Tuple[bytes, bytes]], body: bytes,
+                 etag: bytes, ttl: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+
+    def age(self) -> int:
+        return int(time.monotonic() - self.stored_at)
+
+
+def strong_etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode("ascii") + b'"'
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: bytes) -> bool:
+    """Weak comparison, as If-None-Match uses (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = _opaque_tag(etag.decode("latin-1"))
+    return any(_opaque_tag(tag) == wanted for tag in if_none_match.split(","))
+
+
+def cacheable(status_code: int, headers: Dict[str, str]) -> bool:
+    """Whether a backend response may be shared between clients"""
+    if status_code != 200 or "set-cookie" in headers:
+        return False
+    directives = {d.strip().split("=")[0] for d in headers.get("cache-control", "").lower().split(",")}
+    if directives & {"no-store", "private", "no-cache"}:
+        return False
+    return headers.get("vary", "").strip() != "*"
+
+
+class ResponseCache:
+    """LRU of whole responses, bounded by entries and body bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, max_body: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Larger bodies are passed on but not kept
+        self.max_body = max_body
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._by_path: Dict[str, Set[Hashable]] = {}
+        self._bytes = 0
+        # Bumped by every invalidation; fills that started earlier are discarded
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(service: str, path: str, query: str, accept_encoding: str) -> Tuple[str, str, str, str]:
+        return (service, path, query, accept_encoding)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: Hashable, entry: CachedResponse, generation: int) -> bool:
+        """Store an entry filled since ``generation``; False if it was not kept"""
+        if generation != self.generation or len(entry.body) > self.max_body or self.max_entries <= 0:
+            return False
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._by_path.setdefault(key[1], set()).add(key)
+        self._bytes += len(entry.body)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return True
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+        keys = self._by_path[key[1]]
+        keys.discard(key)
+        if not keys:
+            del self._by_path[key[1]]
+
+    def invalidate(self, paths: Iterable[str] = (), prefixes: Iterable[str] = ()) -> int:
+        """Drop every entry of the given paths (any query) or under the given prefixes"""
+        self.generation += 1
+        keys = set()
+        for path in paths:
+            keys.update(self._by_path.get(path, ()))
+        prefixes = tuple(prefixes)
+        if prefixes:
+            keys.update(key for key in self._entries if key[1].startswith(prefixes))
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
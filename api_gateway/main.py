@@ -1,12 +1,26 @@
 """
 API Gateway - Routes requests to appropriate backend services
 """
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Header
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+import hmac
 import httpx
 import logging
-from typing import Dict, Any
+import os
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+
+from api_gateway.cache import CachedResponse, ResponseCache, cacheable, etag_matches, strong_etag
+from api_gateway.routing import Route, RouteTable, RouteNotFound
+from api_gateway.replicas import NoReplicaAvailable
+from api_gateway.upstream import UpstreamClients, replica_urls
+from shared import singleflight
+from shared.auth.google_auth import google_auth_service
+from shared.models.base import UserRole
+from shared.singleflight import SingleFlight
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,94 +42,187 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Service URLs
+# Service replica URLs; {SERVICE}_API_URLS lists several, comma-separated
 SERVICES = {
-    "customer": "http://localhost:8001",
-    "merchant": "http://localhost:8002", 
-    "admin": "http://localhost:8003"
+    "customer": replica_urls("CUSTOMER_API_URLS", "http://localhost:8001"),
+    "merchant": replica_urls("MERCHANT_API_URLS", "http://localhost:8002"),
+    "admin": replica_urls("ADMIN_API_URLS", "http://localhost:8003")
 }
 
-# Route patterns
-ROUTE_PATTERNS = {
+# Routes served by each backend. Listing order decides which app answers a
+# route several apps serve when the request carries no app hint (see routing.py)
+ROUTES = {
     "customer": [
-        "/auth/google",
-        "/shops",
-        "/products", 
-        "/orders",
-        "/reviews",
-        "/addresses",
-        "/profile"
+        "POST /auth/google",
+        "GET /shops",
+        "GET /shops/{shop_id}",
+        "GET /shops/{shop_id}/products",
+        "GET /shops/{shop_id}/reviews",
+        "GET /search/shops",
+        "GET /search/products",
+        "GET /products/{product_id}",
+        "GET /products/{product_id}/reviews",
+        "GET /addresses",
+        "POST /addresses",
+        "PUT /addresses/{address_id}/default",
+        "DELETE /addresses/{address_id}",
+        "GET /orders",
+        "POST /orders",
+        "GET /orders/{order_id}",
+        "POST /reviews",
+        "GET /profile",
+        "PUT /profile"
     ],
     "merchant": [
-        "/auth/google",
-        "/dashboard",
-        "/shops",
-        "/products",
-        "/orders", 
-        "/profile"
+        "POST /auth/google",
+        "GET /dashboard",
+        "GET /shops",
+        "POST /shops",
+        "GET /shops/{shop_id}",
+        "PUT /shops/{shop_id}",
+        "PUT /shops/{shop_id}/status",
+        "GET /shops/{shop_id}/products",
+        "POST /shops/{shop_id}/products",
+        "GET /shops/{shop_id}/orders",
+        "GET /products/{product_id}",
+        "PUT /products/{product_id}",
+        "PUT /orders/{order_id}/status",
+        "GET /profile",
+        "PUT /profile"
     ],
     "admin": [
-        "/auth/google",
-        "/dashboard",
-        "/shops",
-        "/users",
-        "/orders",
-        "/reviews",
-        "/profile"
+        "POST /auth/google",
+        "GET /dashboard",
+        "GET /shops",
+        "GET /shops/pending",
+        "PUT /shops/{shop_id}/approval",
+        "GET /users",
+        "GET /users/{user_id}",
+        "PUT /users/{user_id}/role",
+        "PUT /users/{user_id}/status",
+        "GET /orders",
+        "GET /orders/{order_id}",
+        "PUT /orders/{order_id}/status",
+        "GET /reviews",
+        "GET /reviews/{review_id}",
+        "PUT /reviews/{review_id}/moderation",
+        "GET /profile",
+        "PUT /profile"
     ]
 }
 
-def determine_service(path: str) -> str:
-    """Determine which service should handle the request based on path"""
-    # Check exact matches first
-    for service, patterns in ROUTE_PATTERNS.items():
-        for pattern in patterns:
-            if path.startswith(pattern):
-                return service
-    
-    # Default to customer service for unknown routes
-    return "customer"
+# Compiled once; unknown routes go to the customer service
+route_table = RouteTable(ROUTES, default="customer")
 
-@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
-async def proxy_request(request: Request, path: str):
-    """Proxy request to appropriate backend service"""
+# Operator endpoints of the backends, never proxied (not even under /api/{app})
+INTERNAL_PATHS = frozenset({"/metrics"})
+
+# Anonymous GETs answered from the gateway's response cache, with their TTL in seconds
+CACHED_ROUTES = {
+    ("customer", "GET /shops"): 30,
+    ("customer", "GET /shops/{shop_id}"): 60,
+    ("customer", "GET /shops/{shop_id}/products"): 30,
+    ("customer", "GET /products/{product_id}"): 60
+}
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("GATEWAY_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    max_body=int(os.getenv("GATEWAY_CACHE_MAX_BODY_KB", "512")) * 1024
+)
+# Identical cache misses in flight at once are sent upstream only once
+upstream_flights = SingleFlight("gateway")
+
+# Shared secret backends send with invalidations. Without one, invalidations are
+# refused unless GATEWAY_CACHE_ALLOW_ANONYMOUS explicitly opens them (development)
+CACHE_TOKEN = os.getenv("GATEWAY_CACHE_TOKEN")
+ALLOW_ANONYMOUS_INVALIDATION = os.getenv("GATEWAY_CACHE_ALLOW_ANONYMOUS", "false").lower() == "true"
+
+# Hop-by-hop headers (RFC 7230 6.1) describe one connection and are never forwarded;
+# Host is rewritten by the upstream client
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade"
+})
+
+# Long-lived connection pools to the backends
+upstream = UpstreamClients(SERVICES)
+
+@app.on_event("startup")
+async def open_upstream_pools():
+    """Open one keep-alive connection pool per backend service"""
+    await upstream.start()
+
+@app.on_event("shutdown")
+async def close_upstream_pools():
+    await upstream.stop()
+
+def end_to_end_headers(headers: List[Tuple[bytes, bytes]], *extra: bytes) -> List[Tuple[bytes, bytes]]:
+    """Raw headers minus hop-by-hop ones, including any the Connection header names"""
+    dropped = {name.encode("latin-1") for name in HOP_BY_HOP_HEADERS}
+    dropped.update(extra)
+    for name, value in headers:
+        if name.lower() == b"connection":
+            dropped.update(token.strip().lower() for token in value.split(b","))
+    return [(name, value) for name, value in headers if name.lower() not in dropped]
+
+async def relay(response: httpx.Response, service: str, path: str) -> AsyncIterator[bytes]:
+    """Pass an upstream body through as it arrives, still encoded as the backend sent it"""
     try:
-        # Determine target service
-        service = determine_service(f"/{path}")
-        target_url = f"{SERVICES[service]}/{path}"
-        
-        logger.info(f"Routing {request.method} {path} to {service} service")
-        
-        # Get request body
-        body = None
-        if request.method in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
-        
-        # Get headers
-        headers = dict(request.headers)
-        # Remove host header to avoid conflicts
-        headers.pop("host", None)
-        
-        # Forward request
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                params=request.query_params,
-                headers=headers,
-                content=body,
-                timeout=30.0
-            )
-        
-        # Return response
+        async for chunk in response.aiter_raw():
+            yield chunk
+    except httpx.HTTPError as e:
+        # Headers are already sent, so the client sees a truncated body
+        logger.error(f"Upstream {service} failed mid-response on {path}: {str(e)}")
+        await response.aclose()
+        raise
+
+def cache_ttl(request: Request, route: Route) -> Optional[float]:
+    """TTL when the response to a request may come from the cache"""
+    if request.method != "GET" or "authorization" in request.headers:
+        return None
+    return CACHED_ROUTES.get((route.service, route.route))
+
+def cached_response(entry: CachedResponse, request: Request, state: bytes) -> Response:
+    """A cached entry as a 200, or a 304 when the client already holds it"""
+    headers = entry.headers + [
+        (b"etag", entry.etag),
+        (b"age", str(entry.age()).encode("ascii")),
+        (b"x-cache", state)
+    ]
+    if entry.status_code == 200 and etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response_cache.not_modified += 1
+        response = Response(status_code=304)
+        response.raw_headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
         return response
-        
-    except httpx.RequestError as e:
-        logger.error(f"Request error: {str(e)}")
-        raise HTTPException(status_code=503, detail="Service unavailable")
-    except Exception as e:
-        logger.error(f"Gateway error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    response = Response(content=entry.body, status_code=entry.status_code)
+    response.raw_headers = headers
+    return response
+
+async def fetch_entry(service: str, path: str, params: Any, headers: List[Tuple[bytes, bytes]],
+                      key: Tuple, ttl: float) -> CachedResponse:
+    """Fetch a cached route's response whole, storing it when the backend allows"""
+    generation = response_cache.generation
+    response = await upstream.stream(service, "GET", path, params=params, headers=headers)
+    try:
+        body = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await response.aclose()
+    
+    headers = end_to_end_headers(response.headers.raw, b"date", b"server", b"etag", b"age")
+    shared = cacheable(response.status_code, response.headers)
+    if shared and "cache-control" not in response.headers:
+        # Clients may keep the body but must revalidate it, which costs them a 304
+        headers.append((b"cache-control", b"no-cache"))
+    entry = CachedResponse(response.status_code, headers, body,
+                           response.headers.get("etag", "").encode("latin-1") or strong_etag(body), ttl)
+    if shared:
+        response_cache.set(key, entry, generation)
+    return entry
+
+class CacheInvalidation(BaseModel):
+    paths: List[str] = []
+    prefixes: List[str] = []
 
 @app.get("/")
 async def root():
@@ -123,9 +230,9 @@ async def root():
     return {
         "message": "API Gateway for Three-App Architecture",
         "services": {
-            "customer": f"{SERVICES['customer']}/docs",
-            "merchant": f"{SERVICES['merchant']}/docs", 
-            "admin": f"{SERVICES['admin']}/docs"
+            "customer": f"{SERVICES['customer'][0]}/docs",
+            "merchant": f"{SERVICES['merchant'][0]}/docs", 
+            "admin": f"{SERVICES['admin'][0]}/docs"
         },
         "health": {
             "status": "healthy",
@@ -141,17 +248,121 @@ async def health_check():
         "services": {}
     }
     
-    # Check each service
-    async with httpx.AsyncClient() as client:
-        for service_name, service_url in SERVICES.items():
-            try:
-                response = await client.get(f"{service_url}/health", timeout=5.0)
-                health_status["services"][service_name] = "healthy" if response.status_code == 200 else "unhealthy"
-            except Exception:
-                health_status["services"][service_name] = "unreachable"
+    # Replica states are kept current by passive tracking and background checks
+    for service_name, pool in upstream.pools.items():
+        health_status["services"][service_name] = {
+            "status": "healthy" if pool.available() else "unavailable",
+            "replicas": pool.stats()
+        }
     
     return health_status
 
+security = HTTPBearer()
+
+async def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    """Admin JWT check; the gateway has no database, so the token's role claim is trusted"""
+    try:
+        user_data = google_auth_service.verify_jwt_token(credentials.credentials)
+    except HTTPException:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+    if user_data.get("role") != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Access denied. Admin role required.")
+    return user_data
+
+@app.get("/metrics")
+async def get_metrics(current_admin: Dict = Depends(require_admin)):
+    """Upstream connection pool, response cache and coalescing counters (admins only)"""
+    return {"upstream": upstream.stats(), "cache": response_cache.stats(), "coalescing": singleflight.stats()}
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(invalidation: CacheInvalidation, x_cache_token: Optional[str] = Header(None)):
+    """Drop cached responses of paths (any query string) or path prefixes"""
+    if not CACHE_TOKEN:
+        if not ALLOW_ANONYMOUS_INVALIDATION:
+            raise HTTPException(status_code=403, detail="Cache invalidation is not configured")
+    elif not hmac.compare_digest(x_cache_token or "", CACHE_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid cache token")
+    return {"invalidated": response_cache.invalidate(invalidation.paths, invalidation.prefixes)}
+
+# Catch-all proxy, registered last so the gateway's own routes above match first
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
+async def proxy_request(request: Request, path: str):
+    """Proxy request to appropriate backend service"""
+    try:
+        # Determine target service and the path it serves the request under
+        route = route_table.resolve(request.method, f"/{path}", request.headers)
+        service, upstream_path = route.service, route.path
+        if upstream_path.rstrip("/") in INTERNAL_PATHS:
+            raise RouteNotFound(f"{upstream_path} is not served through the gateway")
+        
+        logger.info(f"Routing {request.method} {path} to {service} service")
+        
+        # Public reads come from the response cache when it holds them
+        ttl = cache_ttl(request, route)
+        if ttl:
+            cache_key = ResponseCache.key(service, upstream_path, request.url.query,
+                                          request.headers.get("accept-encoding", ""))
+            entry = response_cache.get(cache_key)
+            if entry is not None:
+                return cached_response(entry, request, b"HIT")
+        
+        # End-to-end headers only, plus the client address for the backend's logs
+        headers = end_to_end_headers(request.headers.raw, b"host", b"x-forwarded-for",
+                                     # A cache fill needs the full body, whatever the client holds
+                                     *((b"if-none-match", b"if-modified-since") if ttl else ()))
+        if request.client:
+            forwarded_for = request.headers.get("x-forwarded-for")
+            client_ip = f"{forwarded_for}, {request.client.host}" if forwarded_for else request.client.host
+            headers.append((b"x-forwarded-for", client_ip.encode("latin-1")))
+        
+        if ttl:
+            # Concurrent misses of one key share a single upstream call and its entry
+            entry = await upstream_flights.do(
+                cache_key,
+                lambda: fetch_entry(service, upstream_path, request.query_params, headers, cache_key, ttl),
+                label=f"{service} {route.route}",
+                share=None
+            )
+            return cached_response(entry, request, b"MISS")
+        
+        # Stream the request body through instead of buffering it
+        body = None
+        if request.method in ["POST", "PUT", "PATCH"]:
+            body = request.stream()
+        
+        # Forward request over the service's keep-alive pool; returns at the response headers
+        response = await upstream.stream(
+            service,
+            request.method,
+            upstream_path,
+            params=request.query_params,
+            headers=headers,
+            content=body
+        )
+        
+        # Relay the body chunk by chunk; the connection goes back to the pool
+        # once the client has it all (or has gone away)
+        proxied = StreamingResponse(
+            relay(response, service, upstream_path),
+            status_code=response.status_code,
+            background=BackgroundTask(response.aclose)
+        )
+        # The gateway's server adds its own Date and Server headers
+        proxied.raw_headers = end_to_end_headers(response.headers.raw, b"date", b"server")
+        return proxied
+        
+    except RouteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except NoReplicaAvailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="Service unavailable")
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {str(e)}")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+    except Exception as e:
+        logger.error(f"Gateway error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
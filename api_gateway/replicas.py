@@ -0,0 +1,190 @@
+"""
+Replica pools for the backend services
+
+Each service may run several replicas ({SERVICE}_API_URLS). A request goes
+to the available replica with the fewest requests outstanding, ties broken
+by the lower recent latency, so a replica that slows down stops attracting
+new work before it has failed anything.
+
+Every replica has a circuit breaker fed by passive health tracking:
+connection errors, 5xx responses and responses slower than GATEWAY_SLOW_MS
+count as failures. GATEWAY_BREAKER_FAILURES failures in a row open the
+breaker and the replica gets no traffic for GATEWAY_BREAKER_COOLDOWN
+seconds. After that, one probe request is let through (half-open): a
+success closes the breaker, a failure opens it for twice as long, up to
+GATEWAY_BREAKER_MAX_COOLDOWN.
+
+A background task also GETs /health on every replica each
+GATEWAY_HEALTH_INTERVAL seconds. Replicas failing it are left out until they
+pass again (unless all of them fail it), and a replica coming back this way
+gets its probe request without waiting out its breaker's cooldown.
+"""
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Weight of the newest sample in the latency moving average
+LATENCY_SMOOTHING = 0.2
+
+
+class NoReplicaAvailable(Exception):
+    """Raised when every replica of a service is down or has its breaker open"""
+
+
+class Replica:
+    """One backend instance: its connection pool, load and health"""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+        self.outstanding = 0
+        self.latency = 0.0
+        self.healthy = True
+
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = 0.0
+        self.retry_at = 0.0
+        self.probing = False
+
+        self.requests = 0
+        self.errors = 0
+        self.trips = 0
+
+    def available(self, now: float, ignore_health: bool = False) -> bool:
+        if not (self.healthy or ignore_health):
+            return False
+        if self.state == OPEN:
+            return now >= self.retry_at
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000, 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "trips": self.trips
+        }
+
+
+class ReplicaPool:
+    """Least-outstanding-requests balancing with per-replica circuit breakers"""
+
+    def __init__(self, service: str, replicas: List[Replica]):
+        self.service = service
+        self.replicas = replicas
+        self.failure_threshold = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+        self.base_cooldown = float(os.getenv("GATEWAY_BREAKER_COOLDOWN", "10"))
+        self.max_cooldown = float(os.getenv("GATEWAY_BREAKER_MAX_COOLDOWN", "120"))
+        self.slow_threshold = float(os.getenv("GATEWAY_SLOW_MS", "3000")) / 1000
+
+    def acquire(self, exclude: Optional[List[Replica]] = None) -> Replica:
+        """Pick a replica for one request and count the request against it"""
+        now = time.monotonic()
+        allowed = [r for r in self.replicas if not (exclude and r in exclude)]
+        candidates = [r for r in allowed if r.available(now)]
+        if not candidates:
+            # Every replica failing its health check more likely means the checks
+            # are wrong than the service: keep serving where breakers allow
+            candidates = [r for r in allowed if r.available(now, ignore_health=True)]
+        if not candidates:
+            raise NoReplicaAvailable(f"No {self.service} replica is available")
+
+        least = min(r.outstanding for r in candidates)
+        candidates = [r for r in candidates if r.outstanding == least]
+        fastest = min(r.latency for r in candidates)
+        replica = random.choice([r for r in candidates if r.latency == fastest])
+
+        if replica.state == OPEN:
+            # Cooldown is over: this request is the probe
+            replica.state = HALF_OPEN
+        if replica.state == HALF_OPEN:
+            replica.probing = True
+        replica.outstanding += 1
+        replica.requests += 1
+        return replica
+
+    def abandon(self, replica: Replica) -> None:
+        """The request was cancelled before its outcome was known"""
+        # An unfinished probe must not keep a half-open replica unusable
+        replica.probing = False
+
+    def release(self, replica: Replica) -> None:
+        """The request's response has been fully relayed (or abandoned)"""
+        replica.outstanding -= 1
+
+    def record(self, replica: Replica, elapsed: Optional[float], status_code: Optional[int] = None) -> None:
+        """Passive health: a response arrived after ``elapsed`` seconds, or failed (elapsed None)"""
+        if elapsed is not None:
+            replica.latency = elapsed if replica.latency == 0.0 else (
+                LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * replica.latency
+            )
+        failed = elapsed is None or elapsed > self.slow_threshold or (status_code or 0) >= 500
+        if failed:
+            replica.errors += 1
+            self._failure(replica)
+        else:
+            self._success(replica)
+
+    def _success(self, replica: Replica) -> None:
+        replica.failures = 0
+        replica.probing = False
+        if replica.state != CLOSED:
+            logger.info(f"{self.service} replica {replica.url} recovered, closing its breaker")
+            replica.state = CLOSED
+            replica.cooldown = 0.0
+
+    def _failure(self, replica: Replica) -> None:
+        replica.failures += 1
+        replica.probing = False
+        if replica.state == HALF_OPEN:
+            self._trip(replica, min(replica.cooldown * 2, self.max_cooldown))
+        elif replica.state == CLOSED and replica.failures >= self.failure_threshold:
+            self._trip(replica, self.base_cooldown)
+
+    def _trip(self, replica: Replica, cooldown: float) -> None:
+        replica.state = OPEN
+        replica.cooldown = cooldown
+        replica.retry_at = time.monotonic() + cooldown
+        replica.trips += 1
+        logger.warning(f"{self.service} replica {replica.url} failing, breaker open for {cooldown:.0f}s")
+
+    async def check(self, replica: Replica, timeout: float) -> None:
+        """Active health check of one replica"""
+        try:
+            response = await replica.client.get("/health", timeout=timeout)
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+
+        if healthy != replica.healthy:
+            logger.warning(f"{self.service} replica {replica.url} health check {'passed' if healthy else 'failed'}")
+            if healthy and replica.state == OPEN:
+                # Back from an outage: let the next request probe it now. A replica
+                # that only answers slowly keeps passing and waits out its cooldown
+                replica.retry_at = 0.0
+        replica.healthy = healthy
+
+    def available(self) -> bool:
+        now = time.monotonic()
+        return any(r.available(now) for r in self.replicas)
+
+    def stats(self) -> List[Dict]:
+        return [replica.stats() for replica in self.replicas]
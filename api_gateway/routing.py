@@ -0,0 +1,153 @@
+"""
+Compiled routing table for the gateway
+
+Several paths (/auth/google, /shops, /orders, /dashboard, /profile, ...)
+exist on more than one backend, so a request names its app in one of three
+ways, checked in this order:
+
+- a path prefix, ``/api/{app}/...``, stripped before forwarding
+- an ``X-Service: {app}`` header
+- the first label of the Host header, ``{app}`` or ``{app}-api``
+
+Requests without a hint are matched against a trie of every backend route,
+keyed on path segments with ``{param}`` segments as wildcards. A lookup
+walks one node per segment, prefers literal segments over wildcards, and
+only considers routes that accept the request method; when several apps
+serve the route the earliest listed app wins.
+"""
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+
+API_PREFIX = "api"
+HINT_HEADER = "x-service"
+
+
+class RouteNotFound(LookupError):
+    """Raised when a request names an app the gateway does not know"""
+
+
+class Route(NamedTuple):
+    """Where a gateway request goes"""
+    service: str
+    path: str
+    # The backend route it matched, e.g. "GET /shops/{shop_id}"; None when unknown
+    route: Optional[str] = None
+
+
+class _Node:
+    __slots__ = ("literals", "wildcard", "methods")
+
+    def __init__(self):
+        self.literals: Dict[str, "_Node"] = {}
+        self.wildcard: Optional["_Node"] = None
+        # method -> (app, route) of each app serving it here, in listing order
+        self.methods: Dict[str, List[Tuple[str, str]]] = {}
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+class RouteTable:
+    """Method-aware prefix trie over the routes of every backend"""
+
+    def __init__(self, routes: Dict[str, List[str]], default: str):
+        """Compile routes given as app -> ["METHOD /path/{param}", ...]"""
+        self.services = list(routes)
+        self.default = default
+        self._host_hints = {name: service for service in routes for name in (service, f"{service}-api")}
+        self._root = _Node()
+        for service, service_routes in routes.items():
+            for route in service_routes:
+                method, _, template = route.partition(" ")
+                self._add(service, method.upper(), template)
+
+    def _add(self, service: str, method: str, template: str) -> None:
+        node = self._root
+        for segment in _segments(template):
+            if segment.startswith("{") and segment.endswith("}"):
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                node = node.literals.setdefault(segment, _Node())
+        served = node.methods.setdefault(method, [])
+        if all(other != service for other, _ in served):
+            served.append((service, f"{method} {template}"))
+
+    @staticmethod
+    def _served(node: _Node, method: str, service: Optional[str]) -> Optional[Tuple[str, str]]:
+        for candidate in node.methods.get(method, ()):
+            if service is None or candidate[0] == service:
+                return candidate
+        return None
+
+    def _match(self, node: _Node, segments: List[str], depth: int, method: str,
+               service: Optional[str]) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
+        """((app, route) serving the method, app serving the path with any method) below node"""
+        if depth == len(segments):
+            served = self._served(node, method, service)
+            if served:
+                return served, None
+            owners = [app for candidates in node.methods.values() for app, _ in candidates]
+            return None, next(iter(owners), None)
+
+        fallback = None
+        for child in (node.literals.get(segments[depth]), node.wildcard):
+            if child is None:
+                continue
+            served, other = self._match(child, segments, depth + 1, method, service)
+            if served:
+                return served, None
+            fallback = fallback or other
+        return None, fallback
+
+    def _lookup(self, method: str, segments: List[str], service: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """(app, route) for a request, restricted to one app when it is known"""
+        # Walk literal-first without backtracking, which settles almost every request
+        node = self._root
+        for segment in segments:
+            child = node.literals.get(segment) or node.wildcard
+            if child is None:
+                break
+            node = child
+        else:
+            served = self._served(node, method, service)
+            if served:
+                return served
+
+        served, other = self._match(self._root, segments, 0, method, service)
+        if served:
+            return served
+        # An app owning the path under another method answers with a 405
+        return service or other or self.default, None
+
+    def match(self, method: str, path: str) -> str:
+        """App serving a method and path; the default app when none does"""
+        return self._lookup(method.upper(), _segments(path))[0]
+
+    def resolve(self, method: str, path: str, headers: Mapping[str, str]) -> Route:
+        """Route of a gateway request"""
+        segments = _segments(path)
+        if len(segments) >= 2 and segments[0] == API_PREFIX:
+            service = segments[1]
+            if service not in self.services:
+                raise RouteNotFound(f"Unknown app {service!r}")
+            segments = segments[2:]
+            upstream_path = "/" + "/".join(segments) + ("/" if path.endswith("/") and segments else "")
+            return Route(service, upstream_path, self._lookup(method, segments, service)[1])
+
+        service = headers.get(HINT_HEADER)
+        if service:
+            if service not in self.services:
+                raise RouteNotFound(f"Unknown app {service!r}")
+            return Route(service, path, self._lookup(method, segments, service)[1])
+
+        host = headers.get("host")
+        if host:
+            service = self._host_hints.get(host.partition(":")[0].partition(".")[0])
+            if service:
+                return Route(service, path, self._lookup(method, segments, service)[1])
+
+        service, route = self._lookup(method, segments)
+        return Route(service, path, route)
@@ -0,0 +1,239 @@
+"""
+Pooled HTTP clients for the backend services
+
+The gateway keeps one long-lived httpx.AsyncClient per backend replica,
+opened at startup and closed at shutdown, so proxied calls reuse keep-alive
+connections instead of paying a TCP handshake each. Replicas are balanced
+and health-tracked per service (see replicas.py). Pool sizes, keep-alive
+expiry and timeouts come from the environment; HTTP/2 is used when
+GATEWAY_HTTP2 is set and the ``h2`` package is installed.
+
+Read timeouts are chosen per route by longest path prefix, so slow
+endpoints (dashboards, order placement) can wait longer than health checks.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from api_gateway.replicas import NoReplicaAvailable, Replica, ReplicaPool
+
+
+logger = logging.getLogger(__name__)
+
+# Failures where the request never reached the replica, so another may take it
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Read timeouts (seconds) by path prefix; GATEWAY_ROUTE_TIMEOUTS adds or overrides
+DEFAULT_ROUTE_TIMEOUTS = {
+    "/health": 5.0,
+    "/metrics": 5.0,
+    "/auth/google": 10.0,
+}
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_route_timeouts(value: Optional[str]) -> Dict[str, float]:
+    """Parse "/prefix=seconds,/other=seconds" into a prefix -> seconds map"""
+    timeouts = {}
+    for entry in (value or "").split(","):
+        if not entry.strip():
+            continue
+        prefix, _, seconds = entry.partition("=")
+        try:
+            timeouts["/" + prefix.strip().strip("/")] = float(seconds)
+        except ValueError:
+            raise ValueError(f"Invalid route timeout {entry.strip()!r}, expected /prefix=seconds")
+    return timeouts
+
+
+def replica_urls(variable: str, default: str) -> List[str]:
+    """Replica URLs of a service from a comma-separated environment variable"""
+    urls = [url.strip().rstrip("/") for url in os.getenv(variable, default).split(",") if url.strip()]
+    return urls or [default]
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees its replica's request slot once closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, pool: ReplicaPool, replica: Replica):
+        self._stream = stream
+        self._pool = pool
+        self._replica: Optional[Replica] = replica
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._replica is not None:
+                self._pool.release(self._replica)
+                self._replica = None
+
+
+class UpstreamClients:
+    """Keep-alive connection pools for every replica of every backend service"""
+
+    def __init__(self, services: Dict[str, List[str]]):
+        self.services = services
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.connect_timeout = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "2"))
+        # How long a request may wait for a free connection when the pool is full
+        self.pool_timeout = float(os.getenv("GATEWAY_POOL_TIMEOUT", "5"))
+        self.default_timeout = float(os.getenv("GATEWAY_TIMEOUT", "30"))
+        self.health_interval = float(os.getenv("GATEWAY_HEALTH_INTERVAL", "5"))
+        self.health_timeout = float(os.getenv("GATEWAY_HEALTH_TIMEOUT", "2"))
+
+        route_timeouts = {**DEFAULT_ROUTE_TIMEOUTS, **parse_route_timeouts(os.getenv("GATEWAY_ROUTE_TIMEOUTS"))}
+        # Longest prefix first, so the most specific route wins
+        self.route_timeouts: List[Tuple[str, float]] = sorted(
+            route_timeouts.items(), key=lambda route: len(route[0]), reverse=True
+        )
+
+        self.http2 = os.getenv("GATEWAY_HTTP2", "false").lower() == "true"
+        if self.http2 and not http2_available():
+            logger.warning("GATEWAY_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+            self.http2 = False
+
+        self.pools: Dict[str, ReplicaPool] = {
+            service: ReplicaPool(service, [Replica(url, self._client(url)) for url in urls])
+            for service, urls in services.items()
+        }
+        self._health_task: Optional[asyncio.Task] = None
+        self.requests: Dict[str, int] = {service: 0 for service in services}
+        self.errors: Dict[str, int] = {service: 0 for service in services}
+
+    def _client(self, url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=url,
+            limits=self.limits,
+            timeout=self.timeout("/"),
+            http2=self.http2
+        )
+
+    async def start(self) -> None:
+        for pool in self.pools.values():
+            for replica in pool.replicas:
+                # Reopen after a previous stop()
+                if replica.client.is_closed:
+                    replica.client = self._client(replica.url)
+        if self._health_task is None and self.health_interval > 0:
+            self._health_task = asyncio.get_running_loop().create_task(self._check_health())
+        replicas = ", ".join(f"{service} x{len(pool.replicas)}" for service, pool in self.pools.items())
+        logger.info(f"Upstream pools open: {replicas} (http2={self.http2})")
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for pool in self.pools.values():
+            for replica in pool.replicas:
+                await replica.client.aclose()
+
+    async def _check_health(self) -> None:
+        """Actively check every replica each health interval"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await asyncio.gather(*(
+                    pool.check(replica, self.health_timeout)
+                    for pool in self.pools.values() for replica in pool.replicas
+                ))
+            except Exception as e:
+                logger.error(f"Replica health checks failed: {str(e)}")
+
+    def timeout(self, path: str) -> httpx.Timeout:
+        """Timeouts for a request path"""
+        read = self.default_timeout
+        for prefix, seconds in self.route_timeouts:
+            if path == prefix or path.startswith(prefix + "/"):
+                read = seconds
+                break
+        return httpx.Timeout(read, connect=self.connect_timeout, pool=self.pool_timeout)
+
+    async def request(self, service: str, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request to a service and read the whole response"""
+        response = await self.stream(service, method, path, **kwargs)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    async def stream(self, service: str, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request to a replica and return once the response headers arrive.
+
+        The body is left unread for the caller to iterate; the caller must
+        aclose() the response to hand its connection back to the pool and
+        its request slot back to the replica.
+        """
+        self.requests[service] += 1
+        pool = self.pools[service]
+        tried: List[Replica] = []
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                replica = pool.acquire(exclude=tried)
+            except NoReplicaAvailable:
+                self.errors[service] += 1
+                if last_error is not None:
+                    raise last_error
+                raise
+
+            request = replica.client.build_request(method, path, timeout=self.timeout(path), **kwargs)
+            started = time.monotonic()
+            try:
+                response = await replica.client.send(request, stream=True)
+            except RETRYABLE_ERRORS as e:
+                pool.release(replica)
+                pool.record(replica, None)
+                tried.append(replica)
+                last_error = e
+                logger.warning(f"{service} replica {replica.url} unreachable ({type(e).__name__}), trying another")
+                continue
+            except httpx.RequestError:
+                pool.release(replica)
+                pool.record(replica, None)
+                self.errors[service] += 1
+                raise
+            except BaseException:
+                # Cancelled (client went away): the replica is not to blame
+                pool.release(replica)
+                pool.abandon(replica)
+                raise
+
+            pool.record(replica, time.monotonic() - started, response.status_code)
+            response.stream = _ReleasingStream(response.stream, pool, replica)
+            return response
+
+    def stats(self) -> Dict:
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "replicas": {service: pool.stats() for service, pool in self.pools.items()}
+        }
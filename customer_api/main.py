@@ -1,19 +1,26 @@
 """
 Customer API - FastAPI backend for customer app
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Dict, Optional, Any
 from datetime import datetime
+import asyncio
 import uuid
 import logging
 
 from shared.auth.google_auth import google_auth_service
-from shared.database.dynamodb import db_service
+from shared.database import geo
+from shared.database.dynamodb import db_service, OrderPlacementError, ReviewTargetNotFound
+from shared.database.search import catalog_search
+from shared.database.projection import parse_fields, with_fields, sparse
+from shared.database.metrics import track_route
+from shared.gateway import gateway_invalidator
+from shared import singleflight
 from shared.models.base import (
     BaseUser, Shop, Product, Order, Review, Address, 
-    UserRole, OrderStatus, DeliveryType
+    UserRole, OrderStatus, DeliveryType, PROFILE_FIELDS
 )
 
 # Configure logging
@@ -24,7 +31,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Customer API",
     description="Backend API for Customer App",
-    version="1.0.0"
+    version="1.0.0",
+    dependencies=[Depends(track_route)]
 )
 
 # CORS middleware
@@ -36,6 +44,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_change_feed():
+    """Start delivering table changes to caches and other derived views"""
+    await db_service.change_feed.start()
+    await catalog_search.start()
+    await gateway_invalidator.start()
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await catalog_search.stop()
+    await db_service.change_feed.stop()
+    await gateway_invalidator.stop()
+
 # Security
 security = HTTPBearer()
 
@@ -51,8 +72,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
+# Dependency for operator endpoints (metrics)
+async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    """Get current authenticated admin"""
+    try:
+        user_data = google_auth_service.verify_jwt_token(credentials.credentials)
+        user = await db_service.get_user(user_data["user_id"])
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        if user["role"] != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Access denied. Admin role required.")
+        
+        return user
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+
 # Pydantic models for requests
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class GoogleAuthRequest(BaseModel):
     access_token: str
@@ -75,20 +112,22 @@ class AddressCreate(BaseModel):
 class CartItem(BaseModel):
     product_id: str
     variant_id: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 class OrderCreate(BaseModel):
     shop_id: str
     items: List[CartItem]
     delivery_type: DeliveryType
     delivery_address: Optional[str] = None
+    # Saved address; deliveries without either use the user's default address
+    address_id: Optional[str] = None
     customer_notes: Optional[str] = None
 
 class ReviewCreate(BaseModel):
     shop_id: Optional[str] = None
     product_id: Optional[str] = None
     order_id: str
-    rating: int
+    rating: int = Field(..., ge=1, le=5)
     title: Optional[str] = None
     comment: Optional[str] = None
 
@@ -106,8 +145,9 @@ async def google_auth(auth_request: GoogleAuthRequest):
             user_model = BaseUser(**auth_result["user"])
             user = await db_service.create_user(user_model)
         
+        # The token carries the stored role, not the default one it was first minted with
         return AuthResponse(
-            token=auth_result["token"],
+            token=google_auth_service.create_jwt_token(user),
             user=user
         )
     except Exception as e:
@@ -119,20 +159,64 @@ async def google_auth(auth_request: GoogleAuthRequest):
 async def get_shops(
     category: Optional[str] = None,
     search: Optional[str] = None,
-    is_open: Optional[bool] = None
+    is_open: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    near: Optional[str] = Query(None, description="Customer location as 'lat,lng'"),
+    radius: float = Query(10.0, gt=0, le=geo.MAX_RADIUS_KM, description="Search radius in km")
 ):
-    """Get approved shops with optional filters"""
+    """Get approved shops with optional filters.
+    
+    With `near`, returns the shops that deliver to that point, nearest first.
+    `search` is answered from the search index, best match first.
+    """
     try:
-        shops = await db_service.get_approved_shops(category)
+        attributes = parse_fields(fields, Shop)
+        matching = None
+        if search and catalog_search.ready:
+            matching = {s["shop_id"]: s for s in catalog_search.search_shops(search, limit=None)}
+        
+        if near:
+            lat, lng = geo.parse_point(near)
+            shops = await db_service.get_shops_near(
+                lat, lng, radius, attributes=with_fields(attributes, "shop_id", "name", "is_open", "category")
+            )
+            if category:
+                shops = [s for s in shops if s["category"] == category]
+            page = {"items": shops, "next_cursor": None}
+        elif matching is not None:
+            # Filter on the indexed copies, then read only the shops returned
+            ranked = [
+                shop_id for shop_id, s in matching.items()
+                if (not category or s["category"] == category) and (is_open is None or s["is_open"] == is_open)
+            ][:limit]
+            found = await asyncio.gather(*(db_service.get_shop(shop_id) for shop_id in ranked))
+            page = {"items": [s for s in found if s and s["status"] == "approved"], "next_cursor": None}
+        else:
+            page = await db_service.get_approved_shops_page(
+                category, limit=limit, cursor=cursor,
+                attributes=with_fields(attributes, "shop_id", "name", "is_open")
+            )
+        shops = page["items"]
         
         # Apply additional filters
-        if search:
+        if matching is not None:
+            shops = [s for s in shops if s["shop_id"] in matching]
+        elif search:
+            # The search index is still loading
             shops = [s for s in shops if search.lower() in s["name"].lower()]
         
         if is_open is not None:
             shops = [s for s in shops if s["is_open"] == is_open]
         
-        return {"shops": shops}
+        if near:
+            shops = sparse(shops[:limit], with_fields(attributes, "distance_km"))
+        else:
+            shops = sparse(shops, attributes)
+        return {"shops": shops, "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching shops: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch shops")
@@ -155,25 +239,69 @@ async def get_shop(shop_id: str):
         logger.error(f"Error fetching shop: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch shop")
 
+# Search routes
+@app.get("/search/shops")
+async def search_shops(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Typeahead search over approved shops' names and categories"""
+    if not catalog_search.ready:
+        raise HTTPException(status_code=503, detail="Search index is loading")
+    try:
+        return {"shops": catalog_search.search_shops(q, limit)}
+    except Exception as e:
+        logger.error(f"Error searching shops: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to search shops")
+
+@app.get("/search/products")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    shop_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Typeahead search over product names, brands and categories, optionally within one shop"""
+    if not catalog_search.ready:
+        raise HTTPException(status_code=503, detail="Search index is loading")
+    try:
+        return {"products": catalog_search.search_products(q, limit, shop_id)}
+    except Exception as e:
+        logger.error(f"Error searching products: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to search products")
+
 # Product routes
 @app.get("/shops/{shop_id}/products")
-async def get_shop_products(shop_id: str, category: Optional[str] = None):
+async def get_shop_products(
+    shop_id: str,
+    category: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Get products for a specific shop"""
     try:
+        attributes = parse_fields(fields, Product)
+        
         # Verify shop exists and is approved
         shop = await db_service.get_shop(shop_id)
         if not shop or shop["status"] != "approved":
             raise HTTPException(status_code=404, detail="Shop not found")
         
-        products = await db_service.get_products_by_shop(shop_id)
+        page = await db_service.get_products_by_shop_page(
+            shop_id, limit=limit, cursor=cursor,
+            attributes=with_fields(attributes, "category")
+        )
+        products = page["items"]
         
         # Filter by category if provided
         if category:
             products = [p for p in products if p["category"] == category]
         
-        return {"products": products}
+        return {"products": sparse(products, attributes), "next_cursor": page["next_cursor"]}
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch products")
@@ -196,11 +324,10 @@ async def get_product(product_id: str):
 # Address routes
 @app.get("/addresses")
 async def get_addresses(current_user: Dict = Depends(get_current_user)):
-    """Get user addresses"""
+    """Get user addresses, default first"""
     try:
-        # This would need to be implemented in the database service
-        # For now, return empty list
-        return {"addresses": []}
+        addresses = await db_service.get_addresses(current_user["user_id"])
+        return {"addresses": addresses}
     except Exception as e:
         logger.error(f"Error fetching addresses: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch addresses")
@@ -218,13 +345,41 @@ async def create_address(
             **address_data.dict()
         )
         
-        # This would need to be implemented in the database service
-        # For now, return the address data
-        return address.dict()
+        return await db_service.create_address(address)
     except Exception as e:
         logger.error(f"Error creating address: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create address")
 
+@app.put("/addresses/{address_id}/default")
+async def set_default_address(address_id: str, current_user: Dict = Depends(get_current_user)):
+    """Make an address the user's default"""
+    try:
+        address = await db_service.set_default_address(current_user["user_id"], address_id)
+        if not address:
+            raise HTTPException(status_code=404, detail="Address not found")
+        
+        return address
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error setting default address: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to set default address")
+
+@app.delete("/addresses/{address_id}")
+async def delete_address(address_id: str, current_user: Dict = Depends(get_current_user)):
+    """Delete one of the user's addresses"""
+    try:
+        deleted = await db_service.delete_address(current_user["user_id"], address_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Address not found")
+        
+        return {"address_id": address_id, "deleted": True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting address: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to delete address")
+
 # Order routes
 @app.post("/orders")
 async def create_order(
@@ -245,8 +400,11 @@ async def create_order(
         items = []
         subtotal = 0.0
         
+        # Load every product in the cart in one batch instead of per line
+        products = await db_service.get_products_batch([i.product_id for i in order_data.items])
+        
         for cart_item in order_data.items:
-            product = await db_service.get_product(cart_item.product_id)
+            product = products.get(cart_item.product_id)
             if not product:
                 raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
             
@@ -255,9 +413,7 @@ async def create_order(
             if not variant:
                 raise HTTPException(status_code=404, detail=f"Variant {cart_item.variant_id} not found")
             
-            if variant["stock_quantity"] < cart_item.quantity:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['name']}")
-            
+            # Stock is checked atomically when the order is placed
             item_total = variant["selling_price"] * cart_item.quantity
             subtotal += item_total
             
@@ -272,6 +428,19 @@ async def create_order(
                 "total_price": item_total
             })
         
+        # Resolve the delivery address from the cached address book
+        delivery_address = order_data.delivery_address
+        address_id = order_data.address_id
+        if not address_id and not delivery_address and order_data.delivery_type == DeliveryType.DELIVERY:
+            address_id = current_user.get("default_address_id")
+        if address_id:
+            address = await db_service.get_address(current_user["user_id"], address_id)
+            if not address:
+                raise HTTPException(status_code=404, detail="Address not found")
+            delivery_address = ", ".join(
+                address[k] for k in ("street_address", "city", "state", "postal_code", "country")
+            )
+        
         # Calculate delivery fee
         delivery_fee = shop["delivery_fee"] if order_data.delivery_type == DeliveryType.DELIVERY else 0.0
         total_amount = subtotal + delivery_fee
@@ -287,25 +456,43 @@ async def create_order(
             total_amount=total_amount,
             status=OrderStatus.PENDING,
             delivery_type=order_data.delivery_type,
-            delivery_address=order_data.delivery_address,
+            delivery_address=delivery_address,
+            address_id=address_id,
             customer_notes=order_data.customer_notes
         )
         
-        created_order = await db_service.create_order(order)
+        created_order = await db_service.place_order(order, products)
         return created_order
         
     except HTTPException:
         raise
+    except OrderPlacementError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Some items could not be reserved", "failures": e.failures}
+        )
     except Exception as e:
         logger.error(f"Error creating order: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create order")
 
 @app.get("/orders")
-async def get_orders(current_user: Dict = Depends(get_current_user)):
-    """Get user's order history"""
+async def get_orders(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get user's order history, newest first"""
     try:
-        orders = await db_service.get_orders_by_customer(current_user["user_id"])
-        return {"orders": orders}
+        page = await db_service.get_orders_by_customer_page(
+            current_user["user_id"], limit=limit, cursor=cursor,
+            attributes=parse_fields(fields, Order), since=since, until=until
+        )
+        return {"orders": page["items"], "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
@@ -348,6 +535,13 @@ async def create_review(
         if order["status"] != OrderStatus.DELIVERED:
             raise HTTPException(status_code=400, detail="Can only review delivered orders")
         
+        # Ratings are aggregated per shop and product, so a review must match its order
+        if review_data.shop_id and review_data.shop_id != order["shop_id"]:
+            raise HTTPException(status_code=400, detail="Shop is not part of this order")
+        
+        if review_data.product_id and review_data.product_id not in {i["product_id"] for i in order["items"]}:
+            raise HTTPException(status_code=400, detail="Product is not part of this order")
+        
         review = Review(
             review_id=str(uuid.uuid4()),
             customer_id=current_user["user_id"],
@@ -360,16 +554,55 @@ async def create_review(
             is_verified=True
         )
         
-        # This would need to be implemented in the database service
-        # For now, return the review data
-        return review.dict()
+        created_review = await db_service.create_review(review)
+        return created_review
         
     except HTTPException:
         raise
+    except ReviewTargetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error creating review: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create review")
 
+@app.get("/shops/{shop_id}/reviews")
+async def get_shop_reviews(
+    shop_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get a shop's approved reviews, newest first"""
+    try:
+        page = await db_service.get_reviews_by_shop_page(
+            shop_id, limit=limit, cursor=cursor, attributes=parse_fields(fields, Review)
+        )
+        return {"reviews": page["items"], "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching shop reviews: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch reviews")
+
+@app.get("/products/{product_id}/reviews")
+async def get_product_reviews(
+    product_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get a product's approved reviews, newest first"""
+    try:
+        page = await db_service.get_reviews_by_product_page(
+            product_id, limit=limit, cursor=cursor, attributes=parse_fields(fields, Review)
+        )
+        return {"reviews": page["items"], "next_cursor": page["next_cursor"]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching product reviews: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch reviews")
+
 # Profile routes
 @app.get("/profile")
 async def get_profile(current_user: Dict = Depends(get_current_user)):
@@ -383,6 +616,14 @@ async def update_profile(
 ):
     """Update user profile"""
     try:
+        if "default_address_id" in updates:
+            raise HTTPException(status_code=400, detail="Set the default address with PUT /addresses/{address_id}/default")
+        # Role, status, identity and timestamps are managed by the server
+        rejected = sorted(set(updates) - PROFILE_FIELDS)
+        if rejected:
+            raise HTTPException(status_code=400, detail=f"Cannot update {', '.join(rejected)}")
+        updates = {**updates, "updated_at": datetime.utcnow()}
+        
         updated_user = await db_service.update_user(current_user["user_id"], updates)
         if not updated_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -394,6 +635,27 @@ async def update_profile(
         logger.error(f"Error updating profile: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
+# Health check, polled by the API gateway
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "service": "customer"}
+
+# Metrics
+@app.get("/metrics")
+async def get_metrics(current_admin: Dict = Depends(get_current_admin)):
+    """DynamoDB call, cache, throttling and change feed aggregates for this process (admins only)"""
+    return {
+        "dynamodb": db_service.call_stats(),
+        "caches": db_service.cache_stats(),
+        "throttling": db_service.throttle_stats(),
+        "change_feed": db_service.change_feed.stats(),
+        "write_buffers": db_service.write_buffer_stats(),
+        "search": catalog_search.stats(),
+        "gateway_cache": gateway_invalidator.stats(),
+        "coalescing": singleflight.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
@@ -1,7 +1,7 @@
 """
 Merchant API - FastAPI backend for merchant app
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Dict, Optional, Any
@@ -10,10 +10,15 @@ import uuid
 import logging
 
 from shared.auth.google_auth import google_auth_service
-from shared.database.dynamodb import db_service
+from shared.database import stats
+from shared.database.dynamodb import db_service, RATING_FIELDS
+from shared.database.projection import parse_fields
+from shared.database.metrics import track_route
+from shared.gateway import gateway_invalidator
+from shared import singleflight
 from shared.models.base import (
     BaseUser, Shop, Product, Order, Review, 
-    UserRole, OrderStatus, ShopStatus
+    UserRole, OrderStatus, ShopStatus, PROFILE_FIELDS
 )
 
 # Configure logging
@@ -24,7 +29,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Merchant API",
     description="Backend API for Merchant App",
-    version="1.0.0"
+    version="1.0.0",
+    dependencies=[Depends(track_route)]
 )
 
 # CORS middleware
@@ -36,6 +42,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_change_feed():
+    """Start delivering table changes to caches and other derived views"""
+    await db_service.change_feed.start()
+    await gateway_invalidator.start()
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await db_service.change_feed.stop()
+    await gateway_invalidator.stop()
+
 # Security
 security = HTTPBearer()
 
@@ -55,6 +72,22 @@ async def get_current_merchant(credentials: HTTPAuthorizationCredentials = Depen
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
+# Dependency for operator endpoints (metrics)
+async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    """Get current authenticated admin"""
+    try:
+        user_data = google_auth_service.verify_jwt_token(credentials.credentials)
+        user = await db_service.get_user(user_data["user_id"])
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        if user["role"] != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Access denied. Admin role required.")
+        
+        return user
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+
 # Pydantic models for requests
 from pydantic import BaseModel
 
@@ -149,8 +182,9 @@ async def google_auth(auth_request: GoogleAuthRequest):
             await db_service.update_user(user["user_id"], {"role": UserRole.MERCHANT})
             user["role"] = UserRole.MERCHANT
         
+        # The token carries the stored role, not the default one it was first minted with
         return AuthResponse(
-            token=auth_result["token"],
+            token=google_auth_service.create_jwt_token(user),
             user=user
         )
     except Exception as e:
@@ -166,21 +200,16 @@ async def get_dashboard(current_merchant: Dict = Depends(get_current_merchant)):
         
         # Get merchant's shops
         shops = await db_service.get_shops_by_merchant(merchant_id)
+        shop_ids = [shop["shop_id"] for shop in shops]
         
-        # Get recent orders across all shops
-        all_orders = []
-        for shop in shops:
-            shop_orders = await db_service.get_orders_by_shop(shop["shop_id"])
-            all_orders.extend(shop_orders)
-        
-        # Sort orders by creation date
-        all_orders.sort(key=lambda x: x["created_at"], reverse=True)
-        recent_orders = all_orders[:10]  # Last 10 orders
+        # Last 10 orders across all shops, read newest-first from the index
+        recent_orders = await db_service.get_recent_orders_by_shops(shop_ids, limit=10)
         
-        # Calculate statistics
-        total_orders = len(all_orders)
-        pending_orders = len([o for o in all_orders if o["status"] == OrderStatus.PENDING])
-        total_revenue = sum(o["total_amount"] for o in all_orders if o["status"] == OrderStatus.DELIVERED)
+        # Counters are maintained on write in the merchant's stats item
+        counters = await db_service.get_stats(stats.merchant_key(merchant_id))
+        total_orders = counters.get("orders", 0)
+        pending_orders = counters.get(f"orders_{OrderStatus.PENDING.value}", 0)
+        total_revenue = counters.get("revenue", 0)
         
         return {
             "shops": shops,
@@ -198,11 +227,18 @@ async def get_dashboard(current_merchant: Dict = Depends(get_current_merchant)):
 
 # Shop routes
 @app.get("/shops")
-async def get_merchant_shops(current_merchant: Dict = Depends(get_current_merchant)):
+async def get_merchant_shops(
+    fields: Optional[str] = None,
+    current_merchant: Dict = Depends(get_current_merchant)
+):
     """Get all shops for the merchant"""
     try:
-        shops = await db_service.get_shops_by_merchant(current_merchant["user_id"])
+        shops = await db_service.get_shops_by_merchant(
+            current_merchant["user_id"], attributes=parse_fields(fields, Shop)
+        )
         return {"shops": shops}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching shops: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch shops")
@@ -306,19 +342,28 @@ async def update_shop_status(
 @app.get("/shops/{shop_id}/products")
 async def get_shop_products(
     shop_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_merchant: Dict = Depends(get_current_merchant)
 ):
     """Get all products for a shop"""
     try:
+        attributes = parse_fields(fields, Product)
+        
         # Verify shop ownership
         shop = await db_service.get_shop(shop_id)
         if not shop or shop["merchant_id"] != current_merchant["user_id"]:
             raise HTTPException(status_code=404, detail="Shop not found")
         
-        products = await db_service.get_products_by_shop(shop_id)
-        return {"products": products}
+        page = await db_service.get_products_by_shop_page(
+            shop_id, limit=limit, cursor=cursor, attributes=attributes
+        )
+        return {"products": page["items"], "next_cursor": page["next_cursor"]}
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch products")
@@ -400,12 +445,15 @@ async def update_product(
         if not shop or shop["merchant_id"] != current_merchant["user_id"]:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # This would need to be implemented in the database service
-        # For now, return the product with updates
-        product.update(updates)
-        product["updated_at"] = datetime.utcnow()
+        # Ownership, identity and review aggregate fields cannot be changed
+        updates = {k: v for k, v in updates.items() if k not in ("product_id", "shop_id") and k not in RATING_FIELDS}
+        updates["updated_at"] = datetime.utcnow()
         
-        return product
+        updated_product = await db_service.update_product(product_id, updates)
+        if not updated_product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        return updated_product
     except HTTPException:
         raise
     except Exception as e:
@@ -417,19 +465,31 @@ async def update_product(
 async def get_shop_orders(
     shop_id: str,
     status: Optional[OrderStatus] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     current_merchant: Dict = Depends(get_current_merchant)
 ):
-    """Get orders for a shop"""
+    """Get orders for a shop, newest first"""
     try:
+        attributes = parse_fields(fields, Order)
+        
         # Verify shop ownership
         shop = await db_service.get_shop(shop_id)
         if not shop or shop["merchant_id"] != current_merchant["user_id"]:
             raise HTTPException(status_code=404, detail="Shop not found")
         
-        orders = await db_service.get_orders_by_shop(shop_id, status)
-        return {"orders": orders}
+        page = await db_service.get_orders_by_shop_page(
+            shop_id, status, limit=limit, cursor=cursor, attributes=attributes,
+            since=since, until=until
+        )
+        return {"orders": page["items"], "next_cursor": page["next_cursor"]}
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
@@ -481,6 +541,12 @@ async def update_profile(
 ):
     """Update merchant profile"""
     try:
+        # Role, status, identity and timestamps are managed by the server
+        rejected = sorted(set(updates) - PROFILE_FIELDS)
+        if rejected:
+            raise HTTPException(status_code=400, detail=f"Cannot update {', '.join(rejected)}")
+        updates = {**updates, "updated_at": datetime.utcnow()}
+        
         updated_user = await db_service.update_user(current_merchant["user_id"], updates)
         if not updated_user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -492,6 +558,26 @@ async def update_profile(
         logger.error(f"Error updating profile: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
+# Health check, polled by the API gateway
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "service": "merchant"}
+
+# Metrics
+@app.get("/metrics")
+async def get_metrics(current_admin: Dict = Depends(get_current_admin)):
+    """DynamoDB call, cache, throttling and change feed aggregates for this process (admins only)"""
+    return {
+        "dynamodb": db_service.call_stats(),
+        "caches": db_service.cache_stats(),
+        "throttling": db_service.throttle_stats(),
+        "change_feed": db_service.change_feed.stats(),
+        "write_buffers": db_service.write_buffer_stats(),
+        "gateway_cache": gateway_invalidator.stats(),
+        "coalescing": singleflight.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
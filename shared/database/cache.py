@@ -0,0 +1,109 @@
+"""
+In-process read-through cache for hot DynamoDB items
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+# Returned by TTLCache.get when nothing usable is cached for a key
+MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed TTL.
+
+    Storing ``None`` records a negative entry ("item does not exist") that
+    expires after ``negative_ttl`` so repeated lookups of unknown IDs stay
+    off the database without hiding newly created items for long.
+
+    Every invalidation bumps ``generation``. A read-through fill passes the
+    generation it started at, so a read still in flight when a write
+    invalidated the key cannot put the pre-write item back.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, negative_ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.generation = 0
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, None for a negative entry, or MISSING"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Optional[Any], generation: Optional[int] = None) -> None:
+        """Cache a value, or a negative entry when value is None.
+
+        With ``generation``, the value is dropped if anything was invalidated
+        since that generation was read.
+        """
+        if self.max_entries <= 0 or (generation is not None and generation != self.generation):
+            return
+
+        ttl = self.negative_ttl if value is None else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def find(self, predicate: Callable[[Any], bool]) -> List[Hashable]:
+        """Keys of unexpired, non-negative entries whose value matches predicate (not counted as lookups)"""
+        now = time.monotonic()
+        return [key for key, (expires_at, value) in self._entries.items()
+                if expires_at > now and value is not None and predicate(value)]
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single key"""
+        self.generation += 1
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self.generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning size and TTL"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0
+        }
@@ -0,0 +1,168 @@
+"""
+Schema-aware conversion between Pydantic model data and DynamoDB items
+
+boto3 returns every number as Decimal and refuses Python floats on write,
+and datetimes are stored as ISO strings. A ModelCodec is built once per
+model from its field annotations, so converting an item only touches the
+fields that actually need it instead of inspecting every value.
+"""
+import typing
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+
+Converter = Callable[[Any], Any]
+
+
+def _number(value: Decimal) -> Any:
+    """Decimal -> int when integral, else float"""
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _parse_datetime(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        # Python < 3.11 does not accept a trailing "Z"
+        try:
+            parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+        except ValueError:
+            return value
+    # Everything in the platform is naive UTC (datetime.utcnow)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _format_datetime(value: datetime) -> str:
+    """ISO string in the platform's naive UTC, so stored keys compare as strings"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def decode_value(value: Any) -> Any:
+    """Fallback decoder for attributes that are not part of the model"""
+    if isinstance(value, Decimal):
+        return _number(value)
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: decode_value(v) for k, v in value.items()}
+    return value
+
+
+def encode_value(value: Any) -> Any:
+    """Fallback encoder for values whose type is only known at runtime"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return _format_datetime(value)
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if typing.get_origin(annotation) is typing.Union:
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _converters(annotation: Any) -> "tuple[Optional[Converter], Optional[Converter]]":
+    """(decoder, encoder) for one annotation; None means pass through"""
+    annotation = _unwrap_optional(annotation)
+    origin = typing.get_origin(annotation)
+
+    if annotation is datetime:
+        return _parse_datetime, lambda v: _format_datetime(v) if isinstance(v, datetime) else v
+    # Items come straight from boto3, so numeric fields are always Decimal
+    if annotation is float:
+        return float, lambda v: Decimal(str(v)) if isinstance(v, (float, int)) and not isinstance(v, bool) else v
+    if annotation is int:
+        return int, None
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return None, lambda v: v.value if isinstance(v, Enum) else v
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        nested = ModelCodec(annotation)
+        return nested.decode, nested.encode
+
+    if origin in (list, typing.List):
+        (item_annotation,) = typing.get_args(annotation) or (Any,)
+        decode, encode = _converters(item_annotation)
+        return (
+            (lambda v: [decode(i) for i in v]) if decode else None,
+            (lambda v: [encode(i) for i in v]) if encode else None
+        )
+    if origin in (dict, typing.Dict):
+        args = typing.get_args(annotation)
+        decode, encode = _converters(args[1] if len(args) == 2 else Any)
+        return (
+            (lambda v: {k: decode(i) for k, i in v.items()}) if decode else None,
+            (lambda v: {k: encode(i) for k, i in v.items()}) if encode else None
+        )
+    if annotation in (str, bool):
+        return None, None
+    return decode_value, encode_value
+
+
+class ModelCodec:
+    """Encodes model dicts into DynamoDB items and decodes them back"""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._field_names = frozenset(model.model_fields)
+        self._decoders: Dict[str, Converter] = {}
+        self._encoders: Dict[str, Optional[Converter]] = {}
+        for name, field in model.model_fields.items():
+            decode, encode = _converters(field.annotation)
+            if decode is not None:
+                self._decoders[name] = decode
+            self._encoders[name] = encode
+        self._decode_plan = tuple(self._decoders.items())
+
+    def decode(self, item: Dict) -> Dict:
+        """Convert a DynamoDB item in place into native Python values"""
+        # Only fields whose type needs converting are visited at all
+        for name, decode in self._decode_plan:
+            value = item.get(name)
+            if value is not None:
+                item[name] = decode(value)
+
+        if len(item) > len(self._decode_plan):
+            for name in item.keys() - self._field_names:
+                value = item[name]
+                if isinstance(value, (Decimal, list, dict)):
+                    item[name] = decode_value(value)
+        return item
+
+    def encode(self, data: Any) -> Dict:
+        """Convert model data (or a model instance) into a DynamoDB item"""
+        if isinstance(data, BaseModel):
+            data = data.model_dump()
+        return {name: self.encode_field(name, value) for name, value in data.items()}
+
+    def encode_field(self, name: str, value: Any) -> Any:
+        """Convert a single attribute value, e.g. for an UpdateExpression"""
+        if value is None:
+            return None
+        if name in self._encoders:
+            encode = self._encoders[name]
+            return encode(value) if encode is not None else value
+        return encode_value(value)
@@ -2,12 +2,57 @@
 DynamoDB service for the platform
 """
 import os
+import asyncio
+import functools
+import threading
+import base64
 import boto3
 import json
-from typing import Dict, List, Optional, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, AsyncIterator, Callable, Tuple
 from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from shared.database.cache import TTLCache, MISSING
+from shared.database import geo, stats
+from shared.database.events import ChangeEvent, LocalChangeFeed, StreamsChangeFeed
+from shared.database.codec import ModelCodec, decode_value
+from shared.database.metrics import CallMetrics, record_response_size
+from shared.database.projection import with_fields
+from shared.database.tables import TABLE_DEFINITIONS
+from shared.database.write_buffer import WriteBuffer
+from shared.database.retry import (
+    RetryPolicy, RetryBudget, AdaptiveRateLimiter, is_retryable, is_throttle, error_code, THROTTLE_CODES
+)
 from shared.models.base import BaseUser, Shop, Product, Order, Review, Address
+from shared.singleflight import coalesce
+
+
+class OrderPlacementError(Exception):
+    """Raised when an order's stock reservation transaction is rejected"""
+    
+    def __init__(self, failures: List[Dict]):
+        self.failures = failures
+        super().__init__(f"Order placement failed for {len(failures)} line(s)")
+
+
+class ReviewTargetNotFound(LookupError):
+    """Raised when a review names a shop or product that does not exist"""
+
+
+# Running review aggregates kept on shops and products; `rating` is derived from them on read
+RATING_STARS = range(1, 6)
+RATING_ATTRIBUTES = ['rating_sum', 'total_reviews'] + [f'rating_star_{star}' for star in RATING_STARS]
+# Only review writes may change these; shop and product updates drop them
+RATING_FIELDS = frozenset(RATING_ATTRIBUTES + ['rating', 'rating_histogram'])
+
+# Operations whose successful calls are reported to the local change feed
+WRITE_OPERATIONS = frozenset({
+    'put_item', 'update_item', 'delete_item', 'transact_write_items', 'batch_write_item'
+})
 
 
 class DynamoDBService:
@@ -20,250 +65,1557 @@ class DynamoDBService:
         env = os.getenv("ENVIRONMENT", "production")
 
         # Use endpoint_url only for local development
+        self._resource_kwargs = {"region_name": region}
         if env == "development" and endpoint_url:
-            self.dynamodb = boto3.resource(
-                'dynamodb',
+            self._resource_kwargs.update(
                 endpoint_url=endpoint_url,
-                region_name=region,
                 aws_access_key_id=aws_access_key_id,
                 aws_secret_access_key=aws_secret_access_key
             )
-        else:
-            # For AWS, use region and credentials if provided, else use default provider chain
-            session_kwargs = {"region_name": region}
-            if aws_access_key_id and aws_secret_access_key:
-                session_kwargs["aws_access_key_id"] = aws_access_key_id
-                session_kwargs["aws_secret_access_key"] = aws_secret_access_key
-            self.dynamodb = boto3.resource('dynamodb', **session_kwargs)
+        elif aws_access_key_id and aws_secret_access_key:
+            # For AWS, use credentials if provided, else use default provider chain
+            self._resource_kwargs["aws_access_key_id"] = aws_access_key_id
+            self._resource_kwargs["aws_secret_access_key"] = aws_secret_access_key
+        # Retries are handled by _dispatch so they share one backoff,
+        # budget and rate limiter instead of botocore retrying underneath
+        self._resource_kwargs["config"] = Config(retries={"total_max_attempts": 1})
+
+        # boto3 is blocking, so every call runs on a bounded worker pool and
+        # each table gets its own in-flight limit so one hot table cannot
+        # starve the others.
+        self.max_workers = int(os.getenv("DYNAMODB_MAX_WORKERS", "64"))
+        self.table_concurrency = int(os.getenv("DYNAMODB_TABLE_CONCURRENCY", "32"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="dynamodb"
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.batch_max_retries = 8
+        self.transaction_max_items = 100
+        self.transaction_conflict_retries = 3
+        self.status_update_retries = 5
+        self.scan_segments = int(os.getenv("DYNAMODB_SCAN_SEGMENTS", "4"))
+        
+        # Throttling: jittered backoff, a per-table retry budget and an
+        # adaptive per-table rate limit driven by throttle responses
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv("DYNAMODB_MAX_ATTEMPTS", "6")),
+            base_delay=0.025,
+            max_delay=float(os.getenv("DYNAMODB_MAX_BACKOFF", "2"))
+        )
+        self.retry_budget_ratio = float(os.getenv("DYNAMODB_RETRY_BUDGET_RATIO", "0.2"))
+        self.retry_budget_tokens = 100.0
+        self.rate_limit_min = 5.0
+        self.rate_limit_max = float(os.getenv("DYNAMODB_RATE_LIMIT_MAX", "2000"))
+        self._budgets: Dict[str, RetryBudget] = {}
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
         
+        # Bulk puts are coalesced into BatchWriteItem calls per table
+        self.write_flush_interval = float(os.getenv("DYNAMODB_WRITE_FLUSH_MS", "20")) / 1000
+        self._write_buffers: Dict[str, WriteBuffer] = {}
+        
+        # Latency, items, bytes and consumed capacity of every call
+        self.metrics = CallMetrics()
+        # boto3 resources are not thread-safe, so each worker thread owns one
+        self._local = threading.local()
+
+        # Read-through caches for the items read on almost every request
+        cache_entries = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        negative_ttl = float(os.getenv("CACHE_NEGATIVE_TTL", "5"))
+        self.shop_cache = TTLCache("shops", cache_entries, float(os.getenv("SHOP_CACHE_TTL", "60")), negative_ttl)
+        self.product_cache = TTLCache("products", cache_entries, float(os.getenv("PRODUCT_CACHE_TTL", "30")), negative_ttl)
+        # Address books, keyed by user_id, so checkout resolves an address without a query
+        self.address_cache = TTLCache("addresses", cache_entries, float(os.getenv("ADDRESS_CACHE_TTL", "300")), negative_ttl)
+
         # Table names
-        self.users_table = self.dynamodb.Table('users')
-        self.shops_table = self.dynamodb.Table('shops')
-        self.products_table = self.dynamodb.Table('products')
-        self.orders_table = self.dynamodb.Table('orders')
-        self.reviews_table = self.dynamodb.Table('reviews')
-        self.addresses_table = self.dynamodb.Table('addresses')
-    
-    def _serialize_datetime(self, obj):
-        """Convert datetime objects to ISO string for DynamoDB"""
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return obj
-    
-    def _deserialize_datetime(self, data: Dict) -> Dict:
-        """Convert ISO strings back to datetime objects"""
-        for key, value in data.items():
-            if isinstance(value, str) and 'T' in value and value.endswith('Z'):
-                try:
-                    data[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                except ValueError:
-                    pass
-        return data
+        self.users_table = 'users'
+        self.shops_table = 'shops'
+        self.products_table = 'products'
+        self.orders_table = 'orders'
+        self.reviews_table = 'reviews'
+        self.addresses_table = 'addresses'
+        self.stats_table = 'stats'
+
+        # Writes drop the items they touch from this process's caches as they
+        # complete; the change feed carries other processes' writes
+        self._item_caches = {self.shops_table: self.shop_cache, self.products_table: self.product_cache}
+
+        # Change feed: the service's own writes, or DynamoDB Streams in the one
+        # process per deployment that tails them (see events.py)
+        watched = [name for name, definition in TABLE_DEFINITIONS.items() if definition.get("stream")]
+        feed_source = os.getenv("CHANGE_FEED", "local")
+        if feed_source == "streams":
+            self.change_feed = StreamsChangeFeed(watched, self._decode, self._streams_client, self._stream_arn)
+        else:
+            self.change_feed = LocalChangeFeed(watched, self._decode, self._fetch_item)
+        self.change_feed.subscribe(self._invalidate_cached, tables=[self.shops_table, self.products_table])
+        self.change_feed.subscribe(self._on_address_change, tables=[self.addresses_table], images=True)
+
+        # Attributes that key a secondary index, per table
+        self._index_keys = {
+            table_name: {k for index in definition["indexes"] for k in (index["hash"], index.get("range")) if k}
+            for table_name, definition in TABLE_DEFINITIONS.items()
+        }
+
+        # Item codecs, generated once from the models stored in each table
+        self._codecs = {
+            self.users_table: ModelCodec(BaseUser),
+            self.shops_table: ModelCodec(Shop),
+            self.products_table: ModelCodec(Product),
+            self.orders_table: ModelCodec(Order),
+            self.reviews_table: ModelCodec(Review),
+            self.addresses_table: ModelCodec(Address)
+        }
+
+    @property
+    def dynamodb(self):
+        """DynamoDB resource owned by the calling thread"""
+        resource = getattr(self._local, "resource", None)
+        if resource is None:
+            session = boto3.session.Session()
+            resource = session.resource('dynamodb', **self._resource_kwargs)
+            resource.meta.client.meta.events.register('after-call.dynamodb', record_response_size)
+            self._local.resource = resource
+        return resource
+
+    def _semaphore(self, table_name: str) -> asyncio.Semaphore:
+        """Per-table limit on concurrent in-flight calls"""
+        semaphore = self._semaphores.get(table_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.table_concurrency)
+            self._semaphores[table_name] = semaphore
+        return semaphore
+
+    def _budget(self, table_name: str) -> RetryBudget:
+        """Per-table retry budget"""
+        budget = self._budgets.get(table_name)
+        if budget is None:
+            budget = RetryBudget(self.retry_budget_ratio, self.retry_budget_tokens)
+            self._budgets[table_name] = budget
+        return budget
+
+    def _limiter(self, table_name: str) -> AdaptiveRateLimiter:
+        """Per-table adaptive rate limiter"""
+        limiter = self._limiters.get(table_name)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(table_name, self.rate_limit_min, self.rate_limit_max)
+            self._limiters[table_name] = limiter
+        return limiter
+
+    def _write_buffer(self, table_name: str) -> WriteBuffer:
+        buffer = self._write_buffers.get(table_name)
+        if buffer is None:
+            buffer = self._write_buffers[table_name] = WriteBuffer(
+                table_name, TABLE_DEFINITIONS[table_name]["key"], self._batch_write,
+                flush_interval=self.write_flush_interval
+            )
+        return buffer
+
+    def _streams_client(self):
+        """DynamoDB Streams client for the change feed"""
+        return boto3.session.Session().client('dynamodbstreams', **self._resource_kwargs)
+
+    def _stream_arn(self, table_name: str) -> Optional[str]:
+        """Latest stream ARN of a table, if its stream is enabled"""
+        return self.dynamodb.meta.client.describe_table(TableName=table_name)['Table'].get('LatestStreamArn')
+
+    @coalesce
+    async def _read_item(self, table_name: str, key: Dict) -> Tuple[int, Optional[Dict]]:
+        """(cache generation, item) for a read-through cache fill; concurrent misses share the call"""
+        generation = self._item_caches[table_name].generation
+        response = await self._run(table_name, 'get_item', Key=key)
+        return generation, self._decode(table_name, response['Item']) if 'Item' in response else None
+
+    async def _fetch_item(self, table_name: str, key: Dict) -> Optional[Dict]:
+        """Read back an item for a change event"""
+        response = await self._run(table_name, 'get_item', Key=key)
+        return self._decode(table_name, response['Item']) if 'Item' in response else None
+
+    def _invalidate_written(self, table_name: str, operation: str, kwargs: Dict) -> None:
+        """Drop the shops and products a write touched from the read-through caches"""
+        if operation == 'transact_write_items':
+            actions = [next(iter(action.values())) for action in kwargs['TransactItems']]
+            writes = [(action['TableName'], action.get('Key') or action['Item']) for action in actions]
+        elif operation == 'batch_write_item':
+            writes = [
+                (name, request['DeleteRequest']['Key'] if 'DeleteRequest' in request else request['PutRequest']['Item'])
+                for name, requests in kwargs['RequestItems'].items() for request in requests
+            ]
+        else:
+            writes = [(table_name, kwargs.get('Key') or kwargs['Item'])]
+        for name, item in writes:
+            cache = self._item_caches.get(name)
+            if cache is not None:
+                cache.invalidate(item[TABLE_DEFINITIONS[name]["key"]])
+
+    async def _invalidate_cached(self, event: ChangeEvent) -> None:
+        """Change-feed subscriber that drops changed items from the read-through caches"""
+        if event.table == self.shops_table:
+            self.shop_cache.invalidate(event.keys['shop_id'])
+        elif event.table == self.products_table:
+            self.product_cache.invalidate(event.keys['product_id'])
+
+    async def _on_address_change(self, event: ChangeEvent) -> None:
+        """Change-feed subscriber that keeps cached address books current"""
+        if event.new_image is not None:
+            self._patch_address_book(event.new_image['user_id'], upsert=event.new_image)
+            return
+        address_id = event.keys['address_id']
+        if event.old_image is not None:
+            owners = [event.old_image['user_id']]
+        else:
+            # Transactional deletes carry no old image; only books listing the address can hold it
+            owners = self.address_cache.find(lambda book: any(a['address_id'] == address_id for a in book))
+        for user_id in owners:
+            self._patch_address_book(user_id, remove=address_id)
+
+    def _call(self, table_name: str, operation: str, kwargs: Dict, client: bool = False) -> Dict:
+        """Run a table or client operation on the current worker thread"""
+        target = self.dynamodb.meta.client if client else self.dynamodb.Table(table_name)
+        return getattr(target, operation)(**kwargs)
+
+    async def _run(self, table_name: str, operation: str, **kwargs) -> Dict:
+        """Run a blocking table operation without stalling the event loop"""
+        return await self._dispatch(table_name, operation, kwargs, False)
+
+    async def _run_client(self, table_name: str, operation: str, **kwargs) -> Dict:
+        """Run a multi-item client operation (batch/transact) against a table's limit"""
+        return await self._dispatch(table_name, operation, kwargs, True)
+
+    async def _dispatch(self, table_name: str, operation: str, kwargs: Dict, client: bool) -> Dict:
+        """Hand an operation to the worker pool under the table's limits, retrying throttles"""
+        limiter = self._limiter(table_name)
+        budget = self._budget(table_name)
+        loop = asyncio.get_running_loop()
+        kwargs['ReturnConsumedCapacity'] = 'INDEXES'
+        attempt = 0
+        while True:
+            latency_ms = 0.0
+            try:
+                async with self._semaphore(table_name):
+                    # Gate at send time so calls already queued on the
+                    # semaphore also slow down once throttling starts
+                    await limiter.acquire()
+                    started = time.perf_counter()
+                    try:
+                        response = await loop.run_in_executor(
+                            self._executor,
+                            functools.partial(self._call, table_name, operation, kwargs, client)
+                        )
+                    finally:
+                        latency_ms = (time.perf_counter() - started) * 1000
+            except Exception as e:
+                self.metrics.record(table_name, operation, kwargs, latency_ms,
+                                    error=error_code(e) or type(e).__name__)
+                if is_throttle(e):
+                    limiter.on_throttle()
+                attempt += 1
+                if (not is_retryable(e) or attempt >= self.retry_policy.max_attempts
+                        or not budget.withdraw()):
+                    if operation in WRITE_OPERATIONS:
+                        # A failed call may still have been applied
+                        self._invalidate_written(table_name, operation, kwargs)
+                    raise
+                # Back off outside the semaphore so other calls can proceed
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                continue
+            
+            self.metrics.record(table_name, operation, kwargs, latency_ms, response)
+            limiter.on_success()
+            budget.deposit()
+            if operation in WRITE_OPERATIONS:
+                self._invalidate_written(table_name, operation, kwargs)
+                self.change_feed.record_write(table_name, operation, kwargs, response)
+            return response
+
+    async def _batch_get(self, table_name: str, key_name: str, key_values: List[str]) -> List[Dict]:
+        """BatchGetItem up to 100 keys, retrying UnprocessedKeys with backoff"""
+        request = {table_name: {'Keys': [{key_name: value} for value in key_values]}}
+        items = []
+        attempt = 0
+        while request:
+            response = await self._run_client(table_name, 'batch_get_item', RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            
+            request = response.get('UnprocessedKeys') or {}
+            if request:
+                # Unprocessed keys mean the table is throttling part of the batch
+                self._limiter(table_name).on_throttle()
+                attempt += 1
+                if attempt > self.batch_max_retries:
+                    raise RuntimeError(f"BatchGetItem on {table_name} left keys unprocessed")
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+        return items
+    
+    async def _batch_write(self, table_name: str, requests: List[Dict]) -> List[Dict]:
+        """BatchWriteItem up to 25 requests, retrying UnprocessedItems with backoff.
+        
+        Returns the requests still unprocessed once the retries run out.
+        """
+        attempt = 0
+        while requests:
+            response = await self._run_client(table_name, 'batch_write_item',
+                                              RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if requests:
+                self._limiter(table_name).on_throttle()
+                attempt += 1
+                if attempt > self.batch_max_retries:
+                    break
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+        return requests
+    
+    async def _bulk_put(self, table_name: str, items: List[Dict],
+                        deltas: Optional[Callable[[Dict], Dict]] = None) -> List[Dict]:
+        """Write many items through the table's write buffer.
+        
+        Counter deltas of the items that were written are summed and applied
+        once at the end. Raises the first failure after every item settled.
+        """
+        buffer = self._write_buffer(table_name)
+        results = await asyncio.gather(
+            *(buffer.put(self._encode(table_name, item)) for item in items),
+            return_exceptions=True
+        )
+        written = [item for item, result in zip(items, results) if not isinstance(result, BaseException)]
+        if deltas and written:
+            await self._add_stats(stats.merge(*(deltas(item) for item in written)))
+        
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        return items
+    
+    async def _stream(self, table_name: str, operation: str, **kwargs) -> AsyncIterator[Dict]:
+        """Yield every item of a query/scan, fetching pages lazily"""
+        while True:
+            response = await self._run(table_name, operation, **kwargs)
+            for item in response.get('Items', []):
+                yield self._decode(table_name, item)
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return
+            kwargs['ExclusiveStartKey'] = last_key
+    
+    async def _collect(self, table_name: str, operation: str, **kwargs) -> List[Dict]:
+        """Read every page of a query/scan into a list"""
+        return [item async for item in self._stream(table_name, operation, **kwargs)]
+    
+    async def _page(self, table_name: str, operation: str, limit: int,
+                    cursor: Optional[str] = None, **kwargs) -> Dict:
+        """Read up to `limit` items starting at `cursor`"""
+        if cursor:
+            kwargs['ExclusiveStartKey'] = self._decode_cursor(cursor)
+        
+        items = []
+        while True:
+            # Limit counts evaluated items, so a filtered read may need
+            # several round trips to fill the page but never overshoots it
+            kwargs['Limit'] = limit - len(items)
+            response = await self._run(table_name, operation, **kwargs)
+            items.extend(self._decode(table_name, item) for item in response.get('Items', []))
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key or len(items) >= limit:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+        
+        return {
+            "items": items,
+            "next_cursor": self._encode_cursor(last_key) if last_key else None
+        }
+    
+    async def _parallel_scan(self, table_name: str, total_segments: Optional[int] = None,
+                             **kwargs) -> AsyncIterator[Dict]:
+        """Scan a table with concurrent segment workers, yielding items as they arrive"""
+        total_segments = total_segments or self.scan_segments
+        queue: asyncio.Queue = asyncio.Queue(maxsize=total_segments * 100)
+        finished = object()
+        
+        async def scan_segment(segment: int) -> None:
+            try:
+                async for item in self._stream(table_name, 'scan', Segment=segment,
+                                               TotalSegments=total_segments, **kwargs):
+                    await queue.put(item)
+                await queue.put(finished)
+            except Exception as e:
+                await queue.put(e)
+        
+        workers = [asyncio.ensure_future(scan_segment(i)) for i in range(total_segments)]
+        try:
+            remaining = total_segments
+            while remaining:
+                item = await queue.get()
+                if item is finished:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for worker in workers:
+                worker.cancel()
+    
+    def _projection_params(self, attributes: Optional[List[str]]) -> Dict:
+        """ProjectionExpression for reading only the given attributes"""
+        if not attributes:
+            return {}
+        if 'rating' in attributes:
+            attributes = list(attributes) + RATING_ATTRIBUTES
+        names = {f"#p{i}": name for i, name in enumerate(dict.fromkeys(attributes))}
+        return {
+            'ProjectionExpression': ", ".join(names),
+            'ExpressionAttributeNames': names
+        }
+    
+    def _deserialize_wire(self, item: Dict) -> Dict:
+        """Convert a low-level attribute map (e.g. from CancellationReasons) to Python values"""
+        deserializer = TypeDeserializer()
+        return {k: deserializer.deserialize(v) for k, v in item.items()}
+    
+    def _encode_cursor(self, key: Dict) -> str:
+        """Turn a LastEvaluatedKey into an opaque cursor"""
+        serializer = TypeSerializer()
+        wire = {k: serializer.serialize(v) for k, v in key.items()}
+        return base64.urlsafe_b64encode(json.dumps(wire).encode()).decode()
+    
+    def _decode_cursor(self, cursor: str) -> Dict:
+        """Turn an opaque cursor back into an ExclusiveStartKey"""
+        try:
+            wire = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            deserializer = TypeDeserializer()
+            return {k: deserializer.deserialize(v) for k, v in wire.items()}
+        except Exception:
+            raise ValueError("Invalid cursor")
+    
+    async def _update_item(self, table_name: str, key: Dict, updates: Dict) -> Optional[Dict]:
+        """SET the given fields on an existing item and return the new item"""
+        names = {'#pk': next(iter(key))}
+        values = {}
+        assignments = []
+        for i, (field, value) in enumerate(updates.items()):
+            if field in key:
+                continue
+            names[f"#f{i}"] = field
+            values[f":v{i}"] = self._codecs[table_name].encode_field(field, value)
+            assignments.append(f"#f{i} = :v{i}")
+        
+        if not assignments:
+            response = await self._run(table_name, 'get_item', Key=key)
+            return self._decode(table_name, response['Item']) if 'Item' in response else None
+        
+        try:
+            response = await self._run(table_name, 'update_item',
+                Key=key,
+                UpdateExpression="SET " + ", ".join(assignments),
+                ConditionExpression="attribute_exists(#pk)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise
+        
+        return self._decode(table_name, response['Attributes'])
+    
+    def _encode(self, table_name: str, data: Any) -> Dict:
+        """Convert model data into a DynamoDB item for the given table"""
+        item = self._codecs[table_name].encode(data)
+        # Index keys cannot be NULL; leaving them out keeps the item off that index
+        for name in self._index_keys.get(table_name, ()):
+            if name in item and item[name] is None:
+                del item[name]
+        return item
+    
+    def _decode(self, table_name: str, item: Dict) -> Dict:
+        """Convert a DynamoDB item from the given table into native values"""
+        codec = self._codecs.get(table_name)
+        item = codec.decode(item) if codec else decode_value(item)
+        if 'rating_sum' in item:
+            self._derive_rating(item)
+        return item
+    
+    def _derive_rating(self, item: Dict) -> None:
+        """Replace the stored review aggregates with the average and a star histogram"""
+        total = item.get('total_reviews') or 0
+        rating_sum = decode_value(item.pop('rating_sum'))
+        item['rating'] = round(rating_sum / total, 2) if total > 0 else 0.0
+        item['rating_histogram'] = {
+            str(star): decode_value(item.pop(f'rating_star_{star}', 0)) for star in RATING_STARS
+        }
+    
+    def _stats_updates(self, deltas: Dict[str, Dict[str, float]]) -> List[Dict]:
+        """TransactWriteItems Updates that ADD counter deltas to stats items"""
+        updates = []
+        for scope, counters in deltas.items():
+            names = {f"#c{i}": name for i, name in enumerate(counters)}
+            values = {f":c{i}": value for i, value in enumerate(stats.encode_counters(counters).values())}
+            updates.append({
+                'Update': {
+                    'TableName': self.stats_table,
+                    'Key': {'stat_id': stats.write_key(scope)},
+                    'UpdateExpression': "ADD " + ", ".join(f"#c{i} :c{i}" for i in range(len(counters))),
+                    'ExpressionAttributeNames': names,
+                    'ExpressionAttributeValues': values
+                }
+            })
+        return updates
+    
+    async def _write_with_stats(self, table_name: str, action: Dict,
+                                deltas: Dict[str, Dict[str, float]]) -> None:
+        """Apply one write and its counter deltas atomically"""
+        await self._transact([action] + self._stats_updates(deltas), table_name=table_name)
+    
+    async def _add_stats(self, deltas: Dict[str, Dict[str, float]]) -> None:
+        """Apply counter deltas on their own, for writes that cannot carry them"""
+        updates = self._stats_updates(deltas)
+        await asyncio.gather(*(
+            self._transact(updates[i:i + self.transaction_max_items], table_name=self.stats_table)
+            for i in range(0, len(updates), self.transaction_max_items)
+        ))
+    
+    def _condition_failed(self, error: ClientError, index: int = 0) -> bool:
+        """True when a transaction was cancelled by the condition of its `index`-th action"""
+        reasons = error.response.get('CancellationReasons') or []
+        return (error.response['Error']['Code'] == 'TransactionCanceledException'
+                and index < len(reasons) and reasons[index].get('Code') == 'ConditionalCheckFailed')
+    
+    @coalesce
+    async def get_stats(self, scope: str) -> Dict[str, Any]:
+        """Counters of one stats scope (missing counters are zero)"""
+        items = await self._batch_get(self.stats_table, 'stat_id', stats.item_keys(scope))
+        counters = [decode_value(item) for item in items]
+        for item in counters:
+            del item['stat_id']
+        return stats.merge(*({scope: item} for item in counters)).get(scope, {})
+    
+    async def put_stats(self, key: str, counters: Dict[str, float]) -> None:
+        """Overwrite a stats item, used by the rebuild job"""
+        await self._write_buffer(self.stats_table).put({'stat_id': key, **stats.encode_counters(counters)})
+    
+    async def get_all_stats(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Every stats item"""
+        return [item async for item in
+                self._parallel_scan(self.stats_table, **self._projection_params(attributes))]
     
     # User operations
     async def create_user(self, user: BaseUser) -> Dict:
         """Create a new user"""
         user_data = user.dict()
-        user_data = {k: self._serialize_datetime(v) for k, v in user_data.items()}
-        
-        self.users_table.put_item(Item=user_data)
+        put = {
+            'Put': {
+                'TableName': self.users_table,
+                'Item': self._encode(self.users_table, user_data),
+                'ConditionExpression': 'attribute_not_exists(user_id)'
+            }
+        }
+        try:
+            await self._write_with_stats(self.users_table, put, stats.user_deltas())
+        except ClientError as e:
+            # A concurrent first login already created (and counted) the user
+            if not self._condition_failed(e):
+                raise
+            return await self.get_user(user_data['user_id'])
         return user_data
     
+    async def create_users(self, users: List[BaseUser]) -> List[Dict]:
+        """Bulk-create users (imports, seeding); existing users are overwritten and counted again"""
+        return await self._bulk_put(self.users_table, [user.dict() for user in users],
+                                    lambda user: stats.user_deltas())
+    
     async def get_user(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
-        response = self.users_table.get_item(Key={'user_id': user_id})
+        response = await self._run(self.users_table, 'get_item', Key={'user_id': user_id})
         if 'Item' in response:
-            return self._deserialize_datetime(response['Item'])
+            return self._decode(self.users_table, response['Item'])
         return None
     
     async def update_user(self, user_id: str, updates: Dict) -> Optional[Dict]:
         """Update user data"""
-        update_expression = "SET "
-        expression_values = {}
-        
-        for key, value in updates.items():
-            if key != 'user_id':
-                update_expression += f"#{key} = :{key}, "
-                expression_values[f":{key}"] = self._serialize_datetime(value)
-                expression_values[f"#{key}"] = key
-        
-        update_expression = update_expression.rstrip(", ")
-        
-        response = self.users_table.update_item(
-            Key={'user_id': user_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_values,
-            ExpressionAttributeNames={v: k for k, v in expression_values.items() if k.startswith('#')},
-            ReturnValues="ALL_NEW"
-        )
+        return await self._update_item(self.users_table, {'user_id': user_id}, updates)
+    
+    def stream_all_users(self, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every user using a parallel segmented scan"""
+        return self._parallel_scan(self.users_table, **self._projection_params(attributes))
+    
+    async def get_all_users(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get every user"""
+        return [user async for user in self.stream_all_users(attributes)]
+    
+    # Address operations
+    async def _default_address_id(self, user_id: str) -> Optional[str]:
+        """The user's current default address, read consistently before changing it"""
+        response = await self._run(self.users_table, 'get_item', Key={'user_id': user_id},
+                                   ConsistentRead=True, **self._projection_params(['default_address_id']))
+        return response.get('Item', {}).get('default_address_id')
+    
+    def _default_address_updates(self, user_id: str, old_id: Optional[str],
+                                 new_id: Optional[str]) -> List[Dict]:
+        """Move the user's default pointer from old_id to new_id and clear the old address's flag.
         
-        if 'Attributes' in response:
-            return self._deserialize_datetime(response['Attributes'])
-        return None
+        The user Update comes first and only applies if the default is still
+        old_id, so concurrent changes fail (and are retried) instead of
+        leaving two defaults.
+        """
+        if old_id is None:
+            # Users written from the model store an unset default as NULL
+            condition = ('attribute_exists(user_id) AND (attribute_not_exists(default_address_id)'
+                         ' OR attribute_type(default_address_id, :null))')
+            values = {':null': 'NULL'}
+        else:
+            condition = 'default_address_id = :old'
+            values = {':old': old_id}
+        update = {
+            'TableName': self.users_table,
+            'Key': {'user_id': user_id},
+            'ConditionExpression': condition
+        }
+        if new_id is None:
+            update['UpdateExpression'] = 'REMOVE default_address_id'
+        else:
+            update['UpdateExpression'] = 'SET default_address_id = :new'
+            values[':new'] = new_id
+        if values:
+            update['ExpressionAttributeValues'] = values
+        
+        updates = [{'Update': update}]
+        if old_id is not None and old_id != new_id:
+            updates.append({
+                'Update': {
+                    'TableName': self.addresses_table,
+                    'Key': {'address_id': old_id},
+                    'UpdateExpression': 'SET is_default = :false',
+                    'ConditionExpression': 'attribute_exists(address_id)',
+                    'ExpressionAttributeValues': {':false': False}
+                }
+            })
+        return updates
+    
+    async def create_address(self, address: Address) -> Dict:
+        """Create an address; the user's first address, or one marked default, becomes the default"""
+        address_data = address.dict()
+        user_id = address_data['user_id']
+        for _ in range(self.status_update_retries):
+            current = await self._default_address_id(user_id)
+            address_data['is_default'] = address_data['is_default'] or current is None
+            item = self._encode(self.addresses_table, address_data)
+            if not address_data['is_default']:
+                await self._run(self.addresses_table, 'put_item', Item=item,
+                                ConditionExpression='attribute_not_exists(address_id)')
+                self._patch_address_book(user_id, upsert=address_data)
+                return address_data
+            
+            put = {
+                'Put': {
+                    'TableName': self.addresses_table,
+                    'Item': item,
+                    'ConditionExpression': 'attribute_not_exists(address_id)'
+                }
+            }
+            try:
+                await self._run_client(self.addresses_table, 'transact_write_items',
+                                       TransactItems=self._default_address_updates(
+                                           user_id, current, address_data['address_id']) + [put])
+            except ClientError as e:
+                if self._condition_failed(e):
+                    continue
+                raise
+            self._patch_address_book(user_id, upsert=address_data, default=address_data['address_id'])
+            return address_data
+        raise RuntimeError(f"Default address of user {user_id} kept changing, address not created")
+    
+    async def get_addresses(self, user_id: str) -> List[Dict]:
+        """A user's address book, default first (read-through cached, returns copies)"""
+        addresses = self.address_cache.get(user_id)
+        if addresses is MISSING or addresses is None:
+            addresses = await self._collect(self.addresses_table, 'query',
+                                            IndexName='user_id-index',
+                                            KeyConditionExpression=Key('user_id').eq(user_id))
+            addresses.sort(key=self._address_order)
+            self.address_cache.set(user_id, addresses)
+        return [dict(address) for address in addresses]
+    
+    async def get_address(self, user_id: str, address_id: str) -> Optional[Dict]:
+        """One of a user's addresses, from the cached address book"""
+        address = next((a for a in await self.get_addresses(user_id) if a['address_id'] == address_id), None)
+        if address is None:
+            # Possibly added through another process since the book was cached
+            self.address_cache.invalidate(user_id)
+            address = next((a for a in await self.get_addresses(user_id) if a['address_id'] == address_id), None)
+        return address
+    
+    async def set_default_address(self, user_id: str, address_id: str) -> Optional[Dict]:
+        """Make one of the user's addresses the default; None if it is not theirs"""
+        for _ in range(self.status_update_retries):
+            current = await self._default_address_id(user_id)
+            updates = self._default_address_updates(user_id, current, address_id)
+            updates.insert(1, {
+                'Update': {
+                    'TableName': self.addresses_table,
+                    'Key': {'address_id': address_id},
+                    'UpdateExpression': 'SET is_default = :true',
+                    'ConditionExpression': 'user_id = :user_id',
+                    'ExpressionAttributeValues': {':true': True, ':user_id': user_id}
+                }
+            })
+            try:
+                await self._run_client(self.addresses_table, 'transact_write_items', TransactItems=updates)
+            except ClientError as e:
+                if self._condition_failed(e, 1):
+                    return None
+                if self._condition_failed(e):
+                    continue
+                raise
+            self._patch_address_book(user_id, default=address_id)
+            address = await self.get_address(user_id, address_id)
+            if address is not None:
+                address['is_default'] = True
+            return address
+        raise RuntimeError(f"Default address of user {user_id} kept changing, update abandoned")
+    
+    async def delete_address(self, user_id: str, address_id: str) -> bool:
+        """Delete one of the user's addresses, clearing the default if it was the default"""
+        for _ in range(self.status_update_retries):
+            current = await self._default_address_id(user_id)
+            updates = [{
+                'Delete': {
+                    'TableName': self.addresses_table,
+                    'Key': {'address_id': address_id},
+                    'ConditionExpression': 'user_id = :user_id',
+                    'ExpressionAttributeValues': {':user_id': user_id}
+                }
+            }]
+            if current == address_id:
+                # Only the user's pointer; the address itself is being deleted
+                updates = self._default_address_updates(user_id, current, None)[:1] + updates
+            try:
+                await self._run_client(self.addresses_table, 'transact_write_items', TransactItems=updates)
+            except ClientError as e:
+                if self._condition_failed(e, len(updates) - 1):
+                    return False
+                if self._condition_failed(e):
+                    continue
+                raise
+            self._patch_address_book(user_id, remove=address_id)
+            return True
+        raise RuntimeError(f"Default address of user {user_id} kept changing, delete abandoned")
+    
+    @staticmethod
+    def _address_order(address: Dict):
+        return (not address['is_default'], -address['created_at'].timestamp())
+    
+    def _patch_address_book(self, user_id: str, upsert: Optional[Dict] = None,
+                            remove: Optional[str] = None, default: Optional[str] = None) -> None:
+        """Apply a change to a cached address book instead of re-reading it.
+        
+        The book comes from an eventually consistent index, so a query right
+        after a write could cache the old book again.
+        """
+        book = self.address_cache.get(user_id)
+        if book is MISSING or book is None:
+            return
+        replaced = {remove, upsert['address_id'] if upsert else None}
+        book = [dict(a) for a in book if a['address_id'] not in replaced]
+        if upsert is not None:
+            book.append(dict(upsert))
+        if default is not None:
+            for address in book:
+                address['is_default'] = address['address_id'] == default
+        book.sort(key=self._address_order)
+        self.address_cache.set(user_id, book)
     
     # Shop operations
     async def create_shop(self, shop: Shop) -> Dict:
         """Create a new shop"""
         shop_data = shop.dict()
-        shop_data = {k: self._serialize_datetime(v) for k, v in shop_data.items()}
+        shop_data.update(geo.cell_attributes(shop_data['latitude'], shop_data['longitude']))
+        put = {
+            'Put': {
+                'TableName': self.shops_table,
+                'Item': self._encode(self.shops_table, shop_data),
+                'ConditionExpression': 'attribute_not_exists(shop_id)'
+            }
+        }
         
-        self.shops_table.put_item(Item=shop_data)
+        await self._write_with_stats(self.shops_table, put, stats.shop_deltas(shop_data))
         return shop_data
     
+    async def create_shops(self, shops: List[Shop]) -> List[Dict]:
+        """Bulk-create shops (imports, seeding); existing shops are overwritten and counted again"""
+        shops_data = [shop.dict() for shop in shops]
+        for shop_data in shops_data:
+            shop_data.update(geo.cell_attributes(shop_data['latitude'], shop_data['longitude']))
+        return await self._bulk_put(self.shops_table, shops_data, stats.shop_deltas)
+    
     async def get_shop(self, shop_id: str) -> Optional[Dict]:
-        """Get shop by ID"""
-        response = self.shops_table.get_item(Key={'shop_id': shop_id})
-        if 'Item' in response:
-            return self._deserialize_datetime(response['Item'])
-        return None
+        """Get shop by ID (read-through cached, returns a shallow copy)"""
+        cached = self.shop_cache.get(shop_id)
+        if cached is not MISSING:
+            return dict(cached) if cached is not None else None
+        
+        generation, shop = await self._read_item(self.shops_table, {'shop_id': shop_id})
+        self.shop_cache.set(shop_id, shop, generation)
+        return dict(shop) if shop is not None else None
+    
+    async def update_shop(self, shop_id: str, updates: Dict) -> Optional[Dict]:
+        """Update shop details, moving the shop to its new geohash cell if it moved"""
+        updates = {k: v for k, v in updates.items() if k not in RATING_FIELDS}
+        if 'latitude' in updates or 'longitude' in updates:
+            location = {k: updates.get(k) for k in ('latitude', 'longitude')}
+            if None in location.values():
+                response = await self._run(self.shops_table, 'get_item', Key={'shop_id': shop_id},
+                                           ConsistentRead=True,
+                                           **self._projection_params(['latitude', 'longitude']))
+                if 'Item' not in response:
+                    return None
+                current = self._decode(self.shops_table, response['Item'])
+                location = {k: v if v is not None else current[k] for k, v in location.items()}
+            updates = {**updates, **geo.cell_attributes(location['latitude'], location['longitude'])}
+        return await self._update_item(self.shops_table, {'shop_id': shop_id}, updates)
+    
+    def _shops_by_merchant_params(self, merchant_id: str, attributes: Optional[List[str]] = None) -> Dict:
+        """Query parameters for a merchant's shops"""
+        return {
+            'IndexName': 'merchant_id-index',
+            'KeyConditionExpression': Key('merchant_id').eq(merchant_id),
+            **self._projection_params(attributes)
+        }
     
-    async def get_shops_by_merchant(self, merchant_id: str) -> List[Dict]:
+    async def get_shops_by_merchant(self, merchant_id: str, attributes: Optional[List[str]] = None) -> List[Dict]:
         """Get all shops for a merchant"""
-        response = self.shops_table.query(
-            IndexName='merchant_id-index',
-            KeyConditionExpression=Key('merchant_id').eq(merchant_id)
-        )
-        
-        shops = []
-        for item in response.get('Items', []):
-            shops.append(self._deserialize_datetime(item))
-        
-        return shops
+        return await self._collect(self.shops_table, 'query', **self._shops_by_merchant_params(merchant_id, attributes))
     
-    async def get_approved_shops(self, category: Optional[str] = None) -> List[Dict]:
-        """Get all approved shops, optionally filtered by category"""
+    def stream_shops_by_merchant(self, merchant_id: str, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream all shops for a merchant"""
+        return self._stream(self.shops_table, 'query', **self._shops_by_merchant_params(merchant_id, attributes))
+    
+    async def get_shops_by_merchant_page(self, merchant_id: str, limit: int = 50,
+                                         cursor: Optional[str] = None,
+                                         attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of shops for a merchant"""
+        return await self._page(self.shops_table, 'query', limit, cursor,
+                                **self._shops_by_merchant_params(merchant_id, attributes))
+    
+    def _shops_by_status_params(self, status: str, category: Optional[str] = None,
+                                attributes: Optional[List[str]] = None) -> Dict:
+        """Query parameters for shops in a status on the status/category index"""
+        condition = Key('status').eq(status)
         if category:
-            response = self.shops_table.scan(
-                FilterExpression=Attr('status').eq('approved') & Attr('category').eq(category)
-            )
-        else:
-            response = self.shops_table.scan(
-                FilterExpression=Attr('status').eq('approved')
-            )
+            condition = condition & Key('category').eq(category)
+        return {
+            'IndexName': 'status-category-index',
+            'KeyConditionExpression': condition,
+            **self._projection_params(attributes)
+        }
+    
+    async def get_approved_shops(self, category: Optional[str] = None,
+                                 attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get all approved shops, optionally filtered by category"""
+        return await self.get_shops_by_status('approved', category, attributes)
+    
+    def stream_approved_shops(self, category: Optional[str] = None,
+                              attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream approved shops, optionally filtered by category"""
+        return self._stream(self.shops_table, 'query',
+                            **self._shops_by_status_params('approved', category, attributes))
+    
+    @coalesce
+    async def get_approved_shops_page(self, category: Optional[str] = None, limit: int = 50,
+                                      cursor: Optional[str] = None,
+                                      attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of approved shops, optionally filtered by category"""
+        return await self._page(self.shops_table, 'query', limit, cursor,
+                                **self._shops_by_status_params('approved', category, attributes))
+    
+    @coalesce
+    async def get_shops_near(self, lat: float, lng: float, radius_km: float,
+                             attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Approved shops within `radius_km` whose delivery radius reaches the point, nearest first.
         
-        shops = []
-        for item in response.get('Items', []):
-            shops.append(self._deserialize_datetime(item))
+        Only the geohash cells covering the circle are queried; each result
+        carries its `distance_km`.
+        """
+        params = {'FilterExpression': Attr('status').eq('approved')}
+        params.update(self._projection_params(
+            with_fields(attributes, 'latitude', 'longitude', 'delivery_radius')
+        ))
+        
+        def cell_query(cell: str) -> Dict:
+            condition = Key('geohash4').eq(cell[:geo.PARTITION_PRECISION])
+            if len(cell) > geo.PARTITION_PRECISION:
+                condition = condition & Key('geohash').begins_with(cell)
+            return {'IndexName': 'geohash4-geohash-index', 'KeyConditionExpression': condition, **params}
+        
+        cells = geo.covering_cells(lat, lng, radius_km)
+        candidates = await asyncio.gather(*(
+            self._collect(self.shops_table, 'query', **cell_query(cell)) for cell in cells
+        ))
         
+        shops = []
+        for shop in (shop for cell_shops in candidates for shop in cell_shops):
+            distance = geo.distance_km(lat, lng, shop['latitude'], shop['longitude'])
+            if distance <= radius_km and distance <= shop['delivery_radius']:
+                shop['distance_km'] = round(distance, 3)
+                shops.append(shop)
+        shops.sort(key=lambda shop: shop['distance_km'])
         return shops
     
+    @coalesce
+    async def get_shops_by_status(self, status: str, category: Optional[str] = None,
+                                  attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get all shops in an approval status, optionally filtered by category"""
+        return await self._collect(self.shops_table, 'query',
+                                   **self._shops_by_status_params(status, category, attributes))
+    
+    def stream_all_shops(self, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every shop using a parallel segmented scan"""
+        return self._parallel_scan(self.shops_table, **self._projection_params(attributes))
+    
+    async def get_all_shops(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get every shop"""
+        return [shop async for shop in self.stream_all_shops(attributes)]
+    
+    async def get_all_shops_page(self, limit: int = 50, cursor: Optional[str] = None,
+                                 attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of shops in table order"""
+        return await self._page(self.shops_table, 'scan', limit, cursor, **self._projection_params(attributes))
+    
+    def _status_update(self, table_name: str, key: Dict, old_status: str, status: str,
+                       updated_at: datetime) -> Dict:
+        """TransactWriteItems Update that moves an item from old_status to status"""
+        return {
+            'Update': {
+                'TableName': table_name,
+                'Key': key,
+                'UpdateExpression': "SET #status = :status, #updated_at = :updated_at",
+                # Counters move from old_status, so it must still be current
+                'ConditionExpression': "#status = :old_status",
+                'ExpressionAttributeNames': {'#status': 'status', '#updated_at': 'updated_at'},
+                'ExpressionAttributeValues': {
+                    ':status': status,
+                    ':old_status': old_status,
+                    ':updated_at': updated_at.isoformat()
+                }
+            }
+        }
+    
     async def update_shop_status(self, shop_id: str, status: str) -> Optional[Dict]:
         """Update shop approval status"""
-        response = self.shops_table.update_item(
-            Key={'shop_id': shop_id},
-            UpdateExpression="SET #status = :status, #updated_at = :updated_at",
-            ExpressionAttributeValues={
-                ':status': status,
-                ':updated_at': self._serialize_datetime(datetime.utcnow())
-            },
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#updated_at': 'updated_at'
-            },
-            ReturnValues="ALL_NEW"
-        )
-        
-        if 'Attributes' in response:
-            return self._deserialize_datetime(response['Attributes'])
-        return None
+        status = getattr(status, 'value', status)
+        for _ in range(self.status_update_retries):
+            # Read the current status straight from the table, not the cache
+            response = await self._run(self.shops_table, 'get_item', Key={'shop_id': shop_id},
+                                       ConsistentRead=True)
+            if 'Item' not in response:
+                return None
+            shop = self._decode(self.shops_table, response['Item'])
+            
+            updated_at = datetime.utcnow()
+            update = self._status_update(self.shops_table, {'shop_id': shop_id},
+                                         shop['status'], status, updated_at)
+            try:
+                await self._write_with_stats(self.shops_table, update,
+                                             stats.shop_status_deltas(shop, status))
+            except ClientError as e:
+                if self._condition_failed(e):
+                    continue
+                raise
+            
+            shop.update(status=status, updated_at=updated_at)
+            return shop
+        raise RuntimeError(f"Shop {shop_id} status kept changing, update abandoned")
     
     # Product operations
     async def create_product(self, product: Product) -> Dict:
         """Create a new product"""
         product_data = product.dict()
-        product_data = {k: self._serialize_datetime(v) for k, v in product_data.items()}
         
-        self.products_table.put_item(Item=product_data)
+        await self._run(self.products_table, 'put_item', Item=self._encode(self.products_table, product_data))
         return product_data
     
+    async def create_products(self, products: List[Product]) -> List[Dict]:
+        """Bulk-create products (imports, seeding)"""
+        return await self._bulk_put(self.products_table, [product.dict() for product in products])
+    
     async def get_product(self, product_id: str) -> Optional[Dict]:
-        """Get product by ID"""
-        response = self.products_table.get_item(Key={'product_id': product_id})
-        if 'Item' in response:
-            return self._deserialize_datetime(response['Item'])
-        return None
+        """Get product by ID (read-through cached, returns a shallow copy)"""
+        cached = self.product_cache.get(product_id)
+        if cached is not MISSING:
+            return dict(cached) if cached is not None else None
+        
+        generation, product = await self._read_item(self.products_table, {'product_id': product_id})
+        self.product_cache.set(product_id, product, generation)
+        return dict(product) if product is not None else None
     
-    async def get_products_by_shop(self, shop_id: str) -> List[Dict]:
-        """Get all products for a shop"""
-        response = self.products_table.query(
-            IndexName='shop_id-index',
-            KeyConditionExpression=Key('shop_id').eq(shop_id)
-        )
+    async def get_products_batch(self, product_ids: List[str]) -> Dict[str, Dict]:
+        """Get many products by ID in as few round trips as possible"""
+        products = {}
+        missing_ids = []
+        for product_id in dict.fromkeys(product_ids):
+            cached = self.product_cache.get(product_id)
+            if cached is MISSING:
+                missing_ids.append(product_id)
+            elif cached is not None:
+                products[product_id] = dict(cached)
         
-        products = []
-        for item in response.get('Items', []):
-            products.append(self._deserialize_datetime(item))
+        generation = self.product_cache.generation
+        chunks = [missing_ids[i:i + 100] for i in range(0, len(missing_ids), 100)]
+        results = await asyncio.gather(
+            *(self._batch_get(self.products_table, 'product_id', chunk) for chunk in chunks)
+        )
         
+        fetched = {}
+        for items in results:
+            for item in items:
+                fetched[item['product_id']] = self._decode(self.products_table, item)
+        for product_id in missing_ids:
+            product = fetched.get(product_id)
+            self.product_cache.set(product_id, product, generation)
+            if product is not None:
+                products[product_id] = dict(product)
         return products
     
+    async def update_product(self, product_id: str, updates: Dict) -> Optional[Dict]:
+        """Update product details (review aggregates are left alone)"""
+        updates = {k: v for k, v in updates.items() if k not in RATING_FIELDS}
+        return await self._update_item(self.products_table, {'product_id': product_id}, updates)
+    
+    async def set_rating_aggregates(self, table_name: str, key: Dict, aggregates: Dict) -> Optional[Dict]:
+        """Overwrite a shop's or product's stored review aggregates (used by rating rebuilds only)"""
+        return await self._update_item(table_name, key, aggregates)
+    
+    def stream_all_products(self, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every product using a parallel segmented scan"""
+        return self._parallel_scan(self.products_table, **self._projection_params(attributes))
+    
+    async def get_all_products(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get every product"""
+        return [product async for product in self.stream_all_products(attributes)]
+    
+    def _products_by_shop_params(self, shop_id: str, attributes: Optional[List[str]] = None) -> Dict:
+        """Query parameters for a shop's products"""
+        return {
+            'IndexName': 'shop_id-index',
+            'KeyConditionExpression': Key('shop_id').eq(shop_id),
+            **self._projection_params(attributes)
+        }
+    
+    @coalesce
+    async def get_products_by_shop(self, shop_id: str, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get all products for a shop"""
+        return await self._collect(self.products_table, 'query', **self._products_by_shop_params(shop_id, attributes))
+    
+    def stream_products_by_shop(self, shop_id: str, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream all products for a shop"""
+        return self._stream(self.products_table, 'query', **self._products_by_shop_params(shop_id, attributes))
+    
+    @coalesce
+    async def get_products_by_shop_page(self, shop_id: str, limit: int = 50,
+                                        cursor: Optional[str] = None,
+                                        attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of products for a shop"""
+        return await self._page(self.products_table, 'query', limit, cursor,
+                                **self._products_by_shop_params(shop_id, attributes))
+    
     # Order operations
     async def create_order(self, order: Order) -> Dict:
         """Create a new order"""
         order_data = order.dict()
-        order_data = {k: self._serialize_datetime(v) for k, v in order_data.items()}
+        shop = await self.get_shop(order_data['shop_id'])
+        put = {
+            'Put': {
+                'TableName': self.orders_table,
+                'Item': self._encode(self.orders_table, order_data),
+                'ConditionExpression': 'attribute_not_exists(order_id)'
+            }
+        }
         
-        self.orders_table.put_item(Item=order_data)
+        await self._write_with_stats(self.orders_table, put,
+                                     stats.order_deltas(order_data, shop['merchant_id'] if shop else None))
         return order_data
     
-    async def get_order(self, order_id: str) -> Optional[Dict]:
-        """Get order by ID"""
-        response = self.orders_table.get_item(Key={'order_id': order_id})
-        if 'Item' in response:
-            return self._deserialize_datetime(response['Item'])
-        return None
+    async def create_orders(self, orders: List[Order]) -> List[Dict]:
+        """Bulk-create orders (imports, migrations); existing orders are overwritten and counted again"""
+        orders_data = [order.dict() for order in orders]
+        shop_ids = list({order['shop_id'] for order in orders_data})
+        shops = await asyncio.gather(*(self.get_shop(shop_id) for shop_id in shop_ids))
+        merchant_of = {shop_id: shop['merchant_id'] for shop_id, shop in zip(shop_ids, shops) if shop}
+        return await self._bulk_put(self.orders_table, orders_data,
+                                    lambda order: stats.order_deltas(order, merchant_of.get(order['shop_id'])))
     
-    async def get_orders_by_customer(self, customer_id: str) -> List[Dict]:
-        """Get all orders for a customer"""
-        response = self.orders_table.query(
-            IndexName='customer_id-index',
-            KeyConditionExpression=Key('customer_id').eq(customer_id)
+    async def place_order(self, order: Order, products: Dict[str, Dict]) -> Dict:
+        """Reserve stock for every line and write the order in one transaction.
+        
+        ``products`` maps product_id to the product items the order was priced
+        from; they are only used to locate each variant inside the product's
+        variants list, the stock itself is checked by DynamoDB at commit time.
+        Raises OrderPlacementError with one entry per failing line.
+        """
+        order_data = order.dict()
+        
+        # Several lines may hit the same product, but a transaction can only
+        # touch each item once, so quantities are summed per variant
+        reservations: Dict[str, Dict[int, Dict]] = {}
+        for line in order_data['items']:
+            variants = products[line['product_id']]['variants']
+            index = next(i for i, v in enumerate(variants) if v['variant_id'] == line['variant_id'])
+            per_product = reservations.setdefault(line['product_id'], {})
+            entry = per_product.setdefault(index, {'variant_id': line['variant_id'], 'quantity': 0})
+            entry['quantity'] += line['quantity']
+        
+        updates = [self._stock_update(product_id, variants, -1, True)
+                   for product_id, variants in reservations.items()]
+        order_put = {
+            'Put': {
+                'TableName': self.orders_table,
+                'Item': self._encode(self.orders_table, order_data),
+                'ConditionExpression': 'attribute_not_exists(order_id)'
+            }
+        }
+        shop = await self.get_shop(order_data['shop_id'])
+        order_writes = [order_put] + self._stats_updates(
+            stats.order_deltas(order_data, shop['merchant_id'] if shop else None)
         )
         
-        orders = []
-        for item in response.get('Items', []):
-            orders.append(self._deserialize_datetime(item))
+        # Keep the order write (and its counters) in the last chunk so it only
+        # lands once every reservation before it has committed
+        size = self.transaction_max_items
+        chunks = [updates[i:i + size] for i in range(0, len(updates), size)] or [[]]
+        if len(chunks[-1]) + len(order_writes) > size:
+            chunks.append([])
+        chunks[-1].extend(order_writes)
         
-        return orders
-    
-    async def get_orders_by_shop(self, shop_id: str, status: Optional[str] = None) -> List[Dict]:
-        """Get all orders for a shop, optionally filtered by status"""
-        if status:
-            response = self.orders_table.query(
-                IndexName='shop_id-index',
-                KeyConditionExpression=Key('shop_id').eq(shop_id),
-                FilterExpression=Attr('status').eq(status)
-            )
-        else:
-            response = self.orders_table.query(
-                IndexName='shop_id-index',
-                KeyConditionExpression=Key('shop_id').eq(shop_id)
+        committed: List[str] = []
+        number = 0
+        try:
+            for number, chunk in enumerate(chunks):
+                await self._transact(chunk, f"{order_data['order_id']}-{number}")
+                committed.extend(u['Update']['Key']['product_id'] for u in chunk
+                                 if 'Update' in u and u['Update']['TableName'] == self.products_table)
+        except ClientError as e:
+            if committed:
+                await self._release_stock({pid: reservations[pid] for pid in committed})
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            raise OrderPlacementError(
+                self._reservation_failures(chunks[number], e.response.get('CancellationReasons', []),
+                                           reservations)
             )
         
-        orders = []
-        for item in response.get('Items', []):
-            orders.append(self._deserialize_datetime(item))
+        return order_data
+    
+    def _stock_update(self, product_id: str, variants: Dict[int, Dict], sign: int,
+                      conditional: bool) -> Dict:
+        """TransactWriteItems Update that moves stock for some variants of one product"""
+        names = {'#v': 'variants', '#sq': 'stock_quantity', '#vid': 'variant_id'}
+        values = {}
+        assignments = []
+        conditions = ['attribute_exists(product_id)']
+        for index, entry in variants.items():
+            values[f":q{index}"] = entry['quantity']
+            values[f":id{index}"] = entry['variant_id']
+            op = '-' if sign < 0 else '+'
+            assignments.append(f"#v[{index}].#sq = #v[{index}].#sq {op} :q{index}")
+            conditions.append(f"#v[{index}].#vid = :id{index}")
+            if conditional:
+                conditions.append(f"#v[{index}].#sq >= :q{index}")
         
-        return orders
+        return {
+            'Update': {
+                'TableName': self.products_table,
+                'Key': {'product_id': product_id},
+                'UpdateExpression': "SET " + ", ".join(assignments),
+                'ConditionExpression': " AND ".join(conditions),
+                'ExpressionAttributeNames': names,
+                'ExpressionAttributeValues': values,
+                'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+            }
+        }
+    
+    async def _transact(self, items: List[Dict], token: Optional[str] = None,
+                        table_name: Optional[str] = None) -> None:
+        """TransactWriteItems, retrying when it loses a race or is throttled (cancelled attempts apply nothing)"""
+        table_name = table_name or self.products_table
+        params = {'ClientRequestToken': token} if token else {}
+        attempt = 0
+        while True:
+            try:
+                await self._run_client(table_name, 'transact_write_items', TransactItems=items, **params)
+                return
+            except ClientError as e:
+                reasons = e.response.get('CancellationReasons', [])
+                codes = {r.get('Code') for r in reasons} - {None, 'None'}
+                retryable = codes and codes <= {'TransactionConflict'} | THROTTLE_CODES
+                if codes & THROTTLE_CODES:
+                    self._limiter(table_name).on_throttle()
+                attempt += 1
+                if not retryable or attempt > self.transaction_conflict_retries:
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+    
+    async def _release_stock(self, reservations: Dict[str, Dict[int, Dict]]) -> None:
+        """Give back stock reserved by chunks that committed before a later chunk failed"""
+        updates = [self._stock_update(product_id, variants, 1, False)
+                   for product_id, variants in reservations.items()]
+        for i in range(0, len(updates), self.transaction_max_items):
+            await self._run_client(self.products_table, 'transact_write_items',
+                                   TransactItems=updates[i:i + self.transaction_max_items])
+    
+    def _reservation_failures(self, chunk: List[Dict], reasons: List[Dict],
+                              reservations: Dict[str, Dict[int, Dict]]) -> List[Dict]:
+        """Turn CancellationReasons into one failure entry per affected order line"""
+        failures = []
+        for action, reason in zip(chunk, reasons):
+            code = reason.get('Code')
+            if code in (None, 'None'):
+                continue
+            
+            if 'Put' in action:
+                failures.append({"reason": "duplicate_order" if code == 'ConditionalCheckFailed' else code})
+                continue
+            if action['Update']['TableName'] != self.products_table:
+                failures.append({"reason": code})
+                continue
+            
+            product_id = action['Update']['Key']['product_id']
+            old_item = self._deserialize_wire(reason['Item']) if reason.get('Item') else None
+            for index, entry in reservations[product_id].items():
+                failure = {
+                    "product_id": product_id,
+                    "variant_id": entry['variant_id'],
+                    "requested": entry['quantity']
+                }
+                if code != 'ConditionalCheckFailed':
+                    failure["reason"] = code
+                elif old_item is None:
+                    failure["reason"] = "product_not_found"
+                else:
+                    variants = old_item.get('variants', [])
+                    variant = variants[index] if index < len(variants) else None
+                    if not variant or variant.get('variant_id') != entry['variant_id']:
+                        failure["reason"] = "variant_changed"
+                    elif variant['stock_quantity'] < entry['quantity']:
+                        failure["reason"] = "insufficient_stock"
+                        failure["available"] = int(variant['stock_quantity'])
+                    else:
+                        continue
+                failures.append(failure)
+        return failures
+    
+    async def get_order(self, order_id: str) -> Optional[Dict]:
+        """Get order by ID"""
+        response = await self._run(self.orders_table, 'get_item', Key={'order_id': order_id})
+        if 'Item' in response:
+            return self._decode(self.orders_table, response['Item'])
+        return None
+    
+    def _orders_by_time(self, index_name: str, condition, since: Optional[datetime],
+                        until: Optional[datetime], attributes: Optional[List[str]]) -> Dict:
+        """Query parameters for a created_at-sorted order index, newest first"""
+        encode = self._codecs[self.orders_table].encode_field
+        if since and until:
+            condition = condition & Key('created_at').between(encode('created_at', since), encode('created_at', until))
+        elif since:
+            condition = condition & Key('created_at').gte(encode('created_at', since))
+        elif until:
+            condition = condition & Key('created_at').lte(encode('created_at', until))
+        return {
+            'IndexName': index_name,
+            'KeyConditionExpression': condition,
+            'ScanIndexForward': False,
+            **self._projection_params(attributes)
+        }
+    
+    def _orders_by_customer_params(self, customer_id: str, attributes: Optional[List[str]] = None,
+                                   since: Optional[datetime] = None,
+                                   until: Optional[datetime] = None) -> Dict:
+        """Query parameters for a customer's orders, newest first"""
+        return self._orders_by_time('customer_id-created_at-index', Key('customer_id').eq(customer_id),
+                                    since, until, attributes)
+    
+    async def get_orders_by_customer(self, customer_id: str, attributes: Optional[List[str]] = None,
+                                     since: Optional[datetime] = None,
+                                     until: Optional[datetime] = None) -> List[Dict]:
+        """Get all orders for a customer, newest first"""
+        return await self._collect(self.orders_table, 'query',
+                                   **self._orders_by_customer_params(customer_id, attributes, since, until))
+    
+    def stream_orders_by_customer(self, customer_id: str, attributes: Optional[List[str]] = None,
+                                  since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None) -> AsyncIterator[Dict]:
+        """Stream all orders for a customer, newest first"""
+        return self._stream(self.orders_table, 'query',
+                            **self._orders_by_customer_params(customer_id, attributes, since, until))
+    
+    async def get_orders_by_customer_page(self, customer_id: str, limit: int = 50,
+                                          cursor: Optional[str] = None,
+                                          attributes: Optional[List[str]] = None,
+                                          since: Optional[datetime] = None,
+                                          until: Optional[datetime] = None) -> Dict:
+        """Get one page of orders for a customer, newest first"""
+        return await self._page(self.orders_table, 'query', limit, cursor,
+                                **self._orders_by_customer_params(customer_id, attributes, since, until))
+    
+    async def get_recent_orders_by_customer(self, customer_id: str, limit: int = 10,
+                                            attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get a customer's `limit` newest orders"""
+        page = await self.get_orders_by_customer_page(customer_id, limit, attributes=attributes)
+        return page["items"]
+    
+    def _orders_by_shop_params(self, shop_id: str, status: Optional[str] = None,
+                               attributes: Optional[List[str]] = None,
+                               since: Optional[datetime] = None,
+                               until: Optional[datetime] = None) -> Dict:
+        """Query parameters for a shop's orders, newest first"""
+        params = self._orders_by_time('shop_id-created_at-index', Key('shop_id').eq(shop_id),
+                                      since, until, attributes)
+        if status:
+            params['FilterExpression'] = Attr('status').eq(status)
+        return params
+    
+    async def get_orders_by_shop(self, shop_id: str, status: Optional[str] = None,
+                                 attributes: Optional[List[str]] = None,
+                                 since: Optional[datetime] = None,
+                                 until: Optional[datetime] = None) -> List[Dict]:
+        """Get all orders for a shop, newest first, optionally filtered by status"""
+        return await self._collect(self.orders_table, 'query',
+                                   **self._orders_by_shop_params(shop_id, status, attributes, since, until))
+    
+    def stream_orders_by_shop(self, shop_id: str, status: Optional[str] = None,
+                              attributes: Optional[List[str]] = None,
+                              since: Optional[datetime] = None,
+                              until: Optional[datetime] = None) -> AsyncIterator[Dict]:
+        """Stream all orders for a shop, newest first, optionally filtered by status"""
+        return self._stream(self.orders_table, 'query',
+                            **self._orders_by_shop_params(shop_id, status, attributes, since, until))
+    
+    async def get_orders_by_shop_page(self, shop_id: str, status: Optional[str] = None,
+                                      limit: int = 50, cursor: Optional[str] = None,
+                                      attributes: Optional[List[str]] = None,
+                                      since: Optional[datetime] = None,
+                                      until: Optional[datetime] = None) -> Dict:
+        """Get one page of orders for a shop, newest first, optionally filtered by status"""
+        return await self._page(self.orders_table, 'query', limit, cursor,
+                                **self._orders_by_shop_params(shop_id, status, attributes, since, until))
+    
+    async def get_recent_orders_by_shops(self, shop_ids: List[str], limit: int = 10,
+                                         attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get the `limit` newest orders across several shops"""
+        if attributes:
+            attributes = list(dict.fromkeys([*attributes, 'created_at']))
+        # Each shop contributes at most `limit` rows, then the heads are merged
+        pages = await asyncio.gather(*(
+            self.get_orders_by_shop_page(shop_id, limit=limit, attributes=attributes)
+            for shop_id in shop_ids
+        ))
+        orders = [order for page in pages for order in page["items"]]
+        orders.sort(key=lambda o: o["created_at"], reverse=True)
+        return orders[:limit]
+    
+    def stream_all_orders(self, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every order using a parallel segmented scan"""
+        return self._parallel_scan(self.orders_table, **self._projection_params(attributes))
+    
+    async def get_all_orders(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get every order"""
+        return [order async for order in self.stream_all_orders(attributes)]
+    
+    async def get_all_orders_page(self, limit: int = 50, cursor: Optional[str] = None,
+                                  attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of orders in table order"""
+        return await self._page(self.orders_table, 'scan', limit, cursor, **self._projection_params(attributes))
     
     async def update_order_status(self, order_id: str, status: str) -> Optional[Dict]:
         """Update order status"""
-        response = self.orders_table.update_item(
-            Key={'order_id': order_id},
-            UpdateExpression="SET #status = :status, #updated_at = :updated_at",
-            ExpressionAttributeValues={
-                ':status': status,
-                ':updated_at': self._serialize_datetime(datetime.utcnow())
-            },
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#updated_at': 'updated_at'
-            },
-            ReturnValues="ALL_NEW"
-        )
+        status = getattr(status, 'value', status)
+        for _ in range(self.status_update_retries):
+            response = await self._run(self.orders_table, 'get_item', Key={'order_id': order_id},
+                                       ConsistentRead=True)
+            if 'Item' not in response:
+                return None
+            order = self._decode(self.orders_table, response['Item'])
+            shop = await self.get_shop(order['shop_id'])
+            merchant_id = shop['merchant_id'] if shop else None
+            
+            updated_at = datetime.utcnow()
+            update = self._status_update(self.orders_table, {'order_id': order_id},
+                                         order['status'], status, updated_at)
+            try:
+                await self._write_with_stats(self.orders_table, update,
+                                             stats.order_status_deltas(order, merchant_id, status))
+            except ClientError as e:
+                if self._condition_failed(e):
+                    continue
+                raise
+            
+            order.update(status=status, updated_at=updated_at)
+            return order
+        raise RuntimeError(f"Order {order_id} status kept changing, update abandoned")
+
+    
+    # Review operations
+    def _rating_updates(self, review: Dict, sign: int) -> List[Dict]:
+        """ADD a review's rating to (sign=1) or remove it from (sign=-1) its shop's and product's aggregates"""
+        updates = []
+        for table_name, key_name in ((self.shops_table, 'shop_id'), (self.products_table, 'product_id')):
+            if not review.get(key_name):
+                continue
+            updates.append({
+                'Update': {
+                    'TableName': table_name,
+                    'Key': {key_name: review[key_name]},
+                    'UpdateExpression': 'ADD rating_sum :rating, total_reviews :one, #star :one',
+                    'ConditionExpression': f'attribute_exists({key_name})',
+                    'ExpressionAttributeNames': {'#star': f"rating_star_{review['rating']}"},
+                    'ExpressionAttributeValues': {':rating': sign * review['rating'], ':one': sign}
+                }
+            })
+        return updates
+    
+    async def create_review(self, review: Review) -> Dict:
+        """Create a review; an approved review is added to its shop's and product's ratings atomically.
+        
+        Raises ReviewTargetNotFound if the reviewed shop or product does not exist.
+        """
+        review_data = review.dict()
+        put = {
+            'Put': {
+                'TableName': self.reviews_table,
+                'Item': self._encode(self.reviews_table, review_data),
+                'ConditionExpression': 'attribute_not_exists(review_id)'
+            }
+        }
+        ratings = self._rating_updates(review_data, 1) if review_data['is_approved'] else []
         
-        if 'Attributes' in response:
-            return self._deserialize_datetime(response['Attributes'])
+        try:
+            await self._transact([put] + ratings + self._stats_updates(stats.review_deltas(review_data)),
+                                 table_name=self.reviews_table)
+        except ClientError as e:
+            if any(self._condition_failed(e, i) for i in range(1, len(ratings) + 1)):
+                raise ReviewTargetNotFound("Reviewed shop or product not found")
+            raise
+        return review_data
+    
+    async def get_review(self, review_id: str) -> Optional[Dict]:
+        """Get review by ID"""
+        response = await self._run(self.reviews_table, 'get_item', Key={'review_id': review_id})
+        if 'Item' in response:
+            return self._decode(self.reviews_table, response['Item'])
         return None
+    
+    async def moderate_review(self, review_id: str, is_approved: bool, admin_notes: Optional[str],
+                              moderated_by: str) -> Optional[Dict]:
+        """Approve or reject a review, moving its rating in or out of the aggregates atomically"""
+        for _ in range(self.status_update_retries):
+            response = await self._run(self.reviews_table, 'get_item', Key={'review_id': review_id},
+                                       ConsistentRead=True)
+            if 'Item' not in response:
+                return None
+            review = self._decode(self.reviews_table, response['Item'])
+            
+            moderated_at = datetime.utcnow()
+            encode = self._codecs[self.reviews_table].encode_field
+            update = {
+                'Update': {
+                    'TableName': self.reviews_table,
+                    'Key': {'review_id': review_id},
+                    'UpdateExpression': ('SET is_approved = :new, admin_notes = :notes, '
+                                         'moderated_at = :at, moderated_by = :by'),
+                    'ConditionExpression': 'is_approved = :old',
+                    'ExpressionAttributeValues': {
+                        ':new': is_approved,
+                        ':old': review['is_approved'],
+                        ':notes': admin_notes,
+                        ':at': encode('moderated_at', moderated_at),
+                        ':by': moderated_by
+                    }
+                }
+            }
+            actions = [update]
+            if review['is_approved'] != is_approved:
+                actions += self._rating_updates(review, 1 if is_approved else -1)
+                actions += self._stats_updates(stats.merge(
+                    stats.review_deltas(review, -1),
+                    stats.review_deltas({**review, 'is_approved': is_approved}, 1)
+                ))
+            
+            try:
+                await self._transact(actions, table_name=self.reviews_table)
+            except ClientError as e:
+                if self._condition_failed(e):
+                    continue
+                raise
+            
+            review.update(is_approved=is_approved, admin_notes=admin_notes,
+                          moderated_at=moderated_at, moderated_by=moderated_by)
+            return review
+        raise RuntimeError(f"Review {review_id} kept changing, moderation abandoned")
+    
+    def _reviews_params(self, index_name: str, condition, attributes: Optional[List[str]]) -> Dict:
+        """Approved reviews on a created_at-sorted index, newest first"""
+        return {
+            'IndexName': index_name,
+            'KeyConditionExpression': condition,
+            'FilterExpression': Attr('is_approved').eq(True),
+            'ScanIndexForward': False,
+            **self._projection_params(attributes)
+        }
+    
+    @coalesce
+    async def get_reviews_by_shop_page(self, shop_id: str, limit: int = 20, cursor: Optional[str] = None,
+                                       attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of a shop's approved reviews, newest first"""
+        return await self._page(self.reviews_table, 'query', limit, cursor, **self._reviews_params(
+            'shop_id-created_at-index', Key('shop_id').eq(shop_id), attributes))
+    
+    @coalesce
+    async def get_reviews_by_product_page(self, product_id: str, limit: int = 20, cursor: Optional[str] = None,
+                                          attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of a product's approved reviews, newest first"""
+        return await self._page(self.reviews_table, 'query', limit, cursor, **self._reviews_params(
+            'product_id-created_at-index', Key('product_id').eq(product_id), attributes))
+    
+    def stream_all_reviews(self, attributes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Stream every review using a parallel segmented scan"""
+        return self._parallel_scan(self.reviews_table, **self._projection_params(attributes))
+    
+    async def get_all_reviews(self, attributes: Optional[List[str]] = None) -> List[Dict]:
+        """Get every review"""
+        return [review async for review in self.stream_all_reviews(attributes)]
+    
+    async def get_all_reviews_page(self, limit: int = 50, cursor: Optional[str] = None,
+                                   attributes: Optional[List[str]] = None) -> Dict:
+        """Get one page of reviews in table order"""
+        return await self._page(self.reviews_table, 'scan', limit, cursor, **self._projection_params(attributes))
+    
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Hit/miss counters for the item caches"""
+        return {
+            "shops": self.shop_cache.stats(),
+            "products": self.product_cache.stats(),
+            "addresses": self.address_cache.stats()
+        }
+    
+    def write_buffer_stats(self) -> Dict[str, Dict]:
+        """Coalescing counters of the bulk write buffers"""
+        return {name: buffer.stats() for name, buffer in sorted(self._write_buffers.items())}
+    
+    def call_stats(self) -> Dict[str, Any]:
+        """Per table/index/operation/route call aggregates and the hottest partitions"""
+        return self.metrics.snapshot()
+    
+    def throttle_stats(self) -> Dict[str, Dict]:
+        """Rate limiter and retry budget state per table"""
+        return {
+            table_name: {
+                "limiter": self._limiter(table_name).stats(),
+                "retry_budget": self._budget(table_name).stats()
+            }
+            for table_name in sorted(set(self._limiters) | set(self._budgets))
+        }
 
 
 # Global instance
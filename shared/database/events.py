@@ -0,0 +1,353 @@
+"""
+Change feed for the tables managed by DynamoDBService
+
+Caches, search indexes and other derived views subscribe to ChangeEvents
+instead of every write path having to update them. Two sources feed the
+same subscribers:
+
+* StreamsChangeFeed tails the tables' DynamoDB Streams, so it sees every
+  process's writes. A stream shard serves only about two concurrent
+  readers, so CHANGE_FEED=streams is opt-in: run it in one process per
+  deployment (it also posts the gateway cache invalidations for everyone).
+* LocalChangeFeed is fed by DynamoDBService after each successful write of
+  its own process (the default). Events are queued and delivered by a
+  background task, so subscribers stay off the write path. Views fed this
+  way miss other processes' writes and rely on their TTLs and reloads.
+
+Either way, events for one item arrive in the order they happened, and a
+failing subscriber is logged without affecting the others.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from shared.database.tables import TABLE_DEFINITIONS
+
+
+logger = logging.getLogger(__name__)
+
+INSERT = "INSERT"
+MODIFY = "MODIFY"
+REMOVE = "REMOVE"
+
+
+class ChangeEvent:
+    """One item-level change; images are decoded like any other item read"""
+
+    __slots__ = ("table", "name", "keys", "new_image", "old_image", "created_at")
+
+    def __init__(self, table: str, name: str, keys: Dict[str, Any],
+                 new_image: Optional[Dict] = None, old_image: Optional[Dict] = None,
+                 created_at: Optional[float] = None):
+        self.table = table
+        self.name = name
+        self.keys = keys
+        self.new_image = new_image
+        self.old_image = old_image
+        self.created_at = created_at or time.time()
+
+    def __repr__(self) -> str:
+        return f"ChangeEvent({self.table} {self.name} {self.keys})"
+
+
+Subscriber = Callable[[ChangeEvent], Awaitable[None]]
+Decoder = Callable[[str, Dict], Dict]
+
+
+class _Subscription:
+    __slots__ = ("handler", "tables", "images")
+
+    def __init__(self, handler: Subscriber, tables: Optional[Iterable[str]], images: bool):
+        self.handler = handler
+        self.tables = frozenset(tables) if tables is not None else None
+        self.images = images
+
+
+class ChangeFeed:
+    """Subscriber registry and delivery shared by both feed sources"""
+
+    def __init__(self, tables: Iterable[str], decode: Decoder):
+        self.tables = frozenset(tables)
+        self._decode = decode
+        self._subscriptions: List[_Subscription] = []
+
+        self.delivered = 0
+        self.failed = 0
+        self.lag_seconds = 0.0
+
+    def subscribe(self, handler: Subscriber, tables: Optional[Iterable[str]] = None,
+                  images: bool = False) -> None:
+        """Register an async handler, optionally for some tables only.
+
+        Events always carry the item keys. ``images=True`` asks for the new
+        image on INSERT/MODIFY events as well; without it a feed may leave the
+        images out.
+        """
+        self._subscriptions.append(_Subscription(handler, tables, images))
+
+    def _subscribers(self, table: str) -> List[_Subscription]:
+        return [s for s in self._subscriptions if s.tables is None or table in s.tables]
+
+    def wants(self, table: str) -> bool:
+        return table in self.tables and bool(self._subscribers(table))
+
+    def wants_images(self, table: str) -> bool:
+        return any(s.images for s in self._subscribers(table))
+
+    async def publish(self, event: ChangeEvent) -> None:
+        """Deliver one event to every interested subscriber"""
+        self.lag_seconds = max(0.0, time.time() - event.created_at)
+        for subscription in self._subscribers(event.table):
+            try:
+                await subscription.handler(event)
+                self.delivered += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Change subscriber {subscription.handler!r} failed on {event!r}")
+
+    def record_write(self, table_name: str, operation: str, kwargs: Dict, response: Dict) -> None:
+        """Called by DynamoDBService after each successful write"""
+
+    async def start(self) -> None:
+        """Start delivering events"""
+
+    async def stop(self) -> None:
+        """Stop delivering events"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": type(self).__name__,
+            "subscribers": len(self._subscriptions),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "lag_seconds": round(self.lag_seconds, 3)
+        }
+
+
+class LocalChangeFeed(ChangeFeed):
+    """Turns the service's own writes into events, like a stream would.
+
+    Puts are reported as INSERT since the previous item is not known.
+    When a subscriber asks for images and the write did not return the new
+    item (e.g. updates inside a transaction), it is read back before delivery.
+    """
+
+    def __init__(self, tables: Iterable[str], decode: Decoder,
+                 fetch: Callable[[str, Dict], Awaitable[Optional[Dict]]]):
+        super().__init__(tables, decode)
+        self._fetch = fetch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def record_write(self, table_name: str, operation: str, kwargs: Dict, response: Dict) -> None:
+        if not self._subscriptions:
+            return
+        for event in self._events(table_name, operation, kwargs, response):
+            if event is not None:
+                self._enqueue(event)
+
+    def _events(self, table_name: str, operation: str, kwargs: Dict,
+                response: Dict) -> List[Optional[ChangeEvent]]:
+        if operation == 'put_item':
+            return [self._put(table_name, kwargs['Item'])]
+        if operation == 'update_item':
+            new_image = response.get('Attributes') if kwargs.get('ReturnValues') == 'ALL_NEW' else None
+            return [self._change(table_name, MODIFY, kwargs['Key'], new_image)]
+        if operation == 'delete_item':
+            old_image = response.get('Attributes') if kwargs.get('ReturnValues') == 'ALL_OLD' else None
+            return [self._change(table_name, REMOVE, kwargs['Key'], None, old_image)]
+
+        events = []
+        if operation == 'transact_write_items':
+            for action in kwargs['TransactItems']:
+                if 'Put' in action:
+                    events.append(self._put(action['Put']['TableName'], action['Put']['Item']))
+                elif 'Update' in action:
+                    events.append(self._change(action['Update']['TableName'], MODIFY, action['Update']['Key']))
+                elif 'Delete' in action:
+                    events.append(self._change(action['Delete']['TableName'], REMOVE, action['Delete']['Key']))
+        elif operation == 'batch_write_item':
+            unprocessed = response.get('UnprocessedItems', {})
+            for name, requests in kwargs['RequestItems'].items():
+                for request in requests:
+                    if request in unprocessed.get(name, []):
+                        continue
+                    if 'PutRequest' in request:
+                        events.append(self._put(name, request['PutRequest']['Item']))
+                    else:
+                        events.append(self._change(name, REMOVE, request['DeleteRequest']['Key']))
+        return events
+
+    def _put(self, table_name: str, item: Dict) -> Optional[ChangeEvent]:
+        key_name = TABLE_DEFINITIONS[table_name]["key"] if table_name in TABLE_DEFINITIONS else None
+        keys = {key_name: item[key_name]} if key_name in item else {}
+        return self._change(table_name, INSERT, keys, item)
+
+    def _change(self, table_name: str, name: str, keys: Dict, new_image: Optional[Dict] = None,
+                old_image: Optional[Dict] = None) -> Optional[ChangeEvent]:
+        if not self.wants(table_name):
+            return None
+        if not self.wants_images(table_name):
+            return ChangeEvent(table_name, name, dict(keys))
+        # Images are decoded from copies; the request dicts belong to the caller
+        return ChangeEvent(
+            table_name, name, dict(keys),
+            self._decode(table_name, dict(new_image)) if new_image is not None else None,
+            self._decode(table_name, dict(old_image)) if old_image is not None else None
+        )
+
+    def _enqueue(self, event: ChangeEvent) -> None:
+        # The delivery task starts with the first event on each event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            if self._loop is not loop:
+                self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._deliver())
+        self._queue.put_nowait(event)
+
+    async def _deliver(self) -> None:
+        while True:
+            event = await self._queue.get()
+            try:
+                if event.name != REMOVE and event.new_image is None and self.wants_images(event.table):
+                    event.new_image = await self._fetch(event.table, event.keys)
+                await self.publish(event)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Failed to deliver {event!r}")
+            finally:
+                self._queue.task_done()
+
+    async def drain(self) -> None:
+        """Wait until every queued event has been delivered"""
+        if self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        await self.drain()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+            self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "queued": self._queue.qsize() if self._queue else 0}
+
+
+class StreamsChangeFeed(ChangeFeed):
+    """Tails the DynamoDB Stream of every watched table.
+
+    Shards are read from LATEST when the feed starts; shards created later
+    (after a split or a stream rollover) are read from TRIM_HORIZON so no
+    record between polls is lost.
+    """
+
+    def __init__(self, tables: Iterable[str], decode: Decoder,
+                 client_factory: Callable[[], Any], stream_arn: Callable[[str], Optional[str]],
+                 poll_interval: float = 1.0, refresh_interval: float = 60.0):
+        super().__init__(tables, decode)
+        self._client_factory = client_factory
+        self._stream_arn = stream_arn
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self._deserializer = TypeDeserializer()
+        self._task: Optional[asyncio.Task] = None
+        # stream ARN -> shard id -> iterator (None once the shard is closed)
+        self._iterators: Dict[str, Dict[str, Optional[str]]] = {}
+        self.records = 0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        client = await asyncio.to_thread(self._client_factory)
+        arns = {}
+        for table_name in self.tables:
+            arn = await asyncio.to_thread(self._stream_arn, table_name)
+            if arn:
+                arns[arn] = table_name
+            else:
+                logger.warning(f"Table {table_name} has no stream; its changes will not be published")
+
+        first = True
+        refreshed_at = 0.0
+        while True:
+            try:
+                if time.monotonic() - refreshed_at > self.refresh_interval:
+                    for arn in arns:
+                        await asyncio.to_thread(self._refresh_shards, client, arn, first)
+                    first = False
+                    refreshed_at = time.monotonic()
+
+                for arn, table_name in arns.items():
+                    await self._poll(client, arn, table_name)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change stream poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def _refresh_shards(self, client, arn: str, at_latest: bool) -> None:
+        known = self._iterators.setdefault(arn, {})
+        params = {"StreamArn": arn}
+        while True:
+            description = client.describe_stream(**params)["StreamDescription"]
+            for shard in description["Shards"]:
+                shard_id = shard["ShardId"]
+                if shard_id in known:
+                    continue
+                closed = "EndingSequenceNumber" in shard["SequenceNumberRange"]
+                if at_latest and closed:
+                    known[shard_id] = None
+                    continue
+                known[shard_id] = client.get_shard_iterator(
+                    StreamArn=arn, ShardId=shard_id,
+                    ShardIteratorType="LATEST" if at_latest else "TRIM_HORIZON"
+                )["ShardIterator"]
+            if not description.get("LastEvaluatedShardId"):
+                return
+            params["ExclusiveStartShardId"] = description["LastEvaluatedShardId"]
+
+    async def _poll(self, client, arn: str, table_name: str) -> None:
+        shards = self._iterators.get(arn, {})
+        for shard_id, iterator in list(shards.items()):
+            if iterator is None:
+                continue
+            response = await asyncio.to_thread(client.get_records, ShardIterator=iterator, Limit=1000)
+            shards[shard_id] = response.get("NextShardIterator")
+            for record in response.get("Records", []):
+                self.records += 1
+                await self.publish(self._event(table_name, record))
+
+    def _event(self, table_name: str, record: Dict) -> ChangeEvent:
+        change = record["dynamodb"]
+        created = change.get("ApproximateCreationDateTime")
+        return ChangeEvent(
+            table_name,
+            record["eventName"],
+            self._image(table_name, change.get("Keys")),
+            self._image(table_name, change.get("NewImage")),
+            self._image(table_name, change.get("OldImage")),
+            created.timestamp() if created is not None else None
+        )
+
+    def _image(self, table_name: str, wire: Optional[Dict]) -> Optional[Dict]:
+        if wire is None:
+            return None
+        item = {k: self._deserializer.deserialize(v) for k, v in wire.items()}
+        return self._decode(table_name, item)
+
+    def stats(self) -> Dict[str, Any]:
+        shards = sum(1 for s in self._iterators.values() for i in s.values() if i)
+        return {**super().stats(), "records": self.records, "open_shards": shards}
@@ -0,0 +1,149 @@
+"""
+Geohash cells for nearby-shop discovery
+
+Each shop item carries its full ``geohash`` and the 4-character prefix
+``geohash4`` (cells of roughly 39 x 20 km), which are the sort and partition
+keys of the shops ``geohash4-geohash-index``. A "near" search picks the
+finest precision whose cells cover the search circle in a handful of cells,
+queries only those, and computes exact distances for the candidates.
+
+Run ``python -m shared.database.geo`` once to add cells to shops created
+before the index existed.
+"""
+import asyncio
+import math
+from typing import Dict, List, Tuple
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+PRECISION = 9
+PARTITION_PRECISION = 4
+MAX_COVERING_CELLS = 8
+MAX_RADIUS_KM = 50.0
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(lat: float, lng: float, precision: int = PRECISION) -> str:
+    """Geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        current, target = (lng_range, lng) if even else (lat_range, lat)
+        mid = (current[0] + current[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            current[0] = mid
+        else:
+            current[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent of a cell in degrees"""
+    total_bits = 5 * precision
+    lat_bits = total_bits // 2
+    lng_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cell_attributes(lat: float, lng: float) -> Dict[str, str]:
+    """Index attributes stored on a shop item"""
+    geohash = encode(lat, lng)
+    return {"geohash": geohash, "geohash4": geohash[:PARTITION_PRECISION]}
+
+
+def _bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angle)
+    # Widest longitude reached by the circle; one around a pole spans every longitude
+    sin_angle, cos_lat = math.sin(angle), math.cos(math.radians(lat))
+    lng_delta = 180.0 if sin_angle >= cos_lat else min(180.0, math.degrees(math.asin(sin_angle / cos_lat)))
+    return (max(-90.0, lat - lat_delta), min(90.0, lat + lat_delta), lng - lng_delta, lng + lng_delta)
+
+
+def _grid(box: Tuple[float, float, float, float], precision: int) -> Tuple[range, range]:
+    """Rows and columns of the cells a bounding box touches"""
+    min_lat, max_lat, min_lng, max_lng = box
+    lat_step, lng_step = cell_size(precision)
+    rows = range(math.floor((min_lat + 90) / lat_step), math.floor((max_lat + 90) / lat_step) + 1)
+    cols = range(math.floor((min_lng + 180) / lng_step), math.floor((max_lng + 180) / lng_step) + 1)
+    return rows, cols
+
+
+def _cells(box: Tuple[float, float, float, float], precision: int) -> List[str]:
+    lat_step, lng_step = cell_size(precision)
+    rows, cols = _grid(box, precision)
+    lng_cells = int(round(360.0 / lng_step))
+    cells = []
+    for row in rows:
+        center_lat = min(90.0, -90 + (row + 0.5) * lat_step)
+        for col in dict.fromkeys(c % lng_cells for c in cols):
+            cells.append(encode(center_lat, -180 + (col + 0.5) * lng_step, precision))
+    return list(dict.fromkeys(cells))
+
+
+def covering_cells(lat: float, lng: float, radius_km: float) -> List[str]:
+    """Geohash prefixes whose cells cover the circle's bounding box.
+
+    Uses the finest precision that needs at most MAX_COVERING_CELLS cells, so
+    few items outside the circle are read, but never coarser than the index
+    partition, so each prefix is a single Query.
+    """
+    box = _bounding_box(lat, lng, radius_km)
+    precision = PARTITION_PRECISION
+    while precision < PRECISION:
+        rows, cols = _grid(box, precision + 1)
+        if len(rows) * len(cols) > MAX_COVERING_CELLS:
+            break
+        precision += 1
+    return _cells(box, precision)
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_point(near: str) -> Tuple[float, float]:
+    """Parse a "lat,lng" query parameter"""
+    try:
+        lat, lng = (float(part) for part in near.split(","))
+    except ValueError:
+        raise ValueError("near must be 'lat,lng'")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("near is out of range")
+    return lat, lng
+
+
+async def backfill(db_service) -> int:
+    """Add index cells to shops that do not have them yet; returns the number updated"""
+    shops = await db_service.get_all_shops(["shop_id", "latitude", "longitude", "geohash"])
+    missing = [shop for shop in shops if not shop.get("geohash")]
+    await asyncio.gather(*(
+        db_service.update_shop(shop["shop_id"], cell_attributes(shop["latitude"], shop["longitude"]))
+        for shop in missing
+    ))
+    return len(missing)
+
+
+if __name__ == "__main__":
+    from shared.database.dynamodb import db_service
+    updated = asyncio.run(backfill(db_service))
+    print(f"Indexed {updated} shops")
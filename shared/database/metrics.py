@@ -0,0 +1,192 @@
+"""
+Per-call DynamoDB instrumentation
+
+Every call made by DynamoDBService is recorded against its table, index,
+operation and the API route that triggered it: latency, items returned and
+scanned, response bytes and consumed capacity. Capacity is also tracked per
+partition key value, so hot partitions show up from real traffic. Key values
+are user and order IDs, so partitions are reported by a short hash of the
+value (partition_label) rather than the value itself.
+"""
+import bisect
+import hashlib
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from shared.database.tables import TABLE_DEFINITIONS
+
+
+# Route template of the request being served ("-" for background work)
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+READ_OPERATIONS = frozenset({"get_item", "query", "scan", "batch_get_item", "transact_get_items"})
+
+
+async def track_route(request: Request) -> None:
+    """App-wide dependency that tags DynamoDB calls with the route being served"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    current_route.set(f"{request.method} {path}")
+
+
+def record_response_size(http_response, parsed, **kwargs) -> None:
+    """botocore after-call hook: keep the raw response size next to the parsed response"""
+    if isinstance(parsed, dict):
+        parsed.setdefault("ResponseMetadata", {})["ResponseBytes"] = len(http_response.content or b"")
+
+
+def _capacity_entries(consumed: Any) -> List[Dict]:
+    if not consumed:
+        return []
+    return consumed if isinstance(consumed, list) else [consumed]
+
+
+def partition_label(value: Any) -> str:
+    """Stable, non-reversible label of a partition key value"""
+    return hashlib.blake2b(str(value).encode("utf-8"), digest_size=6).hexdigest()
+
+
+def _partition_value(condition: Any) -> Optional[Any]:
+    """Value of the first equality in a boto3 key condition (the partition key)"""
+    expression = condition.get_expression()
+    if expression["operator"] == "=":
+        return expression["values"][1]
+    for value in expression["values"]:
+        if hasattr(value, "get_expression"):
+            found = _partition_value(value)
+            if found is not None:
+                return found
+    return None
+
+
+class _CallStats:
+    __slots__ = ("calls", "errors", "latency_ms", "max_latency_ms", "buckets",
+                 "items", "scanned", "bytes", "capacity")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors: Dict[str, int] = {}
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.items = 0
+        self.scanned = 0
+        self.bytes = 0
+        self.capacity = 0.0
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the latency bucket holding the given fraction of calls"""
+        target = self.calls * fraction
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_latency_ms
+        return None
+
+
+class CallMetrics:
+    """In-process aggregates of DynamoDB calls"""
+
+    def __init__(self, max_partitions: int = 500):
+        self.max_partitions = max_partitions
+        self._calls: Dict[Tuple[str, str, str, str], _CallStats] = {}
+        self._partitions: Dict[Tuple[str, str, str], List[float]] = {}
+
+    def record(self, table_name: str, operation: str, kwargs: Dict, latency_ms: float,
+               response: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        """Record one attempt of a call"""
+        index_name = kwargs.get("IndexName", "-")
+        key = (table_name, index_name, operation, current_route.get())
+        stats = self._calls.get(key)
+        if stats is None:
+            stats = self._calls[key] = _CallStats()
+
+        stats.calls += 1
+        stats.latency_ms += latency_ms
+        stats.max_latency_ms = max(stats.max_latency_ms, latency_ms)
+        stats.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        if error:
+            stats.errors[error] = stats.errors.get(error, 0) + 1
+            return
+
+        if "Items" in response:
+            stats.items += len(response["Items"])
+            stats.scanned += response.get("ScannedCount", 0)
+        elif "Item" in response:
+            stats.items += 1
+        elif "Responses" in response:
+            responses = response["Responses"]
+            if isinstance(responses, dict):
+                stats.items += sum(len(items) for items in responses.values())
+            else:
+                stats.items += len(responses)
+        stats.bytes += response.get("ResponseMetadata", {}).get("ResponseBytes", 0)
+
+        capacity = sum(c.get("CapacityUnits", 0) for c in _capacity_entries(response.get("ConsumedCapacity")))
+        stats.capacity += capacity
+        if capacity:
+            self._record_partition(table_name, index_name, kwargs, capacity)
+
+    def _record_partition(self, table_name: str, index_name: str, kwargs: Dict, capacity: float) -> None:
+        if "Key" in kwargs:
+            value = next(iter(kwargs["Key"].values()))
+        elif "Item" in kwargs and table_name in TABLE_DEFINITIONS:
+            value = kwargs["Item"].get(TABLE_DEFINITIONS[table_name]["key"])
+        elif "KeyConditionExpression" in kwargs and hasattr(kwargs["KeyConditionExpression"], "get_expression"):
+            value = _partition_value(kwargs["KeyConditionExpression"])
+        else:
+            return
+        if value is None:
+            return
+
+        key = (table_name, index_name, partition_label(value))
+        entry = self._partitions.get(key)
+        if entry is None:
+            if len(self._partitions) >= self.max_partitions:
+                # Keep the heaviest partitions; the coldest one makes room
+                coldest = min(self._partitions, key=lambda k: self._partitions[k][0])
+                del self._partitions[coldest]
+            entry = self._partitions[key] = [0.0, 0]
+        entry[0] += capacity
+        entry[1] += 1
+
+    def snapshot(self, top_partitions: int = 20) -> Dict[str, Any]:
+        """Aggregates sorted by consumed capacity, heaviest first"""
+        calls = []
+        for (table_name, index_name, operation, route), stats in self._calls.items():
+            kind = "read" if operation in READ_OPERATIONS else "write"
+            calls.append({
+                "table": table_name,
+                "index": index_name,
+                "operation": operation,
+                "route": route,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "latency_ms_avg": round(stats.latency_ms / stats.calls, 2),
+                "latency_ms_p50": stats.percentile(0.5),
+                "latency_ms_p99": stats.percentile(0.99),
+                "latency_ms_max": round(stats.max_latency_ms, 2),
+                "items": stats.items,
+                "scanned_items": stats.scanned,
+                "response_bytes": stats.bytes,
+                f"{kind}_capacity_units": round(stats.capacity, 2)
+            })
+        calls.sort(key=lambda c: c.get("read_capacity_units", c.get("write_capacity_units", 0)), reverse=True)
+
+        partitions = sorted(self._partitions.items(), key=lambda kv: kv[1][0], reverse=True)
+        return {
+            "calls": calls,
+            "hot_partitions": [
+                {"table": t, "index": i, "partition": p, "capacity_units": round(c, 2), "calls": n}
+                for (t, i, p), (c, n) in partitions[:top_partitions]
+            ]
+        }
+
+    def reset(self) -> None:
+        self._calls.clear()
+        self._partitions.clear()
@@ -0,0 +1,36 @@
+"""
+Sparse fieldsets for list endpoints
+
+A ``fields=`` query parameter (e.g. ``fields=shop_id,name,logo_url``) is
+validated against the model and turned into a DynamoDB projection, so list
+views only read and ship the attributes the client actually renders.
+"""
+from typing import Dict, Iterable, List, Optional, Type
+
+from pydantic import BaseModel
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[List[str]]:
+    """Parse a comma-separated fields parameter; None means every attribute"""
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return requested or None
+
+
+def with_fields(attributes: Optional[List[str]], *required: str) -> Optional[List[str]]:
+    """Extend a projection with attributes the endpoint itself needs, e.g. for filtering"""
+    if attributes is None:
+        return None
+    return list(dict.fromkeys([*attributes, *required]))
+
+
+def sparse(items: Iterable[Dict], attributes: Optional[List[str]]) -> List[Dict]:
+    """Trim items down to the requested attributes"""
+    if attributes is None:
+        return list(items)
+    return [{k: item[k] for k in attributes if k in item} for item in items]
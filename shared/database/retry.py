@@ -0,0 +1,209 @@
+"""
+Retry policy and client-side rate limiting for DynamoDB calls
+
+botocore's own retries are switched off (see DynamoDBService) so that every
+retry goes through one place: a jittered exponential backoff, a per-table
+retry budget that stops retry storms once most calls are failing, and an
+adaptive token bucket that slows a table down as soon as DynamoDB starts
+throttling it and speeds back up while calls succeed.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+
+# DynamoDB asking us to slow down; these also feed the rate limiter
+THROTTLE_CODES = frozenset({
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "ThrottlingError"
+})
+
+# Server-side failures that are safe to try again
+TRANSIENT_CODES = frozenset({
+    "InternalServerError",
+    "ServiceUnavailable"
+})
+
+
+def error_code(error: Exception) -> str:
+    """The DynamoDB error code of a ClientError, or "" for anything else"""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def is_throttle(error: Exception) -> bool:
+    return error_code(error) in THROTTLE_CODES
+
+
+def is_retryable(error: Exception) -> bool:
+    """Throttles, transient server errors and dropped connections"""
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    code = error_code(error)
+    return code in THROTTLE_CODES or code in TRANSIENT_CODES
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number `attempt` (1-based)"""
+        # Full jitter spreads retries from many workers over the whole window
+        # instead of having them all come back at the same instant
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class RetryBudget:
+    """Allows retries only while they stay a small fraction of successful calls.
+
+    Every success deposits ``ratio`` tokens (up to ``max_tokens``) and every
+    retry withdraws one, so under a sustained outage retries dry up instead
+    of multiplying the load on a table that is already struggling.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for one retry; False when the budget is spent"""
+        if self._tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": round(self._tokens, 2),
+            "retries": self.retries,
+            "exhausted": self.exhausted
+        }
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate follows DynamoDB's throttle signals.
+
+    The limiter stays out of the way until the first throttle. It then caps
+    the request rate at a fraction of the rate that was just measured, and
+    grows the cap again by ``increase`` (a fraction per second) while calls
+    succeed. Throttles arriving within a second of the last cut belong to
+    the same burst and do not cut again. Once the cap grows past
+    ``max_rate`` the limiter switches itself off.
+    """
+
+    def __init__(self, name: str, min_rate: float, max_rate: float,
+                 decrease: float = 0.7, increase: float = 0.1):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease = decrease
+        self.increase = increase
+
+        self.enabled = False
+        self.rate = max_rate
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._last_increase = time.monotonic()
+
+        # Completed-call rate measured over roughly one-second windows; calls
+        # waiting in front of the worker pool do not count as throughput
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._measured_rate = 0.0
+
+        self.throttles = 0
+        self.delayed = 0
+
+    def _record_response(self, now: float) -> None:
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._measured_rate = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+    def _refill(self, now: float) -> None:
+        # Bursts are capped at ~100ms worth of requests to keep sends smooth
+        self._tokens = min(max(self.rate / 10, 1.0), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self) -> None:
+        """Wait until the table may be sent another request"""
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        self._refill(now)
+        if self._tokens < 1:
+            self.delayed += 1
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill(time.monotonic())
+        self._tokens -= 1
+
+    def _current_rate(self, now: float) -> float:
+        elapsed = now - self._window_start
+        if elapsed >= 0.1:
+            return self._window_count / elapsed
+        return self._measured_rate or self._window_count / 0.1
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease from the rate we were actually sending at"""
+        self.throttles += 1
+        now = time.monotonic()
+        self._record_response(now)
+        if self.enabled and now - self._last_decrease < 1.0:
+            return
+
+        current = self._current_rate(now)
+        if self.enabled:
+            current = min(current, self.rate)
+        self.rate = max(self.min_rate, current * self.decrease)
+        self._last_decrease = now
+        self._last_increase = now
+        if not self.enabled:
+            self.enabled = True
+            self._tokens = 0.0
+            self._last_refill = now
+
+    def on_success(self) -> None:
+        """Grow the cap with time since the last change; switch off once it no longer limits"""
+        now = time.monotonic()
+        self._record_response(now)
+        if not self.enabled:
+            return
+        self.rate += max(1.0, self.rate * self.increase) * (now - self._last_increase)
+        self._last_increase = now
+        if self.rate >= self.max_rate:
+            self.enabled = False
+            self.rate = self.max_rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "rate": round(self.rate, 2),
+            "measured_rate": round(self._measured_rate, 2),
+            "throttles": self.throttles,
+            "delayed": self.delayed
+        }
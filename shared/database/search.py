@@ -0,0 +1,259 @@
+"""
+In-process full-text search over shops and products
+
+Every process that serves search keeps an inverted index of shop names and
+categories and product names, brands and categories. Each token is indexed
+whole and as edge n-grams (its 2..15 character prefixes), so typeahead
+queries match words as they are being typed. Results are ranked by field
+weight and term rarity, with whole-word matches ahead of prefix matches.
+
+The index is loaded by one scan at startup and then kept current from the
+change feed (see events.py), so a search never touches DynamoDB. Processes
+that do not tail the table streams only see their own writes on the feed,
+so the index is also rebuilt from a fresh scan every SEARCH_RELOAD_INTERVAL
+seconds.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from shared.database.dynamodb import db_service
+
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+# Score multiplier for a query token that only matched the start of a word
+PREFIX_MATCH = 0.6
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased, accent-folded word tokens"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _TOKEN.findall(folded)
+
+
+class InvertedIndex:
+    """Token and edge n-gram postings over weighted document fields"""
+
+    def __init__(self, fields: Dict[str, float]):
+        self.fields = fields
+        self.documents: Dict[str, Dict] = {}
+        # term -> doc id -> best field weight the term occurs in
+        self._terms: Dict[str, Dict[str, float]] = {}
+        self._prefixes: Dict[str, Dict[str, float]] = {}
+        self._doc_keys: Dict[str, Tuple[Set[str], Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, doc_id: str, document: Dict) -> None:
+        """Index a document, replacing any previous version"""
+        self.remove(doc_id)
+        terms: Dict[str, float] = {}
+        for field, weight in self.fields.items():
+            for token in tokenize(document.get(field)):
+                terms[token] = max(terms.get(token, 0.0), weight)
+        prefixes: Dict[str, float] = {}
+        for token, weight in terms.items():
+            for size in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1):
+                prefix = token[:size]
+                prefixes[prefix] = max(prefixes.get(prefix, 0.0), weight)
+
+        for term, weight in terms.items():
+            self._terms.setdefault(term, {})[doc_id] = weight
+        for prefix, weight in prefixes.items():
+            self._prefixes.setdefault(prefix, {})[doc_id] = weight
+        self._doc_keys[doc_id] = (set(terms), set(prefixes))
+        self.documents[doc_id] = document
+
+    def remove(self, doc_id: str) -> None:
+        keys = self._doc_keys.pop(doc_id, None)
+        if keys is None:
+            return
+        for postings, names in ((self._terms, keys[0]), (self._prefixes, keys[1])):
+            for name in names:
+                docs = postings[name]
+                del docs[doc_id]
+                if not docs:
+                    del postings[name]
+        del self.documents[doc_id]
+
+    def _matches(self, token: str) -> Dict[str, float]:
+        """Score of every document matching one query token"""
+        exact = self._terms.get(token, {})
+        if len(token) < MIN_PREFIX:
+            candidates = exact
+        else:
+            candidates = self._prefixes.get(token[:MAX_PREFIX], {})
+            if len(token) > MAX_PREFIX:
+                # Beyond the indexed prefix length only whole words can match
+                candidates = {doc_id: w for doc_id, w in candidates.items() if doc_id in exact}
+        if not candidates:
+            return {}
+
+        rarity = math.log(1 + len(self.documents) / len(candidates))
+        return {
+            doc_id: weight * rarity * (1.0 if doc_id in exact else PREFIX_MATCH)
+            for doc_id, weight in candidates.items()
+        }
+
+    def search(self, query: str, limit: Optional[int] = None,
+               accept: Optional[Callable[[Dict], bool]] = None) -> List[Tuple[Dict, float]]:
+        """Documents matching every query token, best first"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        per_token = sorted((self._matches(token) for token in tokens), key=len)
+        scores = dict(per_token[0])
+        for matches in per_token[1:]:
+            scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items() if doc_id in matches}
+            if not scores:
+                return []
+
+        results = (
+            (self.documents[doc_id], score) for doc_id, score in scores.items()
+            if accept is None or accept(self.documents[doc_id])
+        )
+        if limit is None:
+            return sorted(results, key=lambda result: result[1], reverse=True)
+        return heapq.nlargest(limit, results, key=lambda result: result[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self.documents), "terms": len(self._terms), "prefixes": len(self._prefixes)}
+
+
+# Attributes kept per document: the indexed fields plus what results display
+SHOP_FIELDS = ["shop_id", "name", "category", "logo_url", "city", "rating", "total_reviews",
+               "is_open", "status", "updated_at"]
+PRODUCT_FIELDS = ["product_id", "shop_id", "name", "brand", "category", "subcategory", "images",
+                  "rating", "is_active", "updated_at"]
+
+
+class CatalogSearch:
+    """Shop and product indexes of one process, fed by the DynamoDB change feed"""
+
+    def __init__(self, db_service):
+        self.db_service = db_service
+        self.shops = InvertedIndex({"name": 3.0, "category": 1.0})
+        self.products = InvertedIndex({"name": 3.0, "brand": 2.0, "category": 1.0, "subcategory": 1.0})
+        self.ready = False
+        self.reload_interval = float(os.getenv("SEARCH_RELOAD_INTERVAL", "300"))
+        self.reloads = 0
+        self._load_task: Optional[asyncio.Task] = None
+        # Changes seen while a rebuild scans, applied to the new indexes before the swap
+        self._replay: Optional[List] = None
+
+    async def start(self) -> None:
+        """Follow the change feed and load both indexes in the background"""
+        if self._load_task is not None:
+            return
+        # Subscribe before scanning so no write between the two is lost;
+        # a scanned copy never replaces a newer one (see _index)
+        self.db_service.change_feed.subscribe(
+            self._on_change, tables=[self.db_service.shops_table, self.db_service.products_table], images=True
+        )
+        self._load_task = asyncio.get_running_loop().create_task(self._load())
+
+    async def stop(self) -> None:
+        if self._load_task is not None and not self._load_task.done():
+            self._load_task.cancel()
+
+    async def _load(self) -> None:
+        await self._rebuild()
+        self.ready = True
+        logger.info(f"Search index loaded: {len(self.shops)} shops, {len(self.products)} products")
+        while self.reload_interval > 0:
+            await asyncio.sleep(self.reload_interval)
+            await self._rebuild()
+            self.reloads += 1
+
+    async def _rebuild(self) -> None:
+        """Scan both tables into new indexes and swap them in"""
+        delay = 1.0
+        self._replay = []
+        try:
+            while True:
+                try:
+                    shops = [shop async for shop in self.db_service.stream_all_shops(SHOP_FIELDS)]
+                    products = [product async for product in self.db_service.stream_all_products(PRODUCT_FIELDS)]
+                    break
+                except Exception as e:
+                    logger.error(f"Failed to load search index, retrying in {delay:.0f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 60.0)
+
+            fresh_shops = InvertedIndex(self.shops.fields)
+            fresh_products = InvertedIndex(self.products.fields)
+            for shop in shops:
+                self._index(fresh_shops, shop["shop_id"], shop, SHOP_FIELDS)
+            for product in products:
+                self._index(fresh_products, product["product_id"], product, PRODUCT_FIELDS)
+            for event in self._replay:
+                self._apply(fresh_shops, fresh_products, event)
+            self.shops, self.products = fresh_shops, fresh_products
+        finally:
+            self._replay = None
+
+    def _index(self, index: InvertedIndex, doc_id: str, item: Dict, fields: List[str]) -> None:
+        current = index.documents.get(doc_id)
+        if current is not None and current.get("updated_at") and item.get("updated_at") \
+                and item["updated_at"] < current["updated_at"]:
+            return
+        index.add(doc_id, {name: item.get(name) for name in fields})
+
+    def _apply(self, shops: InvertedIndex, products: InvertedIndex, event) -> None:
+        if event.table == self.db_service.shops_table:
+            index, doc_id, fields = shops, event.keys["shop_id"], SHOP_FIELDS
+        else:
+            index, doc_id, fields = products, event.keys["product_id"], PRODUCT_FIELDS
+        if event.new_image is None:
+            index.remove(doc_id)
+        else:
+            self._index(index, doc_id, event.new_image, fields)
+
+    async def _on_change(self, event) -> None:
+        self._apply(self.shops, self.products, event)
+        if self._replay is not None:
+            self._replay.append(event)
+
+    def _approved(self, shop_id: str) -> bool:
+        shop = self.shops.documents.get(shop_id)
+        return shop is not None and shop["status"] == "approved"
+
+    def search_shops(self, query: str, limit: Optional[int] = 20) -> List[Dict]:
+        """Approved shops matching the query, best first"""
+        results = self.shops.search(query, limit, accept=lambda shop: shop["status"] == "approved")
+        return [self._result(shop, score, "status") for shop, score in results]
+
+    def search_products(self, query: str, limit: Optional[int] = 20,
+                        shop_id: Optional[str] = None) -> List[Dict]:
+        """Active products of approved shops matching the query, best first"""
+        def accept(product: Dict) -> bool:
+            return (product["is_active"] and self._approved(product["shop_id"])
+                    and (shop_id is None or product["shop_id"] == shop_id))
+        results = self.products.search(query, limit, accept=accept)
+        return [self._result(product, score, "is_active") for product, score in results]
+
+    def _result(self, document: Dict, score: float, internal: str) -> Dict:
+        result = {k: v for k, v in document.items() if k not in (internal, "updated_at")}
+        result["score"] = round(score, 4)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "reloads": self.reloads, "shops": self.shops.stats(), "products": self.products.stats()}
+
+
+# Global instance
+catalog_search = CatalogSearch(db_service)
@@ -0,0 +1,202 @@
+"""
+Dashboard counters kept in the stats table
+
+Counters are kept per scope: ``global``, ``merchant#<id>`` and
+``shop#<id>``. Every write that changes a counted entity also ADDs its
+deltas to those scopes inside the same transaction, so dashboards read a
+few items instead of scanning tables. Concurrent transactions touching the
+same item conflict, so each scope is split over shard items
+(``<scope>#<n>``) that writers pick at random and readers sum: the global
+scope, touched by every write on the platform, over GLOBAL_SHARDS and the
+shop and merchant scopes, hit by checkout bursts, over SCOPE_SHARDS.
+
+Shop and product ratings are running aggregates of the same kind, kept on
+the shop and product items themselves (see DynamoDBService.create_review).
+
+Run ``python -m shared.database.stats`` to rebuild every counter and rating
+from the source tables (backfill, or repair after a manual data fix).
+"""
+import asyncio
+import random
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+
+GLOBAL = "global"
+GLOBAL_SHARDS = 8
+SCOPE_SHARDS = 4
+
+# Counters whose values are money rather than counts
+AMOUNT_COUNTERS = frozenset({"revenue"})
+
+
+def shop_key(shop_id: str) -> str:
+    return f"shop#{shop_id}"
+
+
+def merchant_key(merchant_id: str) -> str:
+    return f"merchant#{merchant_id}"
+
+
+def item_keys(scope: str) -> List[str]:
+    """Stats items that together hold a scope's counters"""
+    shards = GLOBAL_SHARDS if scope == GLOBAL else SCOPE_SHARDS
+    return [f"{scope}#{i}" for i in range(shards)]
+
+
+def write_key(scope: str) -> str:
+    """Stats item a single write should ADD its deltas to"""
+    return random.choice(item_keys(scope))
+
+
+def _value(status: Any) -> str:
+    return getattr(status, "value", status)
+
+
+def order_deltas(order: Dict, merchant_id: Optional[str], sign: int = 1) -> Dict[str, Dict[str, float]]:
+    """Counters an order contributes, per scope"""
+    counters = {"orders": sign, f"orders_{_value(order['status'])}": sign}
+    if _value(order["status"]) == "delivered":
+        counters["revenue"] = sign * order["total_amount"]
+
+    scopes = [GLOBAL, shop_key(order["shop_id"])]
+    if merchant_id:
+        scopes.append(merchant_key(merchant_id))
+    return {scope: dict(counters) for scope in scopes}
+
+
+def order_status_deltas(order: Dict, merchant_id: Optional[str], new_status: Any) -> Dict[str, Dict[str, float]]:
+    """Counters that move when an order changes status"""
+    removed = order_deltas(order, merchant_id, -1)
+    added = order_deltas({**order, "status": new_status}, merchant_id, 1)
+    return merge(removed, added)
+
+
+def shop_deltas(shop: Dict, sign: int = 1) -> Dict[str, Dict[str, float]]:
+    """Counters a shop contributes, per scope"""
+    counters = {"shops": sign, f"shops_{_value(shop['status'])}": sign}
+    return {GLOBAL: dict(counters), merchant_key(shop["merchant_id"]): dict(counters)}
+
+
+def shop_status_deltas(shop: Dict, new_status: Any) -> Dict[str, Dict[str, float]]:
+    """Counters that move when a shop changes status"""
+    return merge(shop_deltas(shop, -1), shop_deltas({**shop, "status": new_status}, 1))
+
+
+def user_deltas(sign: int = 1) -> Dict[str, Dict[str, float]]:
+    return {GLOBAL: {"users": sign}}
+
+
+def review_deltas(review: Dict, sign: int = 1) -> Dict[str, Dict[str, float]]:
+    """Counters a review contributes, per scope"""
+    counters = {"reviews": sign}
+    if not review.get("is_approved", True):
+        counters["reviews_pending"] = sign
+    deltas = {GLOBAL: dict(counters)}
+    if review.get("shop_id"):
+        deltas[shop_key(review["shop_id"])] = dict(counters)
+    return deltas
+
+
+def merge(*deltas: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Sum per-scope deltas, dropping counters that cancel out"""
+    merged: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    for delta in deltas:
+        for scope, counters in delta.items():
+            for name, value in counters.items():
+                merged[scope][name] += value
+    return {
+        scope: {name: value for name, value in counters.items() if value}
+        for scope, counters in merged.items()
+        if any(counters.values())
+    }
+
+
+def encode_counters(counters: Dict[str, float]) -> Dict[str, Decimal]:
+    """Counter values as DynamoDB numbers; amounts keep two decimals, counts are whole"""
+    return {
+        name: Decimal(str(round(value, 2))) if name in AMOUNT_COUNTERS else Decimal(int(value))
+        for name, value in counters.items()
+    }
+
+
+async def rebuild(db_service) -> int:
+    """Recompute every counter from the source tables and overwrite the stats items.
+
+    Writes that land while the scans run can be missed, so run this at a
+    quiet time. Returns the number of stats items written.
+    """
+    users, shops, orders, reviews, existing = await asyncio.gather(
+        db_service.get_all_users(["user_id"]),
+        db_service.get_all_shops(["shop_id", "merchant_id", "status"]),
+        db_service.get_all_orders(["shop_id", "status", "total_amount"]),
+        db_service.get_all_reviews(["shop_id", "is_approved"]),
+        db_service.get_all_stats(["stat_id"])
+    )
+    merchant_of = {shop["shop_id"]: shop["merchant_id"] for shop in shops}
+
+    deltas = [user_deltas() for _ in users]
+    deltas += [shop_deltas(shop) for shop in shops]
+    deltas += [order_deltas(order, merchant_of.get(order["shop_id"])) for order in orders]
+    deltas += [review_deltas(review) for review in reviews]
+    totals = merge(*deltas)
+    items: Dict[str, Dict[str, float]] = {}
+    for scope in {GLOBAL, *totals}:
+        first, *others = item_keys(scope)
+        items[first] = totals.get(scope, {})
+        items.update((key, {}) for key in others)
+    # Items of scopes whose entities are all gone (or of older layouts) are reset, not left stale
+    for item in existing:
+        items.setdefault(item["stat_id"], {})
+
+    await asyncio.gather(*(
+        db_service.put_stats(key, counters) for key, counters in items.items()
+    ))
+    return len(items)
+
+
+def empty_rating() -> Dict[str, int]:
+    return {"rating_sum": 0, "total_reviews": 0, **{f"rating_star_{star}": 0 for star in range(1, 6)}}
+
+
+def rating_aggregates(reviews: List[Dict], key_name: str) -> Dict[str, Dict[str, int]]:
+    """Rating sum, count and per-star counts of approved reviews, per shop or product"""
+    aggregates: Dict[str, Dict[str, int]] = {}
+    for review in reviews:
+        if not review.get(key_name) or not review.get("is_approved", True):
+            continue
+        totals = aggregates.setdefault(review[key_name], empty_rating())
+        totals["rating_sum"] += review["rating"]
+        totals["total_reviews"] += 1
+        totals[f"rating_star_{review['rating']}"] += 1
+    return aggregates
+
+
+async def rebuild_ratings(db_service) -> int:
+    """Recompute shop and product ratings from approved reviews; returns the number of items written"""
+    reviews, shops, products = await asyncio.gather(
+        db_service.get_all_reviews(["shop_id", "product_id", "rating", "is_approved"]),
+        db_service.get_all_shops(["shop_id", "total_reviews"]),
+        db_service.get_all_products(["product_id", "total_reviews"])
+    )
+    writes = []
+    for items, key_name, table in ((shops, "shop_id", db_service.shops_table),
+                                   (products, "product_id", db_service.products_table)):
+        aggregates = rating_aggregates(reviews, key_name)
+        for item in items:
+            # Items without approved reviews are only written when they still count some
+            if item[key_name] in aggregates or item.get("total_reviews"):
+                writes.append(db_service.set_rating_aggregates(
+                    table, {key_name: item[key_name]}, aggregates.get(item[key_name], empty_rating())
+                ))
+    await asyncio.gather(*writes)
+    return len(writes)
+
+
+if __name__ == "__main__":
+    from shared.database.dynamodb import db_service
+    written = asyncio.run(rebuild(db_service))
+    print(f"Rebuilt {written} stats items")
+    rated = asyncio.run(rebuild_ratings(db_service))
+    print(f"Rebuilt ratings of {rated} shops and products")
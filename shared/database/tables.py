@@ -0,0 +1,203 @@
+"""
+DynamoDB table definitions and bootstrap
+
+Run ``python -m shared.database.tables`` to create any missing tables and
+add any missing global secondary indexes to existing ones. Once every
+service runs code that no longer queries them, ``--drop-retired`` deletes
+the indexes listed under "retired_indexes". Tables marked "stream" get a
+NEW_AND_OLD_IMAGES stream that feeds the change feed (see events.py).
+"""
+import sys
+import time
+from typing import Dict, List
+
+
+# Every key attribute is a string unless listed here
+ATTRIBUTE_TYPES: Dict[str, str] = {}
+
+TABLE_DEFINITIONS: Dict[str, Dict] = {
+    "users": {
+        "key": "user_id",
+        "indexes": [],
+        "stream": True
+    },
+    "shops": {
+        "key": "shop_id",
+        "indexes": [
+            {"name": "merchant_id-index", "hash": "merchant_id"},
+            # Approved-shop listing queries one status partition, optionally
+            # narrowed to a category, instead of scanning the whole table
+            {"name": "status-category-index", "hash": "status", "range": "category"},
+            # Nearby search: ~39 x 20 km cells, full geohash sorted within them
+            {"name": "geohash4-geohash-index", "hash": "geohash4", "range": "geohash"}
+        ],
+        "stream": True
+    },
+    "products": {
+        "key": "product_id",
+        "indexes": [
+            {"name": "shop_id-index", "hash": "shop_id"}
+        ],
+        "stream": True
+    },
+    "orders": {
+        "key": "order_id",
+        "indexes": [
+            # Sorted by creation time so order history and "recent orders"
+            # read newest-first and stop after the rows they display
+            {"name": "customer_id-created_at-index", "hash": "customer_id", "range": "created_at"},
+            {"name": "shop_id-created_at-index", "hash": "shop_id", "range": "created_at"}
+        ],
+        "retired_indexes": ["customer_id-index", "shop_id-index"],
+        "stream": True
+    },
+    "reviews": {
+        "key": "review_id",
+        "indexes": [
+            {"name": "shop_id-created_at-index", "hash": "shop_id", "range": "created_at"},
+            {"name": "product_id-created_at-index", "hash": "product_id", "range": "created_at"}
+        ],
+        "stream": True
+    },
+    "addresses": {
+        "key": "address_id",
+        "indexes": [
+            {"name": "user_id-index", "hash": "user_id"}
+        ],
+        "stream": True
+    },
+    # Dashboard counters: "global", "merchant#<id>" and "shop#<id>"
+    "stats": {
+        "key": "stat_id",
+        "indexes": []
+    }
+}
+
+
+STREAM_SPECIFICATION = {"StreamEnabled": True, "StreamViewType": "NEW_AND_OLD_IMAGES"}
+
+
+def _attribute_definitions(names: List[str]) -> List[Dict]:
+    return [
+        {"AttributeName": name, "AttributeType": ATTRIBUTE_TYPES.get(name, "S")}
+        for name in dict.fromkeys(names)
+    ]
+
+
+def _index_spec(index: Dict) -> Dict:
+    key_schema = [{"AttributeName": index["hash"], "KeyType": "HASH"}]
+    if index.get("range"):
+        key_schema.append({"AttributeName": index["range"], "KeyType": "RANGE"})
+    return {
+        "IndexName": index["name"],
+        "KeySchema": key_schema,
+        "Projection": {"ProjectionType": "ALL"}
+    }
+
+
+def _index_attributes(index: Dict) -> List[str]:
+    return [index["hash"]] + ([index["range"]] if index.get("range") else [])
+
+
+def _wait_until_active(client, table_name: str) -> None:
+    """Block until the table and all of its indexes are ACTIVE"""
+    while True:
+        table = client.describe_table(TableName=table_name)["Table"]
+        statuses = [table["TableStatus"]]
+        statuses += [i["IndexStatus"] for i in table.get("GlobalSecondaryIndexes", [])]
+        if all(s == "ACTIVE" for s in statuses):
+            return
+        time.sleep(2)
+
+
+def create_table(client, table_name: str, definition: Dict) -> None:
+    """Create a table with all of its indexes"""
+    attributes = [definition["key"]]
+    for index in definition["indexes"]:
+        attributes += _index_attributes(index)
+
+    params = {
+        "TableName": table_name,
+        "KeySchema": [{"AttributeName": definition["key"], "KeyType": "HASH"}],
+        "AttributeDefinitions": _attribute_definitions(attributes),
+        "BillingMode": "PAY_PER_REQUEST"
+    }
+    if definition["indexes"]:
+        params["GlobalSecondaryIndexes"] = [_index_spec(i) for i in definition["indexes"]]
+    if definition.get("stream"):
+        params["StreamSpecification"] = STREAM_SPECIFICATION
+
+    client.create_table(**params)
+    _wait_until_active(client, table_name)
+
+
+def add_missing_indexes(client, table_name: str, definition: Dict) -> List[str]:
+    """Add indexes that exist in the definition but not on the table"""
+    table = client.describe_table(TableName=table_name)["Table"]
+    existing = {i["IndexName"] for i in table.get("GlobalSecondaryIndexes", [])}
+
+    added = []
+    for index in definition["indexes"]:
+        if index["name"] in existing:
+            continue
+        # DynamoDB only accepts one index creation per UpdateTable call
+        client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=_attribute_definitions(_index_attributes(index)),
+            GlobalSecondaryIndexUpdates=[{"Create": _index_spec(index)}]
+        )
+        _wait_until_active(client, table_name)
+        added.append(index["name"])
+    return added
+
+
+def enable_stream(client, table_name: str, definition: Dict) -> bool:
+    """Turn on the table's stream if the definition asks for one"""
+    if not definition.get("stream"):
+        return False
+    table = client.describe_table(TableName=table_name)["Table"]
+    if table.get("StreamSpecification", {}).get("StreamEnabled"):
+        return False
+    client.update_table(TableName=table_name, StreamSpecification=STREAM_SPECIFICATION)
+    _wait_until_active(client, table_name)
+    return True
+
+
+def drop_retired_indexes(client, table_name: str, definition: Dict) -> List[str]:
+    """Delete indexes that were replaced and are no longer queried"""
+    table = client.describe_table(TableName=table_name)["Table"]
+    existing = {i["IndexName"] for i in table.get("GlobalSecondaryIndexes", [])}
+
+    dropped = []
+    for index_name in definition.get("retired_indexes", []):
+        if index_name not in existing:
+            continue
+        client.update_table(
+            TableName=table_name,
+            GlobalSecondaryIndexUpdates=[{"Delete": {"IndexName": index_name}}]
+        )
+        _wait_until_active(client, table_name)
+        dropped.append(index_name)
+    return dropped
+
+
+def bootstrap(client, drop_retired: bool = False) -> None:
+    """Create missing tables, indexes and streams"""
+    existing_tables = set(client.list_tables()["TableNames"])
+    for table_name, definition in TABLE_DEFINITIONS.items():
+        if table_name not in existing_tables:
+            create_table(client, table_name, definition)
+            print(f"Created table {table_name}")
+        else:
+            for index_name in add_missing_indexes(client, table_name, definition):
+                print(f"Added index {index_name} to {table_name}")
+            if enable_stream(client, table_name, definition):
+                print(f"Enabled stream on {table_name}")
+            if drop_retired:
+                for index_name in drop_retired_indexes(client, table_name, definition):
+                    print(f"Dropped index {index_name} from {table_name}")
+
+
+if __name__ == "__main__":
+    from shared.database.dynamodb import db_service
+    bootstrap(db_service.dynamodb.meta.client, drop_retired="--drop-retired" in sys.argv)
@@ -0,0 +1,152 @@
+"""
+Coalescing write buffer for bulk puts
+
+Single puts handed to a WriteBuffer are grouped into BatchWriteItem calls of
+up to 25 items. A batch is sent as soon as it is full, or ``flush_interval``
+seconds after its first item arrived, so bulk flows (seeding, imports,
+migrations) pay one round trip per 25 items instead of one per item. Every
+put returns a future that resolves once DynamoDB has accepted that item.
+
+A second put of a key that is still waiting replaces the first one in the
+batch (BatchWriteItem rejects duplicate keys; the last write wins either
+way) and both callers are acknowledged together. A key that is part of a
+batch in flight is held back until that batch completes, so writes to one
+item land in the order they were made.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+BATCH_WRITE_MAX_ITEMS = 25
+
+
+class UnprocessedItemError(Exception):
+    """Raised on a put's future when DynamoDB kept leaving the item unprocessed"""
+
+
+class WriteBuffer:
+    """Coalesces puts to one table into BatchWriteItem calls"""
+
+    def __init__(self, table_name: str, key_name: str,
+                 send: Callable[[str, List[Dict]], Awaitable[List[Dict]]],
+                 max_batch: int = BATCH_WRITE_MAX_ITEMS, flush_interval: float = 0.02):
+        self.table_name = table_name
+        self.key_name = key_name
+        self._send = send
+        self.max_batch = min(max_batch, BATCH_WRITE_MAX_ITEMS)
+        self.flush_interval = flush_interval
+
+        # key -> (item, futures waiting on it), in arrival order
+        self._pending: Dict[Any, List] = {}
+        self._in_flight: set = set()
+        self._batches: set = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.puts = 0
+        self.coalesced = 0
+        self.batches_sent = 0
+        self.items_written = 0
+        self.failed = 0
+
+    def put(self, item: Dict) -> asyncio.Future:
+        """Queue an encoded item; the future resolves when it has been written"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = item[self.key_name]
+        self.puts += 1
+
+        entry = self._pending.get(key)
+        if entry is not None:
+            entry[0] = item
+            entry[1].append(future)
+            self.coalesced += 1
+        else:
+            self._pending[key] = [item, [future]]
+
+        if self._ready() >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_now)
+        return future
+
+    def _ready(self) -> int:
+        return sum(1 for key in self._pending if key not in self._in_flight)
+
+    def _flush_now(self) -> None:
+        """Send every full batch and whatever is left over"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                break
+            task = loop.create_task(self._write(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+        if self._pending and self._timer is None and not self._batches:
+            self._timer = loop.call_later(self.flush_interval, self._flush_now)
+
+    def _take_batch(self) -> Dict[Any, List]:
+        batch = {}
+        for key in list(self._pending):
+            if key in self._in_flight:
+                continue
+            batch[key] = self._pending.pop(key)
+            self._in_flight.add(key)
+            if len(batch) == self.max_batch:
+                break
+        return batch
+
+    async def _write(self, batch: Dict[Any, List]) -> None:
+        requests = [{'PutRequest': {'Item': item}} for item, _ in batch.values()]
+        try:
+            unprocessed = await self._send(self.table_name, requests)
+            left = {request['PutRequest']['Item'][self.key_name] for request in unprocessed}
+            error = None
+        except Exception as e:
+            left = set(batch)
+            error = e
+        finally:
+            self._in_flight.difference_update(batch)
+        self.batches_sent += 1
+
+        for key, (_, futures) in batch.items():
+            if key in left:
+                self.failed += 1
+                exception = error or UnprocessedItemError(
+                    f"BatchWriteItem on {self.table_name} left {key!r} unprocessed"
+                )
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exception)
+            else:
+                self.items_written += 1
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+
+        # Keys held back while this batch was in flight can go now
+        if self._pending and self._timer is None:
+            self._flush_now()
+
+    async def flush(self) -> None:
+        """Send everything queued so far and wait for all batches to finish"""
+        while self._pending or self._batches:
+            self._flush_now()
+            if self._batches:
+                await asyncio.gather(*self._batches, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "puts": self.puts,
+            "coalesced": self.coalesced,
+            "batches": self.batches_sent,
+            "items_written": self.items_written,
+            "avg_batch_size": round(self.items_written / self.batches_sent, 2) if self.batches_sent else 0.0,
+            "failed": self.failed,
+            "pending": len(self._pending)
+        }
@@ -0,0 +1,92 @@
+"""
+Invalidation of responses cached by the API gateway
+
+The gateway caches public shop and product reads (see api_gateway/cache.py).
+Every backend follows shop and product changes on the change feed and
+posts the affected paths to each gateway in GATEWAY_URLS, batching the
+changes of GATEWAY_INVALIDATE_MS into one call. With no gateway configured
+nothing is sent and cached responses only age out.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Optional, Set
+
+import httpx
+
+from shared.database.dynamodb import db_service
+
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayCacheInvalidator:
+    """Posts the gateway paths whose responses a shop or product change made stale"""
+
+    def __init__(self, db_service):
+        self.db_service = db_service
+        self.gateway_urls = [url.strip().rstrip("/") for url in os.getenv("GATEWAY_URLS", "").split(",") if url.strip()]
+        self.token = os.getenv("GATEWAY_CACHE_TOKEN")
+        self.delay = float(os.getenv("GATEWAY_INVALIDATE_MS", "50")) / 1000
+        self._paths: Set[str] = set()
+        self._prefixes: Set[str] = set()
+        self._flush: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.sent = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        if not self.gateway_urls or self._client is not None:
+            return
+        headers = {"X-Cache-Token": self.token} if self.token else {}
+        self._client = httpx.AsyncClient(headers=headers, timeout=5.0)
+        self.db_service.change_feed.subscribe(
+            self._on_change, tables=[self.db_service.shops_table, self.db_service.products_table], images=True
+        )
+
+    async def stop(self) -> None:
+        if self._flush is not None:
+            await self._flush
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _on_change(self, event) -> None:
+        if self._client is None:
+            return
+        image = event.new_image or event.old_image or {}
+        if event.table == self.db_service.shops_table:
+            shop_id = event.keys["shop_id"]
+            # Listings and ratings show every shop; its products are hidden with it
+            self._paths.update(["/shops", f"/shops/{shop_id}", f"/shops/{shop_id}/products"])
+        else:
+            self._paths.add(f"/products/{event.keys['product_id']}")
+            if image.get("shop_id"):
+                self._paths.add(f"/shops/{image['shop_id']}/products")
+            else:
+                self._prefixes.add("/shops/")
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_task(self._send())
+
+    async def _send(self) -> None:
+        await asyncio.sleep(self.delay)
+        body = {"paths": sorted(self._paths), "prefixes": sorted(self._prefixes)}
+        self._paths, self._prefixes, self._flush = set(), set(), None
+        results = await asyncio.gather(*(
+            self._client.post(f"{url}/cache/invalidate", json=body) for url in self.gateway_urls
+        ), return_exceptions=True)
+        for url, result in zip(self.gateway_urls, results):
+            if isinstance(result, Exception) or result.status_code != 200:
+                self.failed += 1
+                detail = str(result) if isinstance(result, Exception) else f"HTTP {result.status_code}"
+                logger.error(f"Gateway cache invalidation at {url} failed: {detail}")
+            else:
+                self.sent += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {"gateways": len(self.gateway_urls), "sent": self.sent, "failed": self.failed}
+
+
+# Global instance
+gateway_invalidator = GatewayCacheInvalidator(db_service)
@@ -42,10 +42,16 @@ class BaseUser(BaseModel):
     profile_image: Optional[str] = Field(None, description="Profile image URL")
     phone: Optional[str] = Field(None, description="Phone number")
     is_active: bool = Field(True, description="Account status")
+    default_address_id: Optional[str] = Field(None, description="Default delivery address")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+# Profile fields a user may change through PUT /profile; role, status, identity
+# and the default address have their own (server-side) paths
+PROFILE_FIELDS = frozenset({"name", "profile_image", "phone"})
+
+
 class Address(BaseModel):
     address_id: str = Field(..., description="Unique address ID")
     user_id: str = Field(..., description="User who owns this address")
@@ -143,6 +149,7 @@ class Order(BaseModel):
     status: OrderStatus = Field(OrderStatus.PENDING, description="Order status")
     delivery_type: DeliveryType = Field(..., description="Delivery or pickup")
     delivery_address: Optional[str] = Field(None, description="Delivery address")
+    address_id: Optional[str] = Field(None, description="Saved address the order is delivered to")
     customer_notes: Optional[str] = Field(None, description="Customer notes")
     merchant_notes: Optional[str] = Field(None, description="Merchant notes")
     estimated_delivery: Optional[datetime] = Field(None, description="Estimated delivery time")
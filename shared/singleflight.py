@@ -0,0 +1,139 @@
+"""
+Request coalescing ("single flight")
+
+Concurrent calls for the same key share one execution: the first caller
+starts it and every caller arriving before it finishes awaits the same
+result or exception, so a burst of identical reads costs one upstream call.
+Nothing is kept once the call completes; this is not a cache, and a read
+can at most miss a write made while the shared call was already running.
+
+The shared call runs as its own task, so a caller that goes away (a client
+disconnect cancelling its request) does not cancel it for the others.
+Once a call has been shared, each caller gets its own deep copy of the
+result, as cached reads return copies, so no caller can change what
+another one sees.
+
+Use SingleFlight.do directly (the gateway does, for cache fills) or the
+``coalesce`` decorator on async methods (DynamoDBService reads).
+"""
+import asyncio
+import copy
+import functools
+import inspect
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from shared.database.metrics import partition_label
+
+
+# Keys with the most saved calls reported per group
+TOP_KEYS = 10
+
+_groups: List["SingleFlight"] = []
+
+
+class _Flight:
+    __slots__ = ("task", "joined")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.joined = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with equal keys into one execution"""
+
+    def __init__(self, name: str, max_tracked_keys: int = 1000):
+        self.name = name
+        self.max_tracked_keys = max_tracked_keys
+        self._flights: Dict[Hashable, _Flight] = {}
+
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        # caller-given label (never argument values) -> calls answered by another caller's execution
+        self._saved: Counter = Counter()
+        _groups.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], label: Optional[str] = None,
+                 share: Optional[Callable[[Any], Any]] = copy.deepcopy) -> Any:
+        """Result of fn(), shared with concurrent calls of the same key"""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+            self.executions += 1
+            result = await asyncio.shield(flight.task)
+            # When others joined, the original is left untouched for their copies
+            return share(result) if flight.joined and share is not None else result
+
+        flight.joined += 1
+        self.coalesced += 1
+        if label is not None:
+            self._saved[label] += 1
+        if len(self._saved) > self.max_tracked_keys:
+            self._saved = Counter(dict(self._saved.most_common(self.max_tracked_keys // 2)))
+        result = await asyncio.shield(flight.task)
+        return share(result) if share is not None else result
+
+    def _land(self, key: Hashable, flight: _Flight) -> None:
+        # Runs before any caller resumes, so nobody joins a finished flight
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Every caller may have gone away; the outcome must still count as retrieved
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+            "saved_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "top_keys": dict(self._saved.most_common(TOP_KEYS))
+        }
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable stand-in for call arguments (lists and dicts included)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+def coalesce(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Share concurrent calls of an async function or method with equal arguments"""
+    group = SingleFlight(fn.__qualname__)
+    signature = inspect.signature(fn)
+    parameters = list(signature.parameters)
+    is_method = bool(parameters) and parameters[0] == "self"
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        # Bind defaults so get_shop(id) and get_shop(id, None) share a flight
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = list(bound.arguments.items())
+        owner = arguments.pop(0)[1] if is_method else None
+        try:
+            frozen = _freeze(arguments)
+            key = (id(owner), frozen)
+            hash(key)
+        except TypeError:
+            return await fn(*args, **kwargs)
+        # Arguments (user IDs, ...) are reported hashed, as hot partitions are
+        return await group.do(key, lambda: fn(*args, **kwargs), label=partition_label(frozen))
+
+    wrapper.singleflight = group
+    return wrapper
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Counters of every coalescing group in this process"""
+    return {group.name: group.stats() for group in _groups}
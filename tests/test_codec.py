@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import ConditionExpressionBuilder, Key
+
+from shared.database.codec import ModelCodec, encode_value
+from shared.database.dynamodb import db_service
+from shared.models.base import Order
+
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def test_aware_datetimes_are_stored_as_naive_utc():
+    codec = ModelCodec(Order)
+    aware = datetime(2026, 1, 1, 10, 0, tzinfo=IST)
+
+    assert codec.encode_field("created_at", aware) == "2026-01-01T04:30:00"
+    assert encode_value(aware) == "2026-01-01T04:30:00"
+    assert codec.encode_field("created_at", datetime(2026, 1, 1, 4, 30)) == "2026-01-01T04:30:00"
+
+
+def test_encoded_datetimes_decode_back_unchanged():
+    codec = ModelCodec(Order)
+    encoded = codec.encode_field("created_at", datetime(2026, 1, 1, 10, 0, tzinfo=IST))
+
+    assert codec.decode({"created_at": encoded})["created_at"] == datetime(2026, 1, 1, 4, 30)
+
+
+def test_order_range_with_aware_since_matches_stored_keys():
+    params = db_service._orders_by_time(
+        "customer_id-created_at-index", Key("customer_id").eq("c1"),
+        since=datetime(2026, 1, 1, 10, 0, tzinfo=IST), until=None, attributes=None
+    )
+    expression = ConditionExpressionBuilder().build_expression(params["KeyConditionExpression"], is_key_condition=True)
+
+    assert "2026-01-01T04:30:00" in expression.attribute_value_placeholders.values()
@@ -0,0 +1,111 @@
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+from customer_api.main import app
+from shared.database import geo
+
+
+BEARINGS = range(0, 360, 5)
+
+
+def destination(lat, lng, km, bearing):
+    """Point `km` away from (lat, lng) along a great circle, longitude wrapped to [-180, 180)"""
+    angle = km / geo.EARTH_RADIUS_KM
+    phi, theta = math.radians(lat), math.radians(bearing)
+    phi2 = math.asin(math.sin(phi) * math.cos(angle) + math.cos(phi) * math.sin(angle) * math.cos(theta))
+    lambda2 = math.radians(lng) + math.atan2(math.sin(theta) * math.sin(angle) * math.cos(phi),
+                                             math.cos(angle) - math.sin(phi) * math.sin(phi2))
+    return math.degrees(phi2), (math.degrees(lambda2) + 180) % 360 - 180
+
+
+def uncovered(lat, lng, radius_km):
+    """Points of the circle (edge and inner rings) whose geohash is outside every covering cell"""
+    cells = set(geo.covering_cells(lat, lng, radius_km))
+    precision, = {len(cell) for cell in cells}
+    points = [(lat, lng)] + [destination(lat, lng, radius_km * fraction, bearing)
+                             for fraction in (0.25, 0.5, 0.75, 0.999) for bearing in BEARINGS]
+    return [point for point in points if geo.encode(*point, precision) not in cells]
+
+
+def test_destination_helper_keeps_the_distance():
+    lat, lng = destination(31.1, 77.17, 12.0, 40)
+
+    assert geo.distance_km(31.1, 77.17, lat, lng) == pytest.approx(12.0)
+
+
+@pytest.mark.parametrize("radius_km", [0.2, 1.0, 5.0, 20.0])
+def test_circles_around_a_city_are_covered(radius_km):
+    assert uncovered(31.1048, 77.1734, radius_km) == []
+
+
+@pytest.mark.parametrize("precision", [4, 5, 6, 7])
+def test_circles_centred_on_cell_edges_reach_the_neighbouring_cells(precision):
+    lat_step, lng_step = geo.cell_size(precision)
+    # A corner shared by four cells near Shimla
+    lat = math.floor((31.1 + 90) / lat_step) * lat_step - 90
+    lng = math.floor((77.17 + 180) / lng_step) * lng_step - 180
+    radius_km = lat_step * 111 / 4
+
+    cells = geo.covering_cells(lat, lng, radius_km)
+
+    assert uncovered(lat, lng, radius_km) == []
+    assert len({geo.encode(lat + dlat, lng + dlng, precision) for dlat in (-1e-9, 1e-9)
+                for dlng in (-1e-9, 1e-9)}) == 4
+    assert len(cells) >= 4
+
+
+@pytest.mark.parametrize("lat", [89.99, 89.7, 89.0, -89.99, -89.7, -89.0])
+@pytest.mark.parametrize("lng", [0.0, 77.17, 179.99])
+def test_circles_near_the_poles_are_covered(lat, lng):
+    assert uncovered(lat, lng, 50.0) == []
+
+
+@pytest.mark.parametrize("lat", [80.0, 85.0, -85.0])
+def test_high_latitude_circles_are_covered_at_their_widest(lat):
+    assert uncovered(lat, 10.0, geo.MAX_RADIUS_KM) == []
+
+
+@pytest.mark.parametrize("lng", [179.999, -179.999, 180.0, -180.0])
+@pytest.mark.parametrize("radius_km", [0.5, 10.0, 50.0])
+def test_circles_across_the_antimeridian_are_covered(lng, radius_km):
+    assert uncovered(-16.5, lng, radius_km) == []
+
+
+def test_antimeridian_cells_come_from_both_sides():
+    cells = geo.covering_cells(-16.5, 179.999, 10.0)
+    west = geo.encode(-16.5, 179.99, geo.PARTITION_PRECISION)
+    east = geo.encode(-16.5, -179.99, geo.PARTITION_PRECISION)
+
+    assert any(cell.startswith(west) for cell in cells)
+    assert any(cell.startswith(east) for cell in cells)
+
+
+@pytest.mark.parametrize("lat, lng", [(31.1048, 77.1734), (0.0, 0.0), (60.0, -179.9), (89.5, 20.0)])
+def test_max_radius_stays_within_partition_queries(lat, lng):
+    cells = geo.covering_cells(lat, lng, geo.MAX_RADIUS_KM)
+
+    assert uncovered(lat, lng, geo.MAX_RADIUS_KM) == []
+    assert all(geo.PARTITION_PRECISION <= len(cell) <= geo.PRECISION for cell in cells)
+    assert len(cells) == len(set(cells))
+
+
+def test_small_radius_uses_finer_cells_but_few_queries():
+    cells = geo.covering_cells(31.1048, 77.1734, 0.5)
+
+    assert len(cells[0]) > geo.PARTITION_PRECISION
+    assert len(cells) <= geo.MAX_COVERING_CELLS
+
+
+@pytest.mark.parametrize("radius", [geo.MAX_RADIUS_KM + 0.1, 0, -1])
+def test_shop_search_rejects_radius_out_of_bounds(radius):
+    response = TestClient(app).get("/shops", params={"near": "31.1,77.17", "radius": radius})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("near", ["91,0", "0,181", "31.1", "a,b"])
+def test_parse_point_rejects_bad_points(near):
+    with pytest.raises(ValueError):
+        geo.parse_point(near)
@@ -0,0 +1,111 @@
+import pytest
+
+from api_gateway.main import ROUTES
+from api_gateway.routing import Route, RouteNotFound, RouteTable
+
+
+table = RouteTable(ROUTES, default="customer")
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("GET", "/shops/pending", ("admin", "GET /shops/pending")),
+    ("GET", "/shops/s1", ("customer", "GET /shops/{shop_id}")),
+    ("GET", "/shops/s1/products", ("customer", "GET /shops/{shop_id}/products")),
+    ("POST", "/shops/s1/products", ("merchant", "POST /shops/{shop_id}/products")),
+    ("PUT", "/shops/s1/status", ("merchant", "PUT /shops/{shop_id}/status")),
+    ("PUT", "/shops/s1/approval", ("admin", "PUT /shops/{shop_id}/approval")),
+    ("PUT", "/users/u1/role", ("admin", "PUT /users/{user_id}/role")),
+    ("DELETE", "/addresses/a1", ("customer", "DELETE /addresses/{address_id}")),
+    ("PUT", "/addresses/a1/default", ("customer", "PUT /addresses/{address_id}/default")),
+])
+def test_unhinted_requests_match_the_most_specific_route(method, path, expected):
+    route = table.resolve(method, path, {})
+
+    assert (route.service, route.route) == expected
+    assert route.path == path
+
+
+def test_literal_segments_win_over_parameters_at_any_depth():
+    routes = {"a": ["GET /shops/{shop_id}/reviews"], "b": ["GET /shops/featured", "GET /shops/featured/top"]}
+    local = RouteTable(routes, default="a")
+
+    assert local.resolve("GET", "/shops/featured/top", {}).route == "GET /shops/featured/top"
+    assert local.resolve("GET", "/shops/featured", {}).route == "GET /shops/featured"
+    # The literal branch dead-ends here, so the lookup backtracks into the parameter
+    assert local.resolve("GET", "/shops/featured/reviews", {}) == Route("a", "/shops/featured/reviews",
+                                                                         "GET /shops/{shop_id}/reviews")
+
+
+def test_parameters_match_exactly_one_segment():
+    assert table.resolve("GET", "/shops/s1/products/extra", {}).route is None
+    assert table.resolve("GET", "/products", {}).route is None
+
+
+def test_routes_are_method_aware():
+    assert table.match("GET", "/shops/s1") == "customer"
+    assert table.match("PUT", "/shops/s1") == "merchant"
+    assert table.match("put", "/orders/o1/status") == "merchant"
+
+
+def test_path_served_under_another_method_goes_to_its_owner():
+    assert table.resolve("DELETE", "/users/u1", {}) == Route("admin", "/users/u1", None)
+
+
+def test_unknown_paths_go_to_the_default_app():
+    assert table.resolve("GET", "/nowhere/at/all", {}) == Route("customer", "/nowhere/at/all", None)
+
+
+def test_empty_segments_and_trailing_slashes_are_ignored_when_matching():
+    assert table.resolve("GET", "/shops/", {}).route == "GET /shops"
+    assert table.resolve("GET", "//shops//s1", {}).route == "GET /shops/{shop_id}"
+
+
+@pytest.mark.parametrize("path, service", [("/dashboard", "merchant"), ("/profile", "customer"),
+                                           ("/orders", "customer")])
+def test_shared_paths_without_hint_go_to_the_first_listed_app(path, service):
+    assert table.resolve("GET", path, {}) == Route(service, path, f"GET {path}")
+
+
+@pytest.mark.parametrize("service", ["customer", "merchant", "admin"])
+@pytest.mark.parametrize("path", ["/profile", "/auth/google"])
+def test_prefix_hint_picks_the_app_and_is_stripped(service, path):
+    method = "POST" if path == "/auth/google" else "GET"
+
+    assert table.resolve(method, f"/api/{service}{path}", {}) == Route(service, path, f"{method} {path}")
+
+
+def test_prefix_hint_keeps_the_trailing_slash():
+    assert table.resolve("GET", "/api/admin/orders/", {}) == Route("admin", "/orders/", "GET /orders")
+
+
+@pytest.mark.parametrize("path", ["/dashboard", "/profile", "/orders"])
+def test_header_hint_picks_the_app(path):
+    assert table.resolve("GET", path, {"x-service": "admin"}) == Route("admin", path, f"GET {path}")
+
+
+@pytest.mark.parametrize("host", ["admin", "admin-api", "admin.shimlamarket.in", "admin-api.local:8000"])
+def test_host_hint_picks_the_app(host):
+    assert table.resolve("GET", "/dashboard", {"host": host}) == Route("admin", "/dashboard", "GET /dashboard")
+
+
+def test_unknown_host_falls_back_to_the_trie():
+    assert table.resolve("GET", "/dashboard", {"host": "localhost:8000"}).service == "merchant"
+
+
+def test_hints_are_checked_prefix_then_header_then_host():
+    headers = {"x-service": "merchant", "host": "admin-api.local"}
+
+    assert table.resolve("GET", "/api/customer/orders", headers).service == "customer"
+    assert table.resolve("GET", "/orders", headers).service == "merchant"
+    assert table.resolve("GET", "/orders", {"host": "admin-api.local"}).service == "admin"
+
+
+def test_hinted_app_without_the_route_still_gets_the_request():
+    assert table.resolve("GET", "/dashboard", {"x-service": "customer"}) == Route("customer", "/dashboard", None)
+    assert table.resolve("GET", "/api/customer/dashboard", {}) == Route("customer", "/dashboard", None)
+
+
+@pytest.mark.parametrize("path, headers", [("/api/billing/orders", {}), ("/orders", {"x-service": "billing"})])
+def test_unknown_app_hints_are_rejected(path, headers):
+    with pytest.raises(RouteNotFound):
+        table.resolve("GET", path, headers)